@@ -18,6 +18,14 @@ def create_app(config_class=None):
     if app.config.get('SQLALCHEMY_DATABASE_URI', '').startswith('sqlite'):
         app.config.pop('SQLALCHEMY_ENGINE_OPTIONS', None)
     db.init_app(app)
+    from backend.events.platform_summary_events import register_platform_summary_events
+    register_platform_summary_events()
+    from backend.events.referral_events import register_referral_events
+    register_referral_events()
+    from backend.events.commission_ledger_events import register_commission_ledger_events
+    register_commission_ledger_events()
+    from backend.events.downline_stats_events import register_downline_stats_events
+    register_downline_stats_events()
     jwt.init_app(app)
     socketio.init_app(app, async_mode="eventlet")
     limiter.init_app(app)
@@ -35,6 +43,8 @@ def create_app(config_class=None):
     babel.init_app(app, locale_selector=get_locale)    # 初始化數據庫遷移
     from flask_migrate import Migrate
     migrate = Migrate(app, db)
+    from backend.commands import register_commands
+    register_commands(app)
 
     if not app.config.get('TESTING', False):
         # ...existing code...
@@ -0,0 +1,153 @@
+"""
+下線查詢效能測試
+
+建立合成推薦樹（預設 100 萬位用戶、10 層），以 ReferralService.rebuild 建立推薦閉包表、
+DownlineStatsService.rebuild 建立下線統計，再量測 DownlineQueryService 對不同層級節點的
+分層彙總、分頁明細與子團隊查詢時間。
+
+用法：
+    python -m backend.benchmarks.downline_query_benchmark --users 1000000 --depth 10
+    BENCHMARK_DATABASE_URL=postgresql://... python -m backend.benchmarks.downline_query_benchmark
+"""
+import argparse
+import os
+import random
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import insert
+from backend.app import create_app
+from backend.config import TestingConfig
+from backend.extensions import db
+from backend.models.user import User
+from backend.models.product import Product
+from backend.models.order import Order
+from backend.models.refund import Refund
+from backend.models.downline_stats import DownlineStats
+from backend.models.referral_closure import ReferralClosure
+from backend.models.logistics_company import LogisticsCompany
+from backend.models.recipient import Recipient
+from backend.models.settlement import SettlementRun
+
+INSERT_CHUNK_SIZE = 20000
+
+
+class BenchmarkConfig(TestingConfig):
+    SQLALCHEMY_DATABASE_URI = os.getenv('BENCHMARK_DATABASE_URL', 'sqlite:///:memory:')
+
+
+def level_sizes(user_count, depth):
+    """各層人數：第 0 層 1 人，其餘依等比成長使總數等於 user_count"""
+    low, high = 1.0, float(user_count)
+    for _ in range(100):
+        ratio = (low + high) / 2
+        if sum(ratio ** level for level in range(depth + 1)) < user_count:
+            low = ratio
+        else:
+            high = ratio
+    sizes = [max(1, round(low ** level)) for level in range(depth + 1)]
+    sizes[-1] += user_count - sum(sizes)
+    return sizes
+
+
+def build_dataset(user_count, depth, buyer_ratio=0.3, seed=42):
+    """
+    建立推薦樹與已完成訂單
+    :return: 各層的用戶 ID 區間 [(first_id, last_id), ...]
+    """
+    rng = random.Random(seed)
+    now = datetime.utcnow()
+    db.session.execute(insert(Product), [{
+        'id': 1, 'supplier_id': '1', 'name': 'bench', 'cost': 70, 'price': 100, 'source': 'bench',
+        'description': 'bench', 'image_url': 'bench.png', 'on_shelf_date': now,
+        'off_shelf_date': now + timedelta(days=30)
+    }])
+
+    levels = []
+    next_id = 1
+    for size in level_sizes(user_count, depth):
+        parents = levels[-1] if levels else None
+        first_id = next_id
+        for start in range(first_id, first_id + size, INSERT_CHUNK_SIZE):
+            db.session.execute(insert(User), [{
+                'id': user_id,
+                'username': f'user{user_id}',
+                'email': f'user{user_id}@bench.local',
+                'group_mom_level': rng.choice((0, 0, 0, 1, 2, 3)),
+                'referrer_id': rng.randint(*parents) if parents else None
+            } for user_id in range(start, min(start + INSERT_CHUNK_SIZE, first_id + size))])
+        next_id += size
+        levels.append((first_id, next_id - 1))
+
+    order_id = 0
+    buyers = [user_id for user_id in range(2, next_id) if rng.random() < buyer_ratio]
+    for start in range(0, len(buyers), INSERT_CHUNK_SIZE):
+        rows = []
+        for buyer_id in buyers[start:start + INSERT_CHUNK_SIZE]:
+            order_id += 1
+            rows.append({
+                'id': order_id,
+                'user_id': buyer_id,
+                'product_id': 1,
+                'quantity': 1,
+                'total_price': float(rng.choice((100, 250, 999))),
+                'cost': 70.0,
+                'status': 'completed',
+                'created_at': now - timedelta(days=rng.randint(1, 180))
+            })
+        db.session.execute(insert(Order), rows)
+    db.session.commit()
+    return levels
+
+
+def timed(label, fn, *args, **kwargs):
+    started = time.perf_counter()
+    result = fn(*args, **kwargs)
+    print(f'  {label}：{(time.perf_counter() - started) * 1000:,.1f} ms')
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='下線查詢效能測試')
+    parser.add_argument('--users', type=int, default=1000000, help='合成用戶數量')
+    parser.add_argument('--depth', type=int, default=10, help='推薦樹層數')
+    parser.add_argument('--workers', type=int, default=1, help='下線統計重建平行連線數（SQLite 記憶體資料庫請用 1）')
+    args = parser.parse_args()
+
+    app = create_app(BenchmarkConfig)
+    with app.app_context():
+        from backend.services.downline_query_service import DownlineQueryService
+        from backend.services.downline_stats_service import DownlineStatsService
+        from backend.services.referral_service import ReferralService
+        for model in (User, ReferralClosure, LogisticsCompany, Recipient, SettlementRun, Product, Order, Refund,
+                      DownlineStats):
+            model.__table__.create(db.engine, checkfirst=True)
+
+        started = time.perf_counter()
+        levels = build_dataset(args.users, args.depth)
+        print(f'建立 {args.users} 位用戶、{len(levels) - 1} 層推薦樹：{time.perf_counter() - started:.2f}s')
+
+        started = time.perf_counter()
+        ReferralService.rebuild()
+        db.session.commit()
+        closure_rows = ReferralClosure.query.count()
+        print(f'重建推薦閉包表 {closure_rows} 列：{time.perf_counter() - started:.2f}s')
+
+        result = DownlineStatsService.rebuild(max_workers=args.workers)
+        print(f"重建下線統計 {result['rows']} 列：{result['elapsed_seconds']:.2f}s")
+
+        for level in (0, 1, 3, 6):
+            if level >= len(levels) - 1:
+                continue
+            user_id = levels[level][0]
+            print(f'第 {level} 層用戶 {user_id}：')
+            summary = timed('分層彙總', DownlineQueryService.get_level_summary, user_id)
+            timed('第 1 頁明細', DownlineQueryService.get_downlines, user_id, page=1, per_page=50)
+            timed('第 100 頁明細', DownlineQueryService.get_downlines, user_id, page=100, per_page=50)
+            timed('前 3 層明細', DownlineQueryService.get_downlines, user_id, max_depth=3, per_page=50)
+            timed('子團隊排行', DownlineQueryService.get_subteams, user_id, per_page=20)
+            print(f"  下線 {sum(row['member_count'] for row in summary):,} 人，"
+                  f"消費 {sum(row['total_spent'] for row in summary):,.0f}")
+
+
+if __name__ == '__main__':
+    main()
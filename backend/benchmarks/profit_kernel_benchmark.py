@@ -0,0 +1,55 @@
+"""
+分潤定點數核心效能測試
+
+以合成訂單比較 calculate_order_breakdown 整數定點路徑、Decimal 路徑與向量化
+calculate_order_profits_batch 的每秒處理筆數，並確認三者結果一致。
+
+用法：
+    python -m backend.benchmarks.profit_kernel_benchmark --orders 200000
+"""
+import argparse
+import time
+from backend.benchmarks.profit_recompute_benchmark import build_rows
+from backend.utils.profit_calculator import ProfitCalculator
+
+
+def run(rows, calculate):
+    started = time.perf_counter()
+    results = [
+        calculate(total_price, cost, has_big, has_middle, has_small, has_referrer)
+        for _, total_price, cost, has_big, has_middle, has_small, has_referrer, _ in rows
+    ]
+    return results, time.perf_counter() - started
+
+
+def run_batch(rows):
+    _, total_prices, costs, has_big, has_middle, has_small, has_referrer, _ = zip(*rows)
+    started = time.perf_counter()
+    batch = ProfitCalculator.calculate_order_profits_batch(
+        total_prices, costs, has_big, has_middle, has_small, has_referrer
+    )
+    elapsed = time.perf_counter() - started
+    keys = list(batch)
+    return [dict(zip(keys, values)) for values in zip(*(batch[key].tolist() for key in keys))], elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='分潤定點數核心效能測試')
+    parser.add_argument('--orders', type=int, default=200000, help='合成訂單數量')
+    args = parser.parse_args()
+
+    rows = build_rows(args.orders)
+    fixed, fixed_elapsed = run(rows, ProfitCalculator.calculate_order_breakdown)
+    decimal, decimal_elapsed = run(rows, ProfitCalculator._calculate_order_breakdown_decimal)
+    batch, batch_elapsed = run_batch(rows)
+
+    print(f'Decimal：{len(rows)} 筆 {decimal_elapsed:.2f}s，{len(rows) / decimal_elapsed:,.0f} 筆/秒')
+    print(f'定點數：{len(rows)} 筆 {fixed_elapsed:.2f}s，{len(rows) / fixed_elapsed:,.0f} 筆/秒，'
+          f'加速 {decimal_elapsed / fixed_elapsed:.2f}x')
+    print(f'向量化：{len(rows)} 筆 {batch_elapsed:.2f}s，{len(rows) / batch_elapsed:,.0f} 筆/秒，'
+          f'加速 {decimal_elapsed / batch_elapsed:.2f}x')
+    print(f"結果一致：{'是' if fixed == decimal == batch else '否'}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""
+分潤重算平行化效能測試
+
+以合成訂單數值量測 _recompute_profit_chunk 在不同程序數下的處理量，觀察隨核心數的擴展情形。
+
+用法：
+    python -m backend.benchmarks.profit_recompute_benchmark --orders 200000 --workers 1 2 4 8
+"""
+import argparse
+import concurrent.futures
+import os
+import random
+import time
+from backend.services.settlement_optimization_service import _recompute_profit_chunk
+from backend.utils.profit_rules import ProfitRuleEngine
+
+
+def build_rows(order_count, seed=42):
+    rng = random.Random(seed)
+    rows = []
+    for order_id in range(1, order_count + 1):
+        cost = rng.randint(50, 5000)
+        rows.append((
+            order_id,
+            round(cost * rng.uniform(1.2, 2.0)),
+            cost,
+            rng.random() < 0.7,
+            rng.random() < 0.6,
+            rng.random() < 0.9,
+            rng.random() < 0.5,
+            ProfitRuleEngine.current_version()
+        ))
+    return rows
+
+
+def run(rows, workers, batch_size):
+    batches = [rows[i:i + batch_size] for i in range(0, len(rows), batch_size)]
+    started = time.perf_counter()
+    if workers == 1:
+        processed = sum(len(_recompute_profit_chunk(batch)) for batch in batches)
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+            processed = sum(len(chunk) for chunk in executor.map(_recompute_profit_chunk, batches))
+    return processed, time.perf_counter() - started
+
+
+def main():
+    cpu_count = os.cpu_count() or 1
+    parser = argparse.ArgumentParser(description='分潤重算平行化效能測試')
+    parser.add_argument('--orders', type=int, default=200000, help='合成訂單數量')
+    parser.add_argument('--batch-size', type=int, default=1000, help='每個子程序任務的訂單數')
+    parser.add_argument('--workers', type=int, nargs='+',
+                        default=sorted({1, 2, 4, cpu_count}), help='測試的程序數')
+    args = parser.parse_args()
+
+    rows = build_rows(args.orders)
+    baseline = None
+    for workers in args.workers:
+        processed, elapsed = run(rows, workers, args.batch_size)
+        baseline = baseline or elapsed
+        print(f'{workers:>3} 程序：{processed} 筆 {elapsed:.2f}s，'
+              f'{processed / elapsed:,.0f} 筆/秒，加速 {baseline / elapsed:.2f}x')
+
+
+if __name__ == '__main__':
+    main()
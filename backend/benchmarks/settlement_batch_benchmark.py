@@ -0,0 +1,119 @@
+"""
+結算批次效能測試
+
+建立合成訂單資料（預設 50 萬筆）並量測 SettlementService.generate_settlement_batch 的執行時間。
+
+用法：
+    python -m backend.benchmarks.settlement_batch_benchmark --orders 500000
+    BENCHMARK_DATABASE_URL=postgresql://... python -m backend.benchmarks.settlement_batch_benchmark
+"""
+import argparse
+import os
+import random
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import insert
+from backend.app import create_app
+from backend.config import TestingConfig
+from backend.extensions import db
+from backend.models.user import User
+from backend.models.product import Product
+from backend.models.order import Order
+from backend.models.settlement import (
+    Settlement, SettlementStatement, SettlementItem, SettlementRun, SettlementRunTotal
+)
+from backend.models.logistics_company import LogisticsCompany
+from backend.models.recipient import Recipient
+
+INSERT_CHUNK_SIZE = 20000
+
+
+class BenchmarkConfig(TestingConfig):
+    SQLALCHEMY_DATABASE_URI = os.getenv('BENCHMARK_DATABASE_URL', 'sqlite:///:memory:')
+
+
+def build_dataset(order_count, supplier_count=200, mom_count=3000, product_count=1000, seed=42):
+    """建立供應商、團媽、商品及已完成待結算訂單"""
+    rng = random.Random(seed)
+    now = datetime.now()
+    user_count = supplier_count + mom_count + 1
+    db.session.execute(insert(User), [{
+        'id': user_id,
+        'username': f'user{user_id}',
+        'email': f'user{user_id}@bench.local',
+        'role': 'supplier' if user_id <= supplier_count else 'member',
+        'group_mom_level': 0 if user_id <= supplier_count else 1 + user_id % 3
+    } for user_id in range(1, user_count + 1)])
+    buyer_id = user_count
+    db.session.execute(insert(Product), [{
+        'id': product_id,
+        'supplier_id': str(rng.randint(1, supplier_count)),
+        'name': f'product{product_id}',
+        'cost': 70,
+        'price': 100,
+        'source': 'bench',
+        'description': 'bench',
+        'image_url': 'bench.png',
+        'on_shelf_date': now,
+        'off_shelf_date': now + timedelta(days=30)
+    } for product_id in range(1, product_count + 1)])
+
+    moms = list(range(supplier_count + 1, supplier_count + mom_count + 1))
+    for start in range(1, order_count + 1, INSERT_CHUNK_SIZE):
+        rows = []
+        for order_id in range(start, min(start + INSERT_CHUNK_SIZE, order_count + 1)):
+            quantity = rng.randint(1, 5)
+            has_middle = rng.random() < 0.8
+            has_small = rng.random() < 0.9
+            rows.append({
+                'id': order_id,
+                'user_id': buyer_id,
+                'product_id': rng.randint(1, product_count),
+                'quantity': quantity,
+                'total_price': 100.0 * quantity,
+                'cost': 70.0 * quantity,
+                'status': 'completed',
+                'calculation_verified': True,
+                'supplier_amount': 68.6 * quantity,
+                'platform_fee': 2.0 * quantity,
+                'tax_amount': 1.0 * quantity,
+                'big_mom_id': rng.choice(moms),
+                'middle_mom_id': rng.choice(moms) if has_middle else None,
+                'small_mom_id': rng.choice(moms) if has_small else None,
+                'big_mom_amount': 3.0 * quantity,
+                'middle_mom_amount': 5.0 * quantity if has_middle else None,
+                'small_mom_amount': 12.0 * quantity if has_small else None,
+                'tracking_number': f'TN{order_id}',
+                'shipped_at': now - timedelta(days=3),
+                'created_at': now - timedelta(days=10)
+            })
+        db.session.execute(insert(Order), rows)
+    db.session.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='結算批次效能測試')
+    parser.add_argument('--orders', type=int, default=500000, help='合成訂單數量')
+    parser.add_argument('--chunk-size', type=int, default=None, help='每批認領訂單筆數')
+    args = parser.parse_args()
+
+    app = create_app(BenchmarkConfig)
+    with app.app_context():
+        from backend.services.settlement_service import SettlementService
+        for model in (User, LogisticsCompany, Recipient, SettlementRun, Product, Order,
+                      Settlement, SettlementStatement, SettlementItem, SettlementRunTotal):
+            model.__table__.create(db.engine, checkfirst=True)
+
+        started = time.perf_counter()
+        build_dataset(args.orders)
+        print(f'建立 {args.orders} 筆合成訂單：{time.perf_counter() - started:.2f}s')
+
+        started = time.perf_counter()
+        result = SettlementService.generate_settlement_batch(chunk_size=args.chunk_size)
+        elapsed = time.perf_counter() - started
+        print(f'產生 {result["settlement_count"]} 張結算單（{result["order_count"]} 筆結算份額）：'
+              f'{elapsed:.2f}s，{args.orders / elapsed:,.0f} 筆訂單/秒')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+import click
+from backend.services.commission_ledger_service import CommissionLedgerService
+from backend.services.downline_stats_service import DownlineStatsService
+from backend.services.platform_summary_service import PlatformSummaryService
+from backend.services.partition_service import PartitionService
+from backend.services.profit_verification_service import ProfitVerificationService
+from backend.services.referral_service import ReferralService
+from backend.extensions import db
+
+def register_commands(app):
+    """註冊 Flask CLI 維運指令"""
+
+    @app.cli.command('rebuild-platform-summary')
+    def rebuild_platform_summary():
+        """以全表彙總重建平台金流總覽"""
+        period_count = PlatformSummaryService.rebuild()
+        click.echo(f'平台金流總覽已重建，共 {period_count} 個結算期別')
+
+    @app.cli.command('rebuild-referral-closure')
+    def rebuild_referral_closure():
+        """依 users.referrer_id 重建推薦閉包表"""
+        max_depth = ReferralService.rebuild()
+        db.session.commit()
+        click.echo(f'推薦閉包表已重建，最大推薦層數 {max_depth}')
+
+    @app.cli.command('rebuild-commission-ledger')
+    def rebuild_commission_ledger():
+        """依 commission_records 重建分潤餘額與每日彙總"""
+        balance_count = CommissionLedgerService.rebuild()
+        click.echo(f'分潤餘額已重建，共 {balance_count} 筆用戶狀態彙總')
+
+    @app.cli.command('rebuild-downline-stats')
+    @click.option('--chunk-size', type=int, default=None, help='每段買家 ID 範圍（預設 DOWNLINE_STATS_CHUNK_SIZE）')
+    @click.option('--workers', type=int, default=None, help='平行連線數（預設 DOWNLINE_STATS_WORKERS）')
+    def rebuild_downline_stats(chunk_size, workers):
+        """依訂單、退款與推薦閉包表平行重建下線統計"""
+        result = DownlineStatsService.rebuild(chunk_size=chunk_size, max_workers=workers)
+        click.echo(
+            f"下線統計已重建：{result['rows']} 筆，{result['ranges']} 段，"
+            f"{result['workers']} 個連線，耗時 {result['elapsed_seconds']} 秒"
+        )
+
+    @app.cli.command('reconcile-referral-counters')
+    @click.option('--chunk-size', type=int, default=None, help='每批用戶數（預設 REFERRAL_RECONCILE_CHUNK_SIZE）')
+    def reconcile_referral_counters(chunk_size):
+        """重新彙總並修正用戶的直屬下線計數"""
+        summary = ReferralService.reconcile_referral_counters(chunk_size)
+        click.echo(f"檢查 {summary['scanned']} 位用戶，修正 {summary['corrected']} 位，耗時 {summary['elapsed_seconds']} 秒")
+
+    @app.cli.command('maintain-partitions')
+    def maintain_partitions():
+        """補建未來月分區並封存超過保留期間的分區"""
+        result = PartitionService.maintain_partitions()
+        click.echo(f"新建分區：{', '.join(result['created']) or '無'}")
+        click.echo(f"封存分區：{', '.join(result['archived']) or '無'}")
+
+    @app.cli.command('verify-order-profits')
+    @click.option('--start', type=click.DateTime(formats=['%Y-%m-%d']), help='訂單建立日期起（含）')
+    @click.option('--end', type=click.DateTime(formats=['%Y-%m-%d']), help='訂單建立日期迄（不含）')
+    @click.option('--chunk-size', type=int, default=None, help='每批驗證訂單數')
+    def verify_order_profits(start, end, chunk_size):
+        """批次驗證訂單分潤明細加總，標記驗證失敗的訂單"""
+        report = ProfitVerificationService.verify_orders(start, end, chunk_size)
+        click.echo(
+            f"掃描 {report['scanned']} 筆：通過 {report['verified']}、失敗 {report['failed']}、"
+            f"缺少明細 {report['missing']}；新標記 {report['flagged']}、解除標記 {report['cleared']}"
+        )
+        for failed in report['failed_orders']:
+            click.echo(f"訂單 {failed['order_id']} 差額 {failed['difference']}")
@@ -45,12 +45,24 @@ class Config:
     REFERRER_BONUS_RATE = float(os.getenv('REFERRER_BONUS_RATE', 0.02))
     BIG_MOM_PROFIT_RATE = float(os.getenv('BIG_MOM_PROFIT_RATE', 0.15))
     MIDDLE_MOM_PROFIT_RATE = float(os.getenv('MIDDLE_MOM_PROFIT_RATE', 0.28))
+    PROFIT_RULESET_VERSION = os.getenv('PROFIT_RULESET_VERSION', 'v1')  # 新訂單採用的分潤規則集（見 utils/profit_rules.py）
 
     SETTLEMENT_DAYS = list(map(int, os.getenv('SETTLEMENT_DAYS', '1,16').split(',')))
     SIGNOFF_DEADLINE_DAYS = int(os.getenv('SIGNOFF_DEADLINE_DAYS', 7))
     PAYMENT_DAYS = list(map(int, os.getenv('PAYMENT_DAYS', '10,25').split(',')))
     RECEIPT_CONFIRMATION_DAYS = int(os.getenv('RECEIPT_CONFIRMATION_DAYS', 7))
     AUDIT_REPORT_DAY = int(os.getenv('AUDIT_REPORT_DAY', 5))
+    SETTLEMENT_CHUNK_SIZE = int(os.getenv('SETTLEMENT_CHUNK_SIZE', 5000))
+    SETTLEMENT_RUN_STALE_SECONDS = int(os.getenv('SETTLEMENT_RUN_STALE_SECONDS', 900))  # 執行中的結算執行超過此秒數未更新心跳即可被其他 worker 接手
+    COMMISSION_CHUNK_SIZE = int(os.getenv('COMMISSION_CHUNK_SIZE', 1000))  # 每小時分潤批次處理每批訂單數
+    PROFIT_VERIFICATION_CHUNK_SIZE = int(os.getenv('PROFIT_VERIFICATION_CHUNK_SIZE', 5000))  # 分潤明細驗證每批訂單數
+    DOWNLINE_STATS_CHUNK_SIZE = int(os.getenv('DOWNLINE_STATS_CHUNK_SIZE', 10000))  # 下線統計重建每段買家 ID 範圍
+    DOWNLINE_STATS_WORKERS = int(os.getenv('DOWNLINE_STATS_WORKERS', 4))  # 下線統計重建平行連線數
+    REFERRAL_RECONCILE_CHUNK_SIZE = int(os.getenv('REFERRAL_RECONCILE_CHUNK_SIZE', 10000))  # 直屬下線計數對帳每批用戶數
+    PLATFORM_SUMMARY_SHARDS = int(os.getenv('PLATFORM_SUMMARY_SHARDS', 16))  # 平台總覽每期別的分片列數
+    GROUP_MOM_UPGRADE_CHUNK_SIZE = int(os.getenv('GROUP_MOM_UPGRADE_CHUNK_SIZE', 1000))  # 團媽批次升級每個 UPDATE 的用戶數
+    PARTITION_MONTHS_AHEAD = int(os.getenv('PARTITION_MONTHS_AHEAD', 3))  # 預先建立的未來月分區數
+    PARTITION_RETENTION_MONTHS = int(os.getenv('PARTITION_RETENTION_MONTHS', 24))  # 超過即卸離封存的月分區
 
     MIN_INVESTMENT_AMOUNT = float(os.getenv('MIN_INVESTMENT_AMOUNT', 1000))
     MAX_PROPOSAL_DURATION_DAYS = int(os.getenv('MAX_PROPOSAL_DURATION_DAYS', 30))
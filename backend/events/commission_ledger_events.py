@@ -0,0 +1,48 @@
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+from backend.models.commission import CommissionRecord
+from backend.services.commission_ledger_service import CommissionLedgerService, ledger_entry
+
+
+def _previous(state, field):
+    """flush 前的欄位值（未變動時為目前值）"""
+    history = state.attrs[field].history
+    if history.deleted:
+        return history.deleted[0]
+    return getattr(state.object, field)
+
+
+def _entry(record, amount, from_status, to_status):
+    return ledger_entry(
+        record.id, record.user_id, record.order_id, record.level, amount, from_status, to_status, record.created_at
+    )
+
+
+def _record_commission_changes(session, flush_context):
+    """flush 後將分潤記錄的新增、狀態與金額異動寫入帳本並更新餘額"""
+    entries = []
+    for obj in session.new:
+        if isinstance(obj, CommissionRecord):
+            entries.append(_entry(obj, obj.amount, None, obj.status))
+    for obj in session.dirty:
+        if not isinstance(obj, CommissionRecord) or obj in session.new or obj in session.deleted:
+            continue
+        state = inspect(obj)
+        old_status, old_amount = _previous(state, 'status'), _previous(state, 'amount')
+        if old_amount != obj.amount:
+            entries.append(_entry(obj, old_amount, old_status, None))
+            entries.append(_entry(obj, obj.amount, None, obj.status))
+        elif old_status != obj.status:
+            entries.append(_entry(obj, obj.amount, old_status, obj.status))
+    for obj in session.deleted:
+        if isinstance(obj, CommissionRecord):
+            state = inspect(obj)
+            entries.append(_entry(obj, _previous(state, 'amount'), _previous(state, 'status'), None))
+    if entries:
+        CommissionLedgerService.record_entries(entries, connection=session.connection())
+
+
+def register_commission_ledger_events():
+    """註冊分潤帳本同步的 flush 事件（重複呼叫不會重複註冊）"""
+    if not event.contains(Session, 'after_flush', _record_commission_changes):
+        event.listen(Session, 'after_flush', _record_commission_changes)
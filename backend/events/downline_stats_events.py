@@ -0,0 +1,64 @@
+from collections import defaultdict
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+from backend.models.order import Order
+from backend.models.refund import Refund
+from backend.services.downline_stats_service import DownlineStatsService
+
+# 影響下線統計的欄位
+ORDER_FIELDS = ('status', 'total_price', 'user_id', 'created_at')
+REFUND_FIELDS = ('status', 'amount', 'refund_type', 'order_id')
+
+
+def _has_changes(obj, fields):
+    state = inspect(obj)
+    return any(state.attrs[field].history.has_changes() for field in fields)
+
+
+def _affected_order_ids(session):
+    """本次 flush 中會改變下線統計的既有訂單 ID（含異動退款所屬訂單）"""
+    order_ids = set()
+    for obj in session.dirty | session.deleted:
+        if isinstance(obj, Order) and obj not in session.new:
+            if obj in session.deleted or _has_changes(obj, ORDER_FIELDS):
+                order_ids.add(obj.id)
+    for obj in session.new | session.dirty | session.deleted:
+        if isinstance(obj, Refund) and (obj in session.new or obj in session.deleted or _has_changes(obj, REFUND_FIELDS)):
+            order_ids.add(obj.order_id)
+            previous = inspect(obj).attrs['order_id'].history.deleted
+            order_ids.update(previous)
+    order_ids.discard(None)
+    return order_ids
+
+
+def _capture_previous_contributions(session, flush_context, instances):
+    """flush 前讀取受影響訂單在資料庫中對買家統計的貢獻"""
+    order_ids = _affected_order_ids(session)
+    if not order_ids:
+        return
+    session.info['downline_stats_previous'] = (
+        order_ids, DownlineStatsService.order_contributions(order_ids, connection=session.connection())
+    )
+
+
+def _apply_stats_deltas(session, flush_context):
+    """flush 後以 (新貢獻 - 原貢獻) 增量更新買家所有上線的下線統計"""
+    order_ids, previous = session.info.pop('downline_stats_previous', (set(), {}))
+    order_ids = order_ids | {obj.id for obj in session.new if isinstance(obj, Order)}
+    if not order_ids:
+        return
+    current = DownlineStatsService.order_contributions(order_ids, connection=session.connection())
+
+    deltas = defaultdict(lambda: defaultdict(float))
+    for contributions, sign in ((previous, -1), (current, 1)):
+        for buyer_id, values in contributions.items():
+            for field, value in values.items():
+                deltas[buyer_id][field] += sign * value
+    DownlineStatsService.apply_deltas(deltas, connection=session.connection())
+
+
+def register_downline_stats_events():
+    """註冊下線統計增量更新的 flush 事件（重複呼叫不會重複註冊）"""
+    if not event.contains(Session, 'before_flush', _capture_previous_contributions):
+        event.listen(Session, 'before_flush', _capture_previous_contributions)
+        event.listen(Session, 'after_flush', _apply_stats_deltas)
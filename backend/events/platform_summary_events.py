@@ -0,0 +1,107 @@
+from collections import defaultdict
+from datetime import datetime
+from sqlalchemy import event, inspect, select
+from sqlalchemy.orm import Session
+from backend.models.order import Order
+from backend.models.settlement import Settlement
+from backend.services.platform_summary_service import PlatformSummaryService, settlement_period
+
+# 影響平台總覽的欄位
+ORDER_FIELDS = ('status', 'total_price', 'platform_profit', 'tax_amount', 'settled_at')
+SETTLEMENT_FIELDS = ('status', 'total_amount')
+
+
+def _order_contribution(order):
+    return PlatformSummaryService.order_contribution(
+        order.status, order.total_price, order.platform_profit, order.tax_amount, order.settled_at
+    )
+
+
+def _settlement_contribution(settlement):
+    return PlatformSummaryService.settlement_contribution(settlement.status, settlement.total_amount)
+
+
+def _has_changes(obj, fields):
+    state = inspect(obj)
+    return any(state.attrs[field].history.has_changes() for field in fields)
+
+
+def _capture_previous_state(session, flush_context, instances):
+    """flush 前讀取異動訂單/結算單在資料庫中的原值"""
+    order_ids = []
+    settlement_ids = []
+    for obj in session.dirty | session.deleted:
+        if obj in session.new:
+            continue
+        if isinstance(obj, Order) and (obj in session.deleted or _has_changes(obj, ORDER_FIELDS)):
+            order_ids.append(obj.id)
+        elif isinstance(obj, Settlement) and (obj in session.deleted or _has_changes(obj, SETTLEMENT_FIELDS)):
+            settlement_ids.append(obj.id)
+    if not order_ids and not settlement_ids:
+        return
+
+    connection = session.connection()
+    previous = {}
+    if order_ids:
+        for row in connection.execute(
+            select(Order.id, Order.created_at, *(getattr(Order, f) for f in ORDER_FIELDS))
+            .where(Order.id.in_(order_ids))
+        ):
+            previous[(Order, row.id)] = (
+                settlement_period(row.created_at or datetime.utcnow()),
+                PlatformSummaryService.order_contribution(
+                    row.status, row.total_price, row.platform_profit, row.tax_amount, row.settled_at
+                )
+            )
+    if settlement_ids:
+        for row in connection.execute(
+            select(Settlement.id, Settlement.period, *(getattr(Settlement, f) for f in SETTLEMENT_FIELDS))
+            .where(Settlement.id.in_(settlement_ids))
+        ):
+            previous[(Settlement, row.id)] = (
+                row.period,
+                PlatformSummaryService.settlement_contribution(row.status, row.total_amount)
+            )
+    session.info['platform_summary_previous'] = previous
+
+
+def _apply_summary_deltas(session, flush_context):
+    """flush 後以 (新值 - 原值) 增量更新平台總覽"""
+    previous = session.info.pop('platform_summary_previous', {})
+    deltas = defaultdict(lambda: defaultdict(float))
+
+    for (model, obj_id), (period, contribution) in previous.items():
+        for field, value in contribution.items():
+            deltas[period][field] -= value
+
+    for obj in session.new | session.dirty:
+        if obj in session.deleted:
+            continue
+        if isinstance(obj, Order):
+            key = (Order, obj.id)
+            if obj in session.new:
+                period = settlement_period(obj.created_at or datetime.utcnow())
+            elif key in previous:
+                period = previous[key][0]
+            else:
+                continue
+            contribution = _order_contribution(obj)
+        elif isinstance(obj, Settlement):
+            key = (Settlement, obj.id)
+            if obj not in session.new and key not in previous:
+                continue
+            period = obj.period
+            contribution = _settlement_contribution(obj)
+        else:
+            continue
+        for field, value in contribution.items():
+            deltas[period][field] += value
+
+    PlatformSummaryService.apply_deltas(deltas, connection=session.connection())
+
+
+def register_platform_summary_events():
+    """註冊平台總覽增量更新的 flush 事件（重複呼叫不會重複註冊）"""
+    if not event.contains(Session, 'before_flush', _capture_previous_state):
+        event.listen(Session, 'before_flush', _capture_previous_state)
+        event.listen(Session, 'after_flush', _apply_summary_deltas)
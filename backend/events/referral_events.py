@@ -0,0 +1,81 @@
+from collections import defaultdict
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+from backend.models.user import User
+from backend.services.referral_service import ReferralService
+
+# 影響推薦人直屬下線計數的欄位
+COUNTER_SOURCE_FIELDS = ('referrer_id', 'is_active', 'group_mom_level')
+
+
+def _referrer_changed(user):
+    return inspect(user).attrs.referrer_id.history.has_changes()
+
+
+def _sync_referral_closure(session, flush_context):
+    """flush 後依新增、刪除與推薦人異動的用戶增量維護推薦閉包表"""
+    new_users = [obj for obj in session.new if isinstance(obj, User)]
+    moved_users = [
+        obj for obj in session.dirty
+        if isinstance(obj, User) and obj not in session.new and _referrer_changed(obj)
+    ]
+    deleted_users = [obj for obj in session.deleted if isinstance(obj, User)]
+    if not new_users and not moved_users and not deleted_users:
+        return
+
+    connection = session.connection()
+    for user in deleted_users:
+        ReferralService.remove_user(user.id, connection=connection)
+
+    # 同一次 flush 新增的上下線，先建立上線的閉包列
+    pending = {user.id: user for user in new_users}
+    while pending:
+        ready = [user for user in pending.values() if user.referrer_id not in pending]
+        if not ready:
+            raise ValueError('推薦關係存在循環')
+        for user in ready:
+            ReferralService.add_user(user.id, user.referrer_id, connection=connection)
+            del pending[user.id]
+
+    for user in moved_users:
+        ReferralService.move_user(user.id, user.referrer_id, connection=connection)
+
+
+def _previous(state, field):
+    """flush 前的欄位值（未變動時為目前值）"""
+    history = state.attrs[field].history
+    if history.deleted:
+        return history.deleted[0]
+    return getattr(state.object, field)
+
+
+def _sync_referral_counters(session, flush_context):
+    """flush 後依用戶新增、刪除、啟用狀態、團媽等級與推薦人異動，增量調整推薦人的直屬下線計數"""
+    deltas = defaultdict(lambda: defaultdict(int))
+
+    def add(referrer_id, is_active, level, sign):
+        for field, value in ReferralService.referral_counter_contribution(is_active, level).items():
+            deltas[referrer_id][field] += sign * value
+
+    for obj in session.new | session.dirty | session.deleted:
+        if not isinstance(obj, User):
+            continue
+        if obj not in session.new:
+            state = inspect(obj)
+            if obj not in session.deleted and not any(
+                state.attrs[field].history.has_changes() for field in COUNTER_SOURCE_FIELDS
+            ):
+                continue
+            add(*(_previous(state, field) for field in COUNTER_SOURCE_FIELDS), -1)
+        if obj not in session.deleted:
+            add(obj.referrer_id, obj.is_active, obj.group_mom_level, 1)
+
+    if deltas:
+        ReferralService.apply_referral_counter_deltas(deltas, connection=session.connection())
+
+
+def register_referral_events():
+    """註冊推薦閉包表與直屬下線計數增量維護的 flush 事件（重複呼叫不會重複註冊）"""
+    if not event.contains(Session, 'after_flush', _sync_referral_closure):
+        event.listen(Session, 'after_flush', _sync_referral_closure)
+        event.listen(Session, 'after_flush', _sync_referral_counters)
@@ -0,0 +1,41 @@
+"""add commission_records.ruleset_version and idempotency key
+
+Revision ID: 20261018_commission_idempotency_key
+Revises: 20261018_commission_ledger
+Create Date: 2026-10-18
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '20261018_commission_idempotency_key'
+down_revision = '20261018_commission_ledger'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.add_column('commission_records', sa.Column('ruleset_version', sa.String(20)))
+    # 既有分潤記錄沿用訂單的規則集版本，尚未記錄版本的訂單為 v1
+    op.execute("""
+        UPDATE commission_records SET ruleset_version = COALESCE(
+            (SELECT o.profit_ruleset_version FROM orders o WHERE o.id = commission_records.order_id), 'v1'
+        )
+    """)
+    duplicates = op.get_bind().execute(sa.text("""
+        SELECT COUNT(*) FROM (
+            SELECT order_id, user_id, ruleset_version FROM commission_records
+            GROUP BY order_id, user_id, ruleset_version HAVING COUNT(*) > 1
+        ) d
+    """)).scalar()
+    if duplicates:
+        raise RuntimeError(f'commission_records 有 {duplicates} 組重複的訂單分潤（order_id, user_id），請先處理重複記錄')
+    op.alter_column('commission_records', 'ruleset_version', existing_type=sa.String(20), nullable=False)
+    op.create_index(
+        'uq_commission_order_user_ruleset', 'commission_records', ['order_id', 'user_id', 'ruleset_version'],
+        unique=True
+    )
+
+def downgrade():
+    op.drop_index('uq_commission_order_user_ruleset', table_name='commission_records')
+    op.drop_column('commission_records', 'ruleset_version')
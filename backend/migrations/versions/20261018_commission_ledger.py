@@ -0,0 +1,79 @@
+"""add commission ledger, balances and daily rollups
+
+Revision ID: 20261018_commission_ledger
+Revises: 20261018_referral_closure
+Create Date: 2026-10-18
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '20261018_commission_ledger'
+down_revision = '20261018_referral_closure'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_table(
+        'commission_ledger',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('commission_id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('order_id', sa.Integer()),
+        sa.Column('level', sa.Integer()),
+        sa.Column('amount', sa.Float(), nullable=False),
+        sa.Column('from_status', sa.String(20)),
+        sa.Column('to_status', sa.String(20)),
+        sa.Column('created_at', sa.DateTime()),
+    )
+    op.create_index('idx_commission_ledger_user_created', 'commission_ledger', ['user_id', 'created_at'])
+    op.create_index('idx_commission_ledger_commission', 'commission_ledger', ['commission_id'])
+    op.create_table(
+        'commission_balances',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('status', sa.String(20), nullable=False),
+        sa.Column('count', sa.Integer()),
+        sa.Column('amount', sa.Float()),
+        sa.Column('updated_at', sa.DateTime()),
+        sa.UniqueConstraint('user_id', 'status', name='uq_commission_balance_user_status'),
+    )
+    op.create_table(
+        'commission_daily_rollups',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('day', sa.Date(), nullable=False),
+        sa.Column('level', sa.Integer(), nullable=False),
+        sa.Column('status', sa.String(20), nullable=False),
+        sa.Column('count', sa.Integer()),
+        sa.Column('amount', sa.Float()),
+        sa.Column('updated_at', sa.DateTime()),
+        sa.UniqueConstraint('day', 'level', 'status', name='uq_commission_rollup_day_level_status'),
+    )
+
+    # 既有分潤記錄以目前狀態作為期初帳本，並同時回填各狀態餘額與每日彙總，
+    # 部署後報表與狀態異動的差額即以完整的期初值為基礎
+    op.execute("""
+        INSERT INTO commission_ledger (commission_id, user_id, order_id, level, amount, from_status, to_status, created_at)
+        SELECT id, user_id, order_id, level, COALESCE(amount, 0), NULL, status, CURRENT_TIMESTAMP
+        FROM commission_records
+    """)
+    op.execute("""
+        INSERT INTO commission_balances (user_id, status, count, amount, updated_at)
+        SELECT user_id, status, COUNT(*), COALESCE(SUM(amount), 0), CURRENT_TIMESTAMP
+        FROM commission_records
+        GROUP BY user_id, status
+    """)
+    op.execute("""
+        INSERT INTO commission_daily_rollups (day, level, status, count, amount, updated_at)
+        SELECT DATE(created_at), level, status, COUNT(*), COALESCE(SUM(amount), 0), CURRENT_TIMESTAMP
+        FROM commission_records
+        GROUP BY DATE(created_at), level, status
+    """)
+
+def downgrade():
+    op.drop_table('commission_daily_rollups')
+    op.drop_table('commission_balances')
+    op.drop_index('idx_commission_ledger_commission', table_name='commission_ledger')
+    op.drop_index('idx_commission_ledger_user_created', table_name='commission_ledger')
+    op.drop_table('commission_ledger')
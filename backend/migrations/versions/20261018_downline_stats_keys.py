@@ -0,0 +1,39 @@
+"""downline_stats integer user keys and unique (mom_id, downline_id)
+
+Revision ID: 20261018_downline_stats_keys
+Revises: 20261018_commission_idempotency_key
+Create Date: 2026-10-18
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '20261018_downline_stats_keys'
+down_revision = '20261018_commission_idempotency_key'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # 下線統計改由訂單事件增量維護；既有資料不可靠，清空後以 flask rebuild-downline-stats 重建
+    if sa.inspect(op.get_bind()).has_table('downline_stats'):
+        op.drop_table('downline_stats')
+    op.create_table(
+        'downline_stats',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('mom_id', sa.Integer(), sa.ForeignKey('users.id'), nullable=False),
+        sa.Column('downline_id', sa.Integer(), sa.ForeignKey('users.id'), nullable=False),
+        sa.Column('order_count', sa.Integer()),
+        sa.Column('total_spent', sa.Float()),
+        sa.Column('last_order_date', sa.DateTime()),
+        sa.Column('created_at', sa.DateTime()),
+        sa.Column('updated_at', sa.DateTime()),
+        sa.UniqueConstraint('mom_id', 'downline_id', name='uq_downline_stats_mom_downline'),
+    )
+    op.create_index('idx_downline_stats_mom_last_order', 'downline_stats', ['mom_id', 'last_order_date'])
+    op.create_index('idx_downline_stats_downline', 'downline_stats', ['downline_id'])
+
+def downgrade():
+    op.drop_index('idx_downline_stats_downline', table_name='downline_stats')
+    op.drop_index('idx_downline_stats_mom_last_order', table_name='downline_stats')
+    op.drop_table('downline_stats')
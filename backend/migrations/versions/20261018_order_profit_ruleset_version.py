@@ -0,0 +1,23 @@
+"""add orders.profit_ruleset_version
+
+Revision ID: 20261018_order_profit_ruleset_version
+Revises: 20261018_partition_orders_settlements
+Create Date: 2026-10-18
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '20261018_order_profit_ruleset_version'
+down_revision = '20261018_partition_orders_settlements'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.add_column('orders', sa.Column('profit_ruleset_version', sa.String(20)))
+    # 既有分潤皆以 v1 規則（原 profit_calculator）計算
+    op.execute("UPDATE orders SET profit_ruleset_version = 'v1' WHERE profit_calculated_at IS NOT NULL")
+
+def downgrade():
+    op.drop_column('orders', 'profit_ruleset_version')
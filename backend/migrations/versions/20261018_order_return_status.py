@@ -0,0 +1,22 @@
+"""add orders.return_status
+
+Revision ID: 20261018_order_return_status
+Revises: 20250602_create_superadmin_jackeychen
+Create Date: 2026-10-18
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '20261018_order_return_status'
+down_revision = '20250602_create_superadmin_jackeychen'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # 結算對帳單、稽核規則與財務分析皆會讀取退貨狀態
+    op.add_column('orders', sa.Column('return_status', sa.String(20)))
+
+def downgrade():
+    op.drop_column('orders', 'return_status')
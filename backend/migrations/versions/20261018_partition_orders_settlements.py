@@ -0,0 +1,153 @@
+"""partition orders by created_at month and settlements by period month
+
+Revision ID: 20261018_partition_orders_settlements
+Revises: 20261018_settlement_items
+Create Date: 2026-10-18
+
+"""
+import re
+from datetime import date
+from alembic import op
+import sqlalchemy as sa
+from backend.utils.partitioning import (
+    PARTITIONED_TABLES, ARCHIVE_SCHEMA, add_months, create_default_partition_sql,
+    create_partition_sql, month_start, months_between
+)
+
+# revision identifiers, used by Alembic.
+revision = '20261018_partition_orders_settlements'
+down_revision = '20261018_settlement_items'
+branch_labels = None
+depends_on = None
+
+# 預先建立的未來月分區數（之後由 PartitionService 每月補建）
+MONTHS_AHEAD = 3
+
+# 參照分區表的外鍵（PostgreSQL 預設名稱 {參照表}_{欄位}_fkey）：分區表主鍵須包含分區鍵，
+# 升版時依名稱逐一移除、改由應用程式維護參照完整性，降版時還原
+INBOUND_FOREIGN_KEYS = {
+    'orders': (
+        ('unsettled_orders', 'order_id'),
+        ('settlement_items', 'order_id'),
+        ('refunds', 'order_id'),
+        ('commission_records', 'order_id'),
+        ('payment_transactions', 'order_id'),
+    ),
+    'settlements': (
+        ('settlement_statements', 'settlement_id'),
+        ('settlement_items', 'settlement_id'),
+        ('audit_reports', 'settlement_id'),
+    ),
+}
+
+
+def _replace_table(bind, table, source, create_sql):
+    """
+    將 table 更名為 source 並以 create_sql 建立新母表
+    :return: 原表的非主鍵索引、對外外鍵與 id 序列，供搬移資料後還原
+    """
+    indexes = bind.execute(sa.text("""
+        SELECT indexdef FROM pg_indexes
+        WHERE schemaname = current_schema() AND tablename = :table
+          AND indexname NOT IN (
+              SELECT conname FROM pg_constraint
+              WHERE conrelid = CAST(:table AS regclass) AND contype = 'p'
+          )
+    """), {'table': table}).scalars().all()
+    foreign_keys = bind.execute(sa.text("""
+        SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint
+        WHERE conrelid = CAST(:table AS regclass) AND contype = 'f'
+    """), {'table': table}).all()
+    sequence = bind.execute(sa.text("SELECT pg_get_serial_sequence(:table, 'id')"), {'table': table}).scalar()
+    primary_key = bind.execute(sa.text("""
+        SELECT conname FROM pg_constraint
+        WHERE conrelid = CAST(:table AS regclass) AND contype = 'p'
+    """), {'table': table}).scalar()
+
+    op.execute(f'ALTER TABLE {table} RENAME TO {source}')
+    # 釋出主鍵名稱給新母表
+    if primary_key:
+        op.execute(f'ALTER TABLE {source} RENAME CONSTRAINT {primary_key} TO {source}_pkey')
+    op.execute(create_sql)
+    return indexes, foreign_keys, sequence
+
+
+def _move_rows(table, source, copy_sources, saved):
+    """搬移資料、轉移序列歸屬後刪除原表，再於新母表重建索引與外鍵"""
+    indexes, foreign_keys, sequence = saved
+    for copy_source in copy_sources:
+        op.execute(f'INSERT INTO {table} SELECT * FROM {copy_source}')
+    if sequence:
+        op.execute(f'ALTER SEQUENCE {sequence} OWNED BY {table}.id')
+    # 不使用 CASCADE：仍有未列於 INBOUND_FOREIGN_KEYS 的外鍵或檢視表依賴原表時直接失敗，不靜默移除
+    op.execute(f'DROP TABLE {source}')
+
+    for indexdef in indexes:
+        op.execute(re.sub(rf'ON (\S+\.)?{source} ', f'ON {table} ', indexdef))
+    for name, definition in foreign_keys:
+        op.execute(f'ALTER TABLE {table} ADD CONSTRAINT {name} {definition}')
+
+
+def upgrade():
+    bind = op.get_bind()
+    if bind.dialect.name != 'postgresql':
+        return
+
+    existing_tables = set(sa.inspect(bind).get_table_names())
+    last_month = add_months(month_start(date.today()), MONTHS_AHEAD)
+    for table, spec in PARTITIONED_TABLES.items():
+        column = spec['column']
+        for referencing, referencing_column in INBOUND_FOREIGN_KEYS[table]:
+            if referencing in existing_tables:
+                op.execute(
+                    f'ALTER TABLE {referencing} DROP CONSTRAINT IF EXISTS {referencing}_{referencing_column}_fkey'
+                )
+
+        if spec['bound'] == 'timestamp':
+            # 分區鍵須為非空值
+            op.execute(f'UPDATE {table} SET {column} = CURRENT_TIMESTAMP WHERE {column} IS NULL')
+            first = bind.execute(sa.text(f'SELECT MIN({column}) FROM {table}')).scalar()
+        else:
+            first_period = bind.execute(sa.text(f'SELECT MIN({column}) FROM {table}')).scalar()
+            first = date(int(first_period[:4]), int(first_period[4:6]), 1) if first_period else None
+        first = month_start(first or date.today())
+
+        source = f'{table}_unpartitioned'
+        saved = _replace_table(
+            bind, table, source,
+            f'CREATE TABLE {table} (LIKE {source} INCLUDING DEFAULTS, '
+            f'PRIMARY KEY (id, {column})) PARTITION BY RANGE ({column})'
+        )
+        for month in months_between(first, last_month):
+            op.execute(create_partition_sql(table, month))
+        op.execute(create_default_partition_sql(table))
+        _move_rows(table, source, [source], saved)
+
+
+def downgrade():
+    bind = op.get_bind()
+    if bind.dialect.name != 'postgresql':
+        return
+
+    existing_tables = set(sa.inspect(bind).get_table_names())
+    for table in PARTITIONED_TABLES:
+        # 已封存的分區一併搬回
+        archived = bind.execute(sa.text("""
+            SELECT schemaname || '.' || tablename FROM pg_tables
+            WHERE schemaname = :schema AND tablename LIKE :pattern
+        """), {'schema': ARCHIVE_SCHEMA, 'pattern': f'{table}\\_p%'}).scalars().all()
+
+        source = f'{table}_partitioned'
+        saved = _replace_table(
+            bind, table, source,
+            f'CREATE TABLE {table} (LIKE {source} INCLUDING DEFAULTS, PRIMARY KEY (id))'
+        )
+        _move_rows(table, source, [source, *archived], saved)
+        for name in archived:
+            op.execute(f'DROP TABLE {name}')
+
+        for referencing, column in INBOUND_FOREIGN_KEYS[table]:
+            if referencing in existing_tables:
+                op.create_foreign_key(
+                    f'{referencing}_{column}_fkey', referencing, table, [column], ['id']
+                )
@@ -0,0 +1,35 @@
+"""add platform summary table
+
+Revision ID: 20261018_platform_summaries
+Revises: 20261018_settlement_runs
+Create Date: 2026-10-18
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '20261018_platform_summaries'
+down_revision = '20261018_settlement_runs'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # 平台金流總覽（依結算期別累計），部署後執行 flask rebuild-platform-summary 回填
+    op.create_table(
+        'platform_summaries',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('period', sa.String(8), nullable=False),
+        sa.Column('shard', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('total_revenue', sa.Float(), server_default='0'),
+        sa.Column('settled_amount', sa.Float(), server_default='0'),
+        sa.Column('unsettled_amount', sa.Float(), server_default='0'),
+        sa.Column('platform_profit', sa.Float(), server_default='0'),
+        sa.Column('tax_amount', sa.Float(), server_default='0'),
+        sa.Column('updated_at', sa.DateTime(), server_default=sa.text('CURRENT_TIMESTAMP')),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('period', 'shard', name='uq_platform_summaries_period_shard')
+    )
+
+def downgrade():
+    op.drop_table('platform_summaries')
@@ -0,0 +1,48 @@
+"""add referral_closure ancestor table
+
+Revision ID: 20261018_referral_closure
+Revises: 20261018_order_profit_ruleset_version
+Create Date: 2026-10-18
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '20261018_referral_closure'
+down_revision = '20261018_order_profit_ruleset_version'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_table(
+        'referral_closure',
+        sa.Column('ancestor_id', sa.Integer(), sa.ForeignKey('users.id', ondelete='CASCADE'), primary_key=True),
+        sa.Column('descendant_id', sa.Integer(), sa.ForeignKey('users.id', ondelete='CASCADE'), primary_key=True),
+        sa.Column('depth', sa.Integer(), nullable=False),
+    )
+    op.create_index('idx_referral_closure_descendant', 'referral_closure', ['descendant_id', 'depth'])
+    op.create_index('idx_referral_closure_ancestor', 'referral_closure', ['ancestor_id', 'depth'])
+
+    # 依現有推薦關係逐層展開
+    bind = op.get_bind()
+    op.execute('INSERT INTO referral_closure (ancestor_id, descendant_id, depth) SELECT id, id, 0 FROM users')
+    user_count = bind.execute(sa.text('SELECT COUNT(*) FROM users')).scalar()
+    depth = 0
+    while depth <= user_count:
+        inserted = bind.execute(sa.text("""
+            INSERT INTO referral_closure (ancestor_id, descendant_id, depth)
+            SELECT c.ancestor_id, u.id, c.depth + 1
+            FROM users u JOIN referral_closure c ON c.descendant_id = u.referrer_id
+            WHERE c.depth = :depth
+        """), {'depth': depth}).rowcount
+        if not inserted:
+            break
+        depth += 1
+    else:
+        raise RuntimeError('users.referrer_id 存在循環推薦關係，請先修正資料')
+
+def downgrade():
+    op.drop_index('idx_referral_closure_ancestor', table_name='referral_closure')
+    op.drop_index('idx_referral_closure_descendant', table_name='referral_closure')
+    op.drop_table('referral_closure')
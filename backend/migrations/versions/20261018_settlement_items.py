@@ -0,0 +1,66 @@
+"""normalize settlement order details into settlement_items
+
+Revision ID: 20261018_settlement_items
+Revises: 20261018_settlement_review_columns
+Create Date: 2026-10-18
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects.postgresql import JSON
+
+# revision identifiers, used by Alembic.
+revision = '20261018_settlement_items'
+down_revision = '20261018_settlement_review_columns'
+branch_labels = None
+depends_on = None
+
+# 標記由本遷移建立的資料表；模型早於本遷移存在，部分環境已由 db.create_all 建立 settlement_items
+CREATED_COMMENT = 'created by migration 20261018_settlement_items'
+
+def upgrade():
+    bind = op.get_bind()
+    if 'settlement_items' not in sa.inspect(bind).get_table_names():
+        op.create_table(
+            'settlement_items',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('settlement_id', sa.Integer(), sa.ForeignKey('settlements.id'), nullable=False),
+            sa.Column('order_id', sa.Integer(), sa.ForeignKey('orders.id'), nullable=False),
+            sa.Column('amount', sa.Float(), nullable=False),
+            sa.Column('details', JSON),
+            sa.Column('status', sa.String(20), server_default='pending'),
+            sa.Column('created_at', sa.DateTime(), server_default=sa.text('CURRENT_TIMESTAMP')),
+            sa.Column('updated_at', sa.DateTime(), server_default=sa.text('CURRENT_TIMESTAMP')),
+            sa.PrimaryKeyConstraint('id'),
+            comment=CREATED_COMMENT
+        )
+    op.create_index('idx_settlement_items_settlement', 'settlement_items', ['settlement_id', 'order_id'])
+    op.create_index('idx_settlement_items_order', 'settlement_items', ['order_id'])
+
+    # 將既有結算單的 JSON order_details 展開回填為明細列
+    if bind.dialect.name == 'postgresql':
+        op.execute("""
+            INSERT INTO settlement_items (settlement_id, order_id, amount, status, created_at, updated_at)
+            SELECT
+                s.id,
+                (od->>'order_id')::integer,
+                COALESCE((od->>'amount')::float, 0),
+                CASE WHEN s.status IN ('approved', 'rejected', 'paid') THEN s.status ELSE 'pending' END,
+                s.created_at,
+                s.created_at
+            FROM settlements s
+            CROSS JOIN LATERAL json_array_elements(s.order_details::json) AS od
+            WHERE s.order_details IS NOT NULL
+              AND NOT EXISTS (SELECT 1 FROM settlement_items i WHERE i.settlement_id = s.id)
+        """)
+
+def downgrade():
+    bind = op.get_bind()
+    # 不支援資料表註解的資料庫（SQLite）無從分辨，依遷移鏈視為本遷移建立
+    if not bind.dialect.supports_comments or (
+        sa.inspect(bind).get_table_comment('settlement_items').get('text') == CREATED_COMMENT
+    ):
+        op.drop_table('settlement_items')
+        return
+    op.drop_index('idx_settlement_items_order', table_name='settlement_items')
+    op.drop_index('idx_settlement_items_settlement', table_name='settlement_items')
@@ -0,0 +1,30 @@
+"""add settlement review and expiry columns
+
+Revision ID: 20261018_settlement_review_columns
+Revises: 20261018_platform_summaries
+Create Date: 2026-10-18
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '20261018_settlement_review_columns'
+down_revision = '20261018_platform_summaries'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # 審核與過期欄位（審核流程與過期掃描皆會寫入）
+    op.add_column('settlements', sa.Column('approved_at', sa.DateTime()))
+    op.add_column('settlements', sa.Column('approved_by', sa.Integer()))
+    op.add_column('settlements', sa.Column('rejected_at', sa.DateTime()))
+    op.add_column('settlements', sa.Column('rejected_by', sa.Integer()))
+    op.add_column('settlements', sa.Column('reject_reason', sa.Text()))
+    op.add_column('settlements', sa.Column('is_expired', sa.Boolean(), server_default=sa.false()))
+    op.create_index('idx_settlements_status_created', 'settlements', ['status', 'created_at'])
+
+def downgrade():
+    op.drop_index('idx_settlements_status_created', table_name='settlements')
+    for column in ('is_expired', 'reject_reason', 'rejected_by', 'rejected_at', 'approved_by', 'approved_at'):
+        op.drop_column('settlements', column)
@@ -0,0 +1,61 @@
+"""add settlement run ledger and checkpoints
+
+Revision ID: 20261018_settlement_runs
+Revises: 20261018_order_return_status
+Create Date: 2026-10-18
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '20261018_settlement_runs'
+down_revision = '20261018_order_return_status'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # 結算執行紀錄與檢查點
+    op.create_table(
+        'settlement_runs',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('period', sa.String(8), nullable=False),
+        sa.Column('status', sa.String(20), server_default='running'),
+        sa.Column('chunk_size', sa.Integer(), nullable=False),
+        sa.Column('last_order_id', sa.Integer(), server_default='0'),
+        sa.Column('processed_orders', sa.Integer(), server_default='0'),
+        sa.Column('processed_chunks', sa.Integer(), server_default='0'),
+        sa.Column('error_message', sa.Text()),
+        sa.Column('heartbeat_at', sa.DateTime(), server_default=sa.text('CURRENT_TIMESTAMP')),
+        sa.Column('started_at', sa.DateTime(), server_default=sa.text('CURRENT_TIMESTAMP')),
+        sa.Column('completed_at', sa.DateTime()),
+        sa.Column('updated_at', sa.DateTime(), server_default=sa.text('CURRENT_TIMESTAMP')),
+        sa.PrimaryKeyConstraint('id')
+    )
+
+    # 結算執行各 (結算類型, 用戶) 累計小計
+    op.create_table(
+        'settlement_run_totals',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('run_id', sa.Integer(), sa.ForeignKey('settlement_runs.id'), nullable=False),
+        sa.Column('settlement_type', sa.String(20), nullable=False),
+        sa.Column('user_id', sa.String(36), nullable=False),
+        sa.Column('total_amount', sa.Float(), server_default='0'),
+        sa.Column('order_count', sa.Integer(), server_default='0'),
+        sa.Column('platform_fee', sa.Float(), server_default='0'),
+        sa.Column('tax_amount', sa.Float(), server_default='0'),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('run_id', 'settlement_type', 'user_id', name='uq_settlement_run_totals_key')
+    )
+
+    # 訂單記錄所屬結算執行，避免重複結算並讓每次執行只掃描新訂單
+    op.add_column('orders', sa.Column('settlement_run_id', sa.Integer()))
+    op.create_foreign_key('fk_orders_settlement_run', 'orders', 'settlement_runs', ['settlement_run_id'], ['id'])
+    op.create_index('idx_orders_settlement_run', 'orders', ['settlement_run_id', 'status'])
+
+def downgrade():
+    op.drop_index('idx_orders_settlement_run', table_name='orders')
+    op.drop_constraint('fk_orders_settlement_run', 'orders', type_='foreignkey')
+    op.drop_column('orders', 'settlement_run_id')
+    op.drop_table('settlement_run_totals')
+    op.drop_table('settlement_runs')
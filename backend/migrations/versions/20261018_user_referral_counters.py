@@ -0,0 +1,50 @@
+"""add users direct referral counters
+
+Revision ID: 20261018_user_referral_counters
+Revises: 20261018_downline_stats_keys
+Create Date: 2026-10-18
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '20261018_user_referral_counters'
+down_revision = '20261018_downline_stats_keys'
+branch_labels = None
+depends_on = None
+
+COUNTER_COLUMNS = ('referral_count', 'small_mom_referral_count', 'middle_mom_referral_count', 'big_mom_referral_count')
+
+def upgrade():
+    # 直屬下線計數
+    for column in COUNTER_COLUMNS:
+        op.add_column('users', sa.Column(column, sa.Integer(), nullable=False, server_default='0'))
+    op.create_index('idx_users_referrer', 'users', ['referrer_id'])
+
+    # 以推薦人索引的關聯子查詢回填既有用戶的計數
+    op.execute("""
+        UPDATE users SET
+            referral_count = (
+                SELECT COUNT(*) FROM users AS referral
+                WHERE referral.referrer_id = users.id AND referral.is_active = TRUE
+            ),
+            small_mom_referral_count = (
+                SELECT COUNT(*) FROM users AS referral
+                WHERE referral.referrer_id = users.id AND referral.group_mom_level = 1
+            ),
+            middle_mom_referral_count = (
+                SELECT COUNT(*) FROM users AS referral
+                WHERE referral.referrer_id = users.id AND referral.group_mom_level = 2
+            ),
+            big_mom_referral_count = (
+                SELECT COUNT(*) FROM users AS referral
+                WHERE referral.referrer_id = users.id AND referral.group_mom_level = 3
+            )
+        WHERE EXISTS (SELECT 1 FROM users AS referral WHERE referral.referrer_id = users.id)
+    """)
+
+def downgrade():
+    op.drop_index('idx_users_referrer', table_name='users')
+    for column in reversed(COUNTER_COLUMNS):
+        op.drop_column('users', column)
@@ -0,0 +1,38 @@
+"""add user status events
+
+Revision ID: 20261018_user_status_events
+Revises: 20261018_user_referral_counters
+Create Date: 2026-10-18
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '20261018_user_status_events'
+down_revision = '20261018_user_referral_counters'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # 既有 users.status_history 保留供查閱舊紀錄，新事件只寫入本表
+    op.create_table(
+        'user_status_events',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('action', sa.String(50), nullable=False),
+        sa.Column('reason', sa.String(100)),
+        sa.Column('from_level', sa.Integer()),
+        sa.Column('to_level', sa.Integer()),
+        sa.Column('data', sa.JSON()),
+        sa.Column('created_at', sa.DateTime()),
+    )
+    op.create_index('idx_user_status_events_user_created', 'user_status_events', ['user_id', 'created_at'])
+    op.create_index('idx_users_group_mom_fee', 'users', ['group_mom_fee_paid_until'])
+    op.add_column('users', sa.Column('group_mom_fee_reminded_until', sa.DateTime()))
+
+def downgrade():
+    op.drop_column('users', 'group_mom_fee_reminded_until')
+    op.drop_index('idx_users_group_mom_fee', table_name='users')
+    op.drop_index('idx_user_status_events_user_created', table_name='user_status_events')
+    op.drop_table('user_status_events')
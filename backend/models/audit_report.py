@@ -4,7 +4,7 @@ from datetime import datetime
 class AuditReport(db.Model):
     __tablename__ = 'audit_reports'
     id = db.Column(db.Integer, primary_key=True, index=True)
-    settlement_id = db.Column(db.Integer, db.ForeignKey('settlements.id'), nullable=False, index=True)
+    settlement_id = db.Column(db.Integer, nullable=False, index=True)  # settlements 為分區表，不建外鍵
     admin_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
     total_amount = db.Column(db.Float, nullable=False)
     status = db.Column(db.String(20), default='pending')  # 'pending', 'approved', 'paid'
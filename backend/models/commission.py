@@ -1,16 +1,19 @@
 from backend.extensions import db
 from datetime import datetime
 from sqlalchemy import Index
+from backend.config import Config
 
 class CommissionRecord(db.Model):
     __tablename__ = 'commission_records'
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
-    order_id = db.Column(db.Integer, db.ForeignKey('orders.id'), nullable=False)
+    order_id = db.Column(db.Integer, nullable=False)  # orders 為分區表，不建外鍵
     amount = db.Column(db.Float, nullable=False)
     status = db.Column(db.String(20), nullable=False, default='pending')  # pending, approved, rejected, paid
-    level = db.Column(db.Integer, nullable=False)  # 分潤層級
+    level = db.Column(db.Integer, nullable=False)  # 計算時團媽的等級（1-3，決定分潤比例）
+    ruleset_version = db.Column(db.String(20), nullable=False,
+                                default=lambda: Config.PROFIT_RULESET_VERSION)  # 計算時採用的分潤規則集版本
     expires_at = db.Column(db.DateTime, nullable=False)
     created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     approved_at = db.Column(db.DateTime)
@@ -22,6 +25,8 @@ class CommissionRecord(db.Model):
         Index('idx_commission_order', 'order_id'),
         Index('idx_commission_expires', 'expires_at', 'status'),
         Index('idx_commission_created', 'created_at'),
+        # 冪等鍵：同一訂單、團媽與規則集版本只會有一筆分潤，重複計算時略過
+        Index('uq_commission_order_user_ruleset', 'order_id', 'user_id', 'ruleset_version', unique=True),
     )
 
     def to_dict(self):
@@ -32,6 +37,7 @@ class CommissionRecord(db.Model):
             'amount': self.amount,
             'status': self.status,
             'level': self.level,
+            'ruleset_version': self.ruleset_version,
             'expires_at': self.expires_at.isoformat() if self.expires_at else None,
             'created_at': self.created_at.isoformat(),
             'approved_at': self.approved_at.isoformat() if self.approved_at else None,
@@ -0,0 +1,55 @@
+from backend.extensions import db
+from datetime import datetime
+
+class CommissionLedgerEntry(db.Model):
+    """
+    分潤帳本（只新增不修改）
+    每筆分潤記錄的建立與狀態變動各一列：金額自 from_status 移至 to_status，
+    建立時 from_status 為空、刪除時 to_status 為空
+    """
+    __tablename__ = 'commission_ledger'
+    __table_args__ = (
+        db.Index('idx_commission_ledger_user_created', 'user_id', 'created_at'),
+        db.Index('idx_commission_ledger_commission', 'commission_id'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    commission_id = db.Column(db.Integer, nullable=False)
+    user_id = db.Column(db.Integer, nullable=False)
+    order_id = db.Column(db.Integer)
+    level = db.Column(db.Integer)
+    amount = db.Column(db.Float, nullable=False)
+    from_status = db.Column(db.String(20))
+    to_status = db.Column(db.String(20))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+class CommissionBalance(db.Model):
+    """用戶各分潤狀態的累計筆數與金額，隨帳本交易內同步更新"""
+    __tablename__ = 'commission_balances'
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'status', name='uq_commission_balance_user_status'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, nullable=False)
+    status = db.Column(db.String(20), nullable=False)
+    count = db.Column(db.Integer, default=0)
+    amount = db.Column(db.Float, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class CommissionDailyRollup(db.Model):
+    """依分潤建立日、層級與狀態彙總的筆數與金額，供管理報表以日期區間讀取"""
+    __tablename__ = 'commission_daily_rollups'
+    __table_args__ = (
+        db.UniqueConstraint('day', 'level', 'status', name='uq_commission_rollup_day_level_status'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    day = db.Column(db.Date, nullable=False)
+    level = db.Column(db.Integer, nullable=False)
+    status = db.Column(db.String(20), nullable=False)
+    count = db.Column(db.Integer, default=0)
+    amount = db.Column(db.Float, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -2,10 +2,19 @@ from backend.extensions import db
 from datetime import datetime
 
 class DownlineStats(db.Model):
+    """
+    上線對各下線（所有層級）的消費統計
+    由訂單與退款異動增量維護（見 services/downline_stats_service.py），供團媽升級檢查讀取
+    """
     __tablename__ = 'downline_stats'
+    __table_args__ = (
+        db.UniqueConstraint('mom_id', 'downline_id', name='uq_downline_stats_mom_downline'),
+        db.Index('idx_downline_stats_mom_last_order', 'mom_id', 'last_order_date'),
+        db.Index('idx_downline_stats_downline', 'downline_id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
-    mom_id = db.Column(db.String(36), db.ForeignKey('users.id'), nullable=False)
-    downline_id = db.Column(db.String(36), db.ForeignKey('users.id'), nullable=False)
+    mom_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    downline_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     order_count = db.Column(db.Integer, default=0)
     total_spent = db.Column(db.Float, default=0)
     last_order_date = db.Column(db.DateTime)
@@ -14,4 +23,4 @@ class DownlineStats(db.Model):
 
     # 關聯
     mom = db.relationship('User', foreign_keys=[mom_id], backref='downline_stats')
-    downline = db.relationship('User', foreign_keys=[downline_id], backref='upline_stats')
\ No newline at end of file
+    downline = db.relationship('User', foreign_keys=[downline_id], backref='upline_stats')
@@ -2,6 +2,7 @@ from backend.extensions import db
 from datetime import datetime
 from sqlalchemy import Index
 from sqlalchemy.dialects.postgresql import JSON
+from backend.utils import partitioning  # noqa: F401 (分區表在 SQLite 的建表規則)
 
 class Order(db.Model):
     __tablename__ = 'orders'
@@ -11,11 +12,15 @@ class Order(db.Model):
         Index('idx_orders_settled', 'settled_at', 'status'),
         Index('idx_orders_user_status', 'user_id', 'status'),
         Index('idx_orders_referrer', 'referrer_id', 'referrer_qualified'),
+        Index('idx_orders_settlement_run', 'settlement_run_id', 'status'),
         {'extend_existing': True}
     )
     
+    __mapper_args__ = {'primary_key': ['id']}
+
     # 基本訂單信息
-    id = db.Column(db.Integer, primary_key=True)
+    # 資料表主鍵為 (id, created_at)，對應 PostgreSQL 依 created_at 分區；ORM 身分仍只用 id
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     product_id = db.Column(db.Integer, db.ForeignKey('products.id'), nullable=False)
     quantity = db.Column(db.Integer, nullable=False)
@@ -29,6 +34,8 @@ class Order(db.Model):
     expected_settlement_date = db.Column(db.DateTime)
     calculation_verified = db.Column(db.Boolean, default=False)
     calculation_error_log = db.Column(db.Text)
+    profit_ruleset_version = db.Column(db.String(20))  # 計算分潤時採用的規則集版本
+    settlement_run_id = db.Column(db.Integer, db.ForeignKey('settlement_runs.id'))  # 已納入的結算執行
     
     # 分潤明細
     profit_breakdown = db.Column(JSON)  # 存储详细的分润计算结果
@@ -61,6 +68,9 @@ class Order(db.Model):
     supplier_paid = db.Column(db.Boolean, default=False)
     supplier_paid_at = db.Column(db.DateTime)
     
+    # 退貨相關
+    return_status = db.Column(db.String(20))  # requested, returned, exchanged
+    
     # 物流相關
     logistics_company_id = db.Column(db.Integer, db.ForeignKey('logistics_companies.id'))
     tracking_number = db.Column(db.String(50))
@@ -89,7 +99,7 @@ class Order(db.Model):
     # 時間戳記
     shipped_at = db.Column(db.DateTime)  # 出貨時間
     received_at = db.Column(db.DateTime)  # 收貨時間
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, primary_key=True, default=datetime.utcnow)  # 分區鍵
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
       # 關聯
     product = db.relationship('Product')
@@ -101,52 +111,56 @@ class Order(db.Model):
     
     # 添加索引（已合併至 __table_args__ 上方）
     
-    def calculate_profits(self):
-        """計算訂單的所有利潤分配"""
+    def calculate_profits(self, ruleset_version=None):
+        """
+        計算訂單的所有利潤分配
+        未指定版本時沿用訂單原有的規則集版本，新訂單採用目前版本；
+        金額為單價乘以數量時套用快取的單位分潤範本（見 ProfitRuleEngine.evaluate）
+        """
         from backend.utils.profit_calculator import ProfitCalculator
-        
-        # 計算基本利潤
-        basic_profits = ProfitCalculator.calculate_order_profit(
+        from backend.utils.profit_rules import ProfitRuleEngine
+
+        profit_breakdown = ProfitRuleEngine.evaluate(
             selling_price=self.total_price,
-            cost=self.cost
-        )
-        
-        # 計算團媽分潤
-        mom_qualifications = {
-            'big': bool(self.big_mom_id),
-            'middle': bool(self.middle_mom_id),
-            'small': bool(self.small_mom_id)
-        }
-        
-        mom_profits = ProfitCalculator.calculate_mom_profits(
-            basic_profits['distributable_profit'],
-            mom_qualifications
+            cost=self.cost,
+            has_big_mom=bool(self.big_mom_id),
+            has_middle_mom=bool(self.middle_mom_id),
+            has_small_mom=bool(self.small_mom_id),
+            has_referrer=bool(self.referrer_id),
+            version=ruleset_version or self.profit_ruleset_version,
+            quantity=self.quantity
         )
         
-        # 合併所有利潤資訊
-        profit_breakdown = {**basic_profits, **mom_profits}
-        
         # 驗證計算結果
-        is_valid = ProfitCalculator.verify_calculation(self.total_price, profit_breakdown)
-        
-        if not is_valid:
+        if not ProfitCalculator.verify_breakdown(self.total_price, profit_breakdown):
             self.calculation_verified = False
             self.calculation_error_log = "金流計算驗證失敗"
             return False
         
-        # 更新訂單資訊
-        self.profit_breakdown = profit_breakdown
-        self.tax_amount = profit_breakdown['tax_amount']
-        self.platform_fee = profit_breakdown['platform_fee']
-        self.supplier_fee = profit_breakdown['supplier_fee']
-        self.supplier_amount = profit_breakdown['supplier_amount']
-        self.referrer_bonus_amount = profit_breakdown['referrer_bonus']
-        self.big_mom_amount = profit_breakdown['big_mom_profit']
-        self.middle_mom_amount = profit_breakdown['middle_mom_profit']
-        self.small_mom_amount = profit_breakdown['small_mom_profit']
-        self.platform_profit = profit_breakdown['platform_profit'] + profit_breakdown['platform_extra_profit']
-        
-        self.profit_calculated_at = datetime.utcnow()
-        self.calculation_verified = True
-        
-        return True
\ No newline at end of file
+        self.apply_profit_breakdown(profit_breakdown)
+        return True
+
+    @staticmethod
+    def profit_columns(profit_breakdown):
+        """分潤明細對應的訂單欄位值（批次回寫時共用）"""
+        return {
+            'profit_breakdown': profit_breakdown,
+            'tax_amount': profit_breakdown['tax_amount'],
+            'platform_fee': profit_breakdown['platform_fee'],
+            'supplier_fee': profit_breakdown['supplier_fee'],
+            'supplier_amount': profit_breakdown['supplier_amount'],
+            'referrer_bonus_amount': profit_breakdown['referrer_bonus'],
+            'big_mom_amount': profit_breakdown['big_mom_profit'],
+            'middle_mom_amount': profit_breakdown['middle_mom_profit'],
+            'small_mom_amount': profit_breakdown['small_mom_profit'],
+            'platform_profit': profit_breakdown['platform_profit'] + profit_breakdown['platform_extra_profit'],
+            'profit_ruleset_version': profit_breakdown['ruleset_version'],
+            'profit_calculated_at': datetime.utcnow(),
+            'calculation_verified': True,
+            'calculation_error_log': None
+        }
+
+    def apply_profit_breakdown(self, profit_breakdown):
+        """更新訂單分潤資訊"""
+        for column, value in Order.profit_columns(profit_breakdown).items():
+            setattr(self, column, value)
@@ -6,7 +6,7 @@ class PaymentTransaction(db.Model):
 
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.String(36), db.ForeignKey('users.id'), nullable=False)
-    order_id = db.Column(db.Integer, db.ForeignKey('orders.id'))
+    order_id = db.Column(db.Integer)  # orders 為分區表，不建外鍵
     collaboration_id = db.Column(db.Integer, db.ForeignKey('collaboration_proposals.id'))
     commission_id = db.Column(db.Integer, db.ForeignKey('commission_records.id'))
     type = db.Column(db.String(20), nullable=False)  # order, collaboration, commission, refund, fee
@@ -0,0 +1,22 @@
+from backend.extensions import db
+from datetime import datetime
+
+class PlatformSummary(db.Model):
+    """
+    平台金流總覽（依結算期別累計）
+    每期別分為多個分片列，各連線固定寫入其中一列，期別與全平台合計於讀取時加總
+    """
+    __tablename__ = 'platform_summaries'
+    __table_args__ = (
+        db.UniqueConstraint('period', 'shard', name='uq_platform_summaries_period_shard'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    period = db.Column(db.String(8), nullable=False)  # YYYYMMa/b
+    shard = db.Column(db.Integer, nullable=False, default=0)
+    total_revenue = db.Column(db.Float, default=0)
+    settled_amount = db.Column(db.Float, default=0)
+    unsettled_amount = db.Column(db.Float, default=0)
+    platform_profit = db.Column(db.Float, default=0)
+    tax_amount = db.Column(db.Float, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -0,0 +1,16 @@
+from backend.extensions import db
+
+class ReferralClosure(db.Model):
+    """
+    推薦關係閉包表：每位用戶與其所有上線（含自身，depth=0）各一列
+    depth 為 descendant 往上經過的推薦層數，由 referral_events 隨 User.referrer_id 增量維護
+    """
+    __tablename__ = 'referral_closure'
+    __table_args__ = (
+        db.Index('idx_referral_closure_descendant', 'descendant_id', 'depth'),
+        db.Index('idx_referral_closure_ancestor', 'ancestor_id', 'depth'),
+    )
+
+    ancestor_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
+    descendant_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
+    depth = db.Column(db.Integer, nullable=False)
@@ -4,7 +4,7 @@ from datetime import datetime
 class Refund(db.Model):
     __tablename__ = 'refunds'
     id = db.Column(db.Integer, primary_key=True, index=True)
-    order_id = db.Column(db.Integer, db.ForeignKey('orders.id'), nullable=False, index=True)
+    order_id = db.Column(db.Integer, nullable=False, index=True)  # orders 為分區表，不建外鍵
     user_id = db.Column(db.String(36), db.ForeignKey('users.id'), nullable=False, index=True)
     amount = db.Column(db.Float, nullable=False)
     reason = db.Column(db.Text)
@@ -18,6 +18,6 @@ class Refund(db.Model):
     admin_note = db.Column(db.Text)  # 管理員處理備註
     
     # 關聯
-    order = db.relationship('Order', backref='refunds')
+    order = db.relationship('Order', primaryjoin='foreign(Refund.order_id) == Order.id', backref='refunds')
     user = db.relationship('User', foreign_keys=[user_id], backref='refunds')
     processor = db.relationship('User', foreign_keys=[processed_by], backref='processed_refunds')
\ No newline at end of file
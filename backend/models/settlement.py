@@ -1,12 +1,18 @@
 from backend.extensions import db
 from datetime import datetime
 from sqlalchemy.dialects.postgresql import JSON
+from backend.utils import partitioning  # noqa: F401 (分區表在 SQLite 的建表規則)
 
 class Settlement(db.Model):
     __tablename__ = 'settlements'
+    __table_args__ = (
+        db.Index('idx_settlements_status_created', 'status', 'created_at'),
+    )
+    __mapper_args__ = {'primary_key': ['id']}
     
-    id = db.Column(db.Integer, primary_key=True)
-    period = db.Column(db.String(8), nullable=False)  # 格式：YYYYMMa/b，例如：202501a
+    # 資料表主鍵為 (id, period)，對應 PostgreSQL 依 period 分區；ORM 身分仍只用 id
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    period = db.Column(db.String(8), primary_key=True)  # 格式：YYYYMMa/b，例如：202501a（分區鍵）
     settlement_type = db.Column(db.String(20), nullable=False)  # platform, supplier, mom
     user_id = db.Column(db.String(36), db.ForeignKey('users.id'), nullable=False)
     
@@ -18,13 +24,21 @@ class Settlement(db.Model):
     
     # 訂單相關
     order_count = db.Column(db.Integer, nullable=False)
-    order_details = db.Column(JSON)  # 訂單ID和金額列表
+    order_details = db.Column(JSON)  # 舊版訂單ID和金額列表，新結算單改寫入 settlement_items
     
     # 狀態相關
     status = db.Column(db.String(20), default='pending')  # pending, confirmed, paid, disputed
     is_confirmed = db.Column(db.Boolean, default=False)
     confirmed_at = db.Column(db.DateTime)
     paid_at = db.Column(db.DateTime)
+
+    # 審核相關
+    approved_at = db.Column(db.DateTime)
+    approved_by = db.Column(db.Integer)
+    rejected_at = db.Column(db.DateTime)
+    rejected_by = db.Column(db.Integer)
+    reject_reason = db.Column(db.Text)
+    is_expired = db.Column(db.Boolean, default=False)
     
     # 時間戳記
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -37,7 +51,7 @@ class UnsettledOrder(db.Model):
     __tablename__ = 'unsettled_orders'
     
     id = db.Column(db.Integer, primary_key=True)
-    order_id = db.Column(db.Integer, db.ForeignKey('orders.id'), nullable=False)
+    order_id = db.Column(db.Integer, nullable=False)  # orders 為分區表，不建外鍵
     expected_settlement_date = db.Column(db.DateTime, nullable=False)
     max_retention_date = db.Column(db.DateTime, nullable=False)
     alert_level = db.Column(db.String(10), default='normal')  # normal, high
@@ -47,13 +61,14 @@ class UnsettledOrder(db.Model):
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     # 關聯
-    order = db.relationship('Order', backref=db.backref('unsettled_record', uselist=False))
+    order = db.relationship('Order', primaryjoin='foreign(UnsettledOrder.order_id) == Order.id',
+                            backref=db.backref('unsettled_record', uselist=False))
 
 class SettlementStatement(db.Model):
     __tablename__ = 'settlement_statements'
     
     id = db.Column(db.Integer, primary_key=True)
-    settlement_id = db.Column(db.Integer, db.ForeignKey('settlements.id'), nullable=False)
+    settlement_id = db.Column(db.Integer, nullable=False)  # settlements 為分區表，不建外鍵
     statement_type = db.Column(db.String(20), nullable=False)  # platform, supplier, mom
     
     # 對帳單內容
@@ -75,14 +90,23 @@ class SettlementStatement(db.Model):
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     # 關聯
-    settlement = db.relationship('Settlement', backref=db.backref('statements', lazy='dynamic'))
+    settlement = db.relationship(
+        'Settlement', primaryjoin='foreign(SettlementStatement.settlement_id) == Settlement.id',
+        backref=db.backref('statements', lazy='dynamic')
+    )
 
 class SettlementItem(db.Model):
+    """結算明細列：每張結算單涵蓋的訂單與分潤金額"""
     __tablename__ = 'settlement_items'
+    __table_args__ = (
+        db.Index('idx_settlement_items_settlement', 'settlement_id', 'order_id'),
+        db.Index('idx_settlement_items_order', 'order_id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
-    settlement_id = db.Column(db.Integer, db.ForeignKey('settlements.id'), nullable=False)
-    order_id = db.Column(db.Integer, db.ForeignKey('orders.id'), nullable=False)
+    # settlements、orders 為分區表，不建外鍵
+    settlement_id = db.Column(db.Integer, nullable=False)
+    order_id = db.Column(db.Integer, nullable=False)
     amount = db.Column(db.Float, nullable=False)
     details = db.Column(JSON)
     status = db.Column(db.String(20), default='pending')
@@ -90,5 +114,48 @@ class SettlementItem(db.Model):
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
     # 關聯
-    settlement = db.relationship('Settlement', backref=db.backref('items', lazy='dynamic'))
-    order = db.relationship('Order', backref=db.backref('settlement_item', uselist=False))
\ No newline at end of file
+    settlement = db.relationship('Settlement', primaryjoin='foreign(SettlementItem.settlement_id) == Settlement.id',
+                                 backref=db.backref('items', lazy='dynamic'))
+    order = db.relationship('Order', primaryjoin='foreign(SettlementItem.order_id) == Order.id',
+                            backref=db.backref('settlement_items', lazy='dynamic'))
+
+class SettlementRun(db.Model):
+    """結算執行紀錄：分批處理訂單並於每批後記錄檢查點，中斷後可從檢查點續跑"""
+    __tablename__ = 'settlement_runs'
+
+    id = db.Column(db.Integer, primary_key=True)
+    period = db.Column(db.String(8), nullable=False)
+    status = db.Column(db.String(20), default='running')  # running, failed, completed
+
+    # 檢查點
+    chunk_size = db.Column(db.Integer, nullable=False)
+    last_order_id = db.Column(db.Integer, default=0)
+    processed_orders = db.Column(db.Integer, default=0)
+    processed_chunks = db.Column(db.Integer, default=0)
+    error_message = db.Column(db.Text)
+
+    # 每批處理後更新，執行中但心跳逾時視為 worker 已中斷
+    heartbeat_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, default=datetime.utcnow)
+    completed_at = db.Column(db.DateTime)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    # 關聯
+    totals = db.relationship('SettlementRunTotal', backref='run', lazy='dynamic')
+
+
+class SettlementRunTotal(db.Model):
+    """結算執行中各 (結算類型, 用戶) 的累計小計，每批處理後累加"""
+    __tablename__ = 'settlement_run_totals'
+    __table_args__ = (
+        db.UniqueConstraint('run_id', 'settlement_type', 'user_id', name='uq_settlement_run_totals_key'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    run_id = db.Column(db.Integer, db.ForeignKey('settlement_runs.id'), nullable=False)
+    settlement_type = db.Column(db.String(20), nullable=False)
+    user_id = db.Column(db.String(36), nullable=False)
+    total_amount = db.Column(db.Float, default=0)
+    order_count = db.Column(db.Integer, default=0)
+    platform_fee = db.Column(db.Float, default=0)
+    tax_amount = db.Column(db.Float, default=0)
@@ -1,11 +1,16 @@
 from backend.extensions import db
 from datetime import datetime
 from werkzeug.security import generate_password_hash, check_password_hash
-from .commission_record import CommissionRecord
+from .commission import CommissionRecord
+from .referral_closure import ReferralClosure
 
 class User(db.Model):
     __tablename__ = 'users'
-    __table_args__ = ({'extend_existing': True},)
+    __table_args__ = (
+        db.Index('idx_users_referrer', 'referrer_id'),
+        db.Index('idx_users_group_mom_fee', 'group_mom_fee_paid_until'),
+        {'extend_existing': True},
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(80), unique=True, nullable=False)
@@ -20,8 +25,14 @@ class User(db.Model):
     group_mom_applied_at = db.Column(db.DateTime)
     group_mom_approved_at = db.Column(db.DateTime)
     group_mom_fee_paid_until = db.Column(db.DateTime)  # 團媽會費有效期
+    group_mom_fee_reminded_until = db.Column(db.DateTime)  # 已寄送到期提醒的會費有效期（避免重複提醒）
     supplier_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)  # 供應商副手關聯的供應商
-    permissions = db.Column(db.JSON)  # 供應商副手的權限設定    # 關聯
+    permissions = db.Column(db.JSON)  # 供應商副手的權限設定
+    # 直屬下線計數（由 flush 事件增量維護，見 ReferralService.referral_counter_contribution）
+    referral_count = db.Column(db.Integer, nullable=False, default=0)  # 啟用中的直屬下線
+    small_mom_referral_count = db.Column(db.Integer, nullable=False, default=0)  # 直屬下線中的小團媽
+    middle_mom_referral_count = db.Column(db.Integer, nullable=False, default=0)  # 直屬下線中的中團媽
+    big_mom_referral_count = db.Column(db.Integer, nullable=False, default=0)  # 直屬下線中的大團媽    # 關聯
     referrer = db.relationship('User', remote_side=[id], backref='referrals', foreign_keys=[referrer_id])
     supplier = db.relationship('User', remote_side=[id], backref='assistants', foreign_keys=[supplier_id])    # 訂單關聯
     orders = db.relationship('Order', foreign_keys='[Order.user_id]', backref=db.backref('buyer', lazy=True))
@@ -46,16 +57,16 @@ class User(db.Model):
         """獲取下線會員數量"""
         if self.role != 'member' or self.group_mom_level == 0:
             return 0
-        return len([r for r in self.referrals if r.is_active])
+        return self.referral_count or 0
         
     def can_upgrade_to_group_mom(self):
         """檢查是否符合升級團媽條件"""
         if self.group_mom_level == 0:
             return self.get_referral_count() >= 50  # 小團媽需要50個下線
         elif self.group_mom_level == 1:
-            return len([r for r in self.referrals if r.group_mom_level == 1]) >= 10  # 中團媽需要10個小團媽
+            return (self.small_mom_referral_count or 0) >= 10  # 中團媽需要10個小團媽
         elif self.group_mom_level == 2:
-            return len([r for r in self.referrals if r.group_mom_level == 2]) >= 10  # 大團媽需要10個中團媽
+            return (self.middle_mom_referral_count or 0) >= 10  # 大團媽需要10個中團媽
         return False
 
     def is_group_mom_fee_valid(self):
@@ -0,0 +1,21 @@
+from backend.extensions import db
+from datetime import datetime
+
+class UserStatusEvent(db.Model):
+    """
+    用戶狀態異動事件（只新增不修改）
+    取代 users.status_history JSON 逐筆附加，批次流程以單一 INSERT 寫入
+    """
+    __tablename__ = 'user_status_events'
+    __table_args__ = (
+        db.Index('idx_user_status_events_user_created', 'user_id', 'created_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, nullable=False)
+    action = db.Column(db.String(50), nullable=False)  # deactivate, group_mom_upgrade, downgrade
+    reason = db.Column(db.String(100))
+    from_level = db.Column(db.Integer)
+    to_level = db.Column(db.Integer)
+    data = db.Column(db.JSON)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -1,7 +1,8 @@
 from flask import Blueprint, jsonify, request
 from models.user import User
-from models.commission import CommissionRecord
 from extensions import db
+from services.commission_ledger_service import CommissionLedgerService
+from services.downline_query_service import DownlineQueryService
 from decorators.auth import admin_required
 from datetime import datetime
 from sqlalchemy import func
@@ -76,49 +77,40 @@ def downgrade_member(user_id):
             'message': '降級失敗，請稍後再試'
         }), 500
 
-@bp.route('/reports/commissions', methods=['GET'])
+@bp.route('/members/<int:user_id>/downlines', methods=['GET'])
 @admin_required
-def commission_reports():
-    start_date = request.args.get('start_date')
-    end_date = request.args.get('end_date')
-    
-    query = CommissionRecord.query
-    
-    if start_date:
-        query = query.filter(CommissionRecord.created_at >= start_date)
-    if end_date:
-        query = query.filter(CommissionRecord.created_at <= end_date)
-        
-    # 統計各狀態的分潤總額
-    status_stats = db.session.query(
-        CommissionRecord.status,
-        func.count().label('count'),
-        func.sum(CommissionRecord.amount).label('total_amount')
-    ).group_by(CommissionRecord.status).all()
-    
-    # 統計各等級的分潤總額
-    level_stats = db.session.query(
-        CommissionRecord.level,
-        func.count().label('count'),
-        func.sum(CommissionRecord.amount).label('total_amount')
-    ).group_by(CommissionRecord.level).all()
-    
+def member_downlines(user_id):
+    max_depth = request.args.get('max_depth', type=int)
+    page = int(request.args.get('page', 1))
+    per_page = min(int(request.args.get('per_page', 20)), 100)
     return jsonify({
         'success': True,
         'data': {
-            'status_statistics': [{
-                'status': stat[0],
-                'count': stat[1],
-                'total_amount': float(stat[2] or 0)
-            } for stat in status_stats],
-            'level_statistics': [{
-                'level': stat[0],
-                'count': stat[1],
-                'total_amount': float(stat[2] or 0)
-            } for stat in level_stats]
+            'levels': DownlineQueryService.get_level_summary(user_id, max_depth),
+            'downlines': DownlineQueryService.get_downlines(user_id, max_depth, page, per_page)
         }
     })
 
+@bp.route('/reports/commissions', methods=['GET'])
+@admin_required
+def commission_reports():
+    # 讀取分潤帳本維護的每日彙總，不再掃描 commission_records
+    try:
+        start_date = request.args.get('start_date')
+        end_date = request.args.get('end_date')
+        start_date = datetime.fromisoformat(start_date).date() if start_date else None
+        end_date = datetime.fromisoformat(end_date).date() if end_date else None
+    except ValueError:
+        return jsonify({
+            'success': False,
+            'message': '日期格式錯誤'
+        }), 400
+
+    return jsonify({
+        'success': True,
+        'data': CommissionLedgerService.get_report(start_date, end_date)
+    })
+
 @bp.route('/reports/members', methods=['GET'])
 @admin_required
 def member_reports():
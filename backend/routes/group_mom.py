@@ -3,6 +3,7 @@ from models.user import User
 from models.payment import Payment
 from extensions import db
 from decorators.auth import login_required
+from services.downline_query_service import DownlineQueryService
 from datetime import datetime
 
 bp = Blueprint('group_mom', __name__)
@@ -84,6 +85,36 @@ def verify_payment():
             'message': '驗證失敗，請稍後再試'
         }), 500
 
+@bp.route('/downlines/summary', methods=['GET'])
+@login_required
+def downline_summary():
+    max_depth = request.args.get('max_depth', type=int)
+    return jsonify({
+        'success': True,
+        'data': DownlineQueryService.get_level_summary(request.current_user.id, max_depth)
+    })
+
+@bp.route('/downlines', methods=['GET'])
+@login_required
+def list_downlines():
+    max_depth = request.args.get('max_depth', type=int)
+    page = int(request.args.get('page', 1))
+    per_page = min(int(request.args.get('per_page', 20)), 100)
+    return jsonify({
+        'success': True,
+        'data': DownlineQueryService.get_downlines(request.current_user.id, max_depth, page, per_page)
+    })
+
+@bp.route('/downlines/subteams', methods=['GET'])
+@login_required
+def list_subteams():
+    page = int(request.args.get('page', 1))
+    per_page = min(int(request.args.get('per_page', 20)), 100)
+    return jsonify({
+        'success': True,
+        'data': DownlineQueryService.get_subteams(request.current_user.id, page, per_page)
+    })
+
 @bp.route('/admin/applications', methods=['GET'])
 @login_required
 def list_applications():
@@ -12,7 +12,7 @@ bp = Blueprint('settlement', __name__)
 @admin_required
 def get_summary():
     """獲取結算總覽"""
-    summary = SettlementService.get_platform_summary()
+    summary = SettlementService.get_platform_summary(request.args.get('period'))
     return jsonify(summary)
 
 @bp.route('/settlements', methods=['GET'])
@@ -77,6 +77,7 @@ def get_settlement_statement(settlement_id):
         'tax_details': statement.tax_details,
         'shipping_details': statement.shipping_details,
         'return_deductions': statement.return_deductions,
+        'order_lines': SettlementService.get_settlement_lines(settlement_id),
         'dispute_deadline': statement.dispute_deadline.isoformat(),
         'is_disputed': statement.is_disputed,
         'dispute_details': statement.dispute_details,
@@ -131,12 +132,21 @@ def dispute_settlement(settlement_id):
 
 @bp.route('/settlements/process-payment', methods=['POST'])
 @admin_required
-def process_payment(settlement_id):
-    """處理撥款"""
+def process_payment():
+    """處理撥款（可一次撥款多張結算單）"""
     try:
-        if SettlementService.process_payment(settlement_id):
-            return jsonify({'message': '撥款已處理完成'})
-        return jsonify({'error': '無法處理撥款'}), 400
+        data = request.get_json() or {}
+        settlement_ids = data.get('settlement_ids') or (
+            [data['settlement_id']] if data.get('settlement_id') else []
+        )
+        if not settlement_ids:
+            return jsonify({'error': '必須提供結算單ID'}), 400
+
+        result = SettlementService.process_payments(settlement_ids)
+        # 已撥款的結算單視為成功，重試同一請求不會回傳錯誤
+        if result['settlement_count'] or result['already_paid_ids']:
+            return jsonify({'message': '撥款已處理完成', 'result': result})
+        return jsonify({'error': '無法處理撥款', 'result': result}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 400
 
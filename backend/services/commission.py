@@ -1,68 +1,17 @@
-from models.user import User
-from models.order import Order
-from models.commission import CommissionRecord
-from extensions import db
-from datetime import datetime, timedelta
+from backend.models.commission import CommissionRecord
+from backend.services.commission_calculation_service import CommissionCalculationService
+from backend.services.commission_ledger_service import CommissionLedgerService
+from backend.extensions import db
+from datetime import datetime
 
 class CommissionService:
-    # 分潤比例設定
-    COMMISSION_RATES = {
-        1: 0.05,  # 一級團媽 5%
-        2: 0.03,  # 二級團媽 3%
-        3: 0.02   # 三級團媽 2%
-    }
-    
     @staticmethod
     def calculate_commission(order_id):
         """
         計算訂單的分潤
+        與批次處理共用同一套團媽分潤記錄與冪等鍵（見 CommissionCalculationService.build_commission_records）
         """
-        order = Order.query.get(order_id)
-        if not order or order.status != 'completed':
-            return False
-            
-        buyer = User.query.get(order.user_id)
-        if not buyer:
-            return False
-            
-        # 找出上線團媽
-        current_user = buyer
-        level = 1
-        commission_records = []
-        
-        while current_user.referrer_id and level <= 3:
-            referrer = User.query.get(current_user.referrer_id)
-            if not referrer or referrer.role != 'group_mom':
-                current_user = referrer
-                continue
-                
-            # 計算分潤金額
-            commission_amount = order.total_amount * CommissionService.COMMISSION_RATES[level]
-            
-            # 創建分潤記錄
-            commission_record = CommissionRecord(
-                user_id=referrer.id,
-                order_id=order.id,
-                amount=commission_amount,
-                level=level,
-                expires_at=datetime.utcnow() + timedelta(days=30)  # 分潤 30 天後過期
-            )
-            
-            commission_records.append(commission_record)
-            current_user = referrer
-            level += 1
-            
-        # 批量保存分潤記錄
-        if commission_records:
-            try:
-                db.session.bulk_save_objects(commission_records)
-                db.session.commit()
-                return True
-            except Exception as e:
-                db.session.rollback()
-                return False
-        
-        return True
+        return CommissionCalculationService.calculate_and_record_commission(order_id)['success']
     
     @staticmethod
     def approve_commission(commission_id):
@@ -134,4 +83,11 @@ class CommissionService:
             
         return query.order_by(CommissionRecord.created_at.desc()).paginate(
             page=page, per_page=per_page, error_out=False
-        )
\ No newline at end of file
+        )
+
+    @staticmethod
+    def get_user_commission_balances(user_id):
+        """
+        獲取用戶各狀態的分潤筆數與金額（讀取帳本維護的餘額）
+        """
+        return CommissionLedgerService.get_balances(user_id)
@@ -1,94 +1,215 @@
 from decimal import Decimal
 from typing import Dict, List, Optional
 from datetime import datetime, timedelta
-from extensions import db
-from models.order import Order
-from models.commission import CommissionRecord
-from models.user import User
-from models.notification import Notification
-from backend.utils.profit_calculator2 import ProfitCalculator
-from services.group_mom_service import GroupMomService
+from sqlalchemy import insert, select, update
+from sqlalchemy.orm import aliased
+from backend.config import Config
+from backend.extensions import db
+from backend.models.order import Order
+from backend.models.commission import CommissionRecord
+from backend.models.user import User
+from backend.models.notification import Notification
+from backend.services.commission_ledger_service import CommissionLedgerService, ledger_entry
+from backend.services.group_mom_service import GroupMomService
+from backend.services.settlement_optimization_service import SettlementOptimizationService
+from backend.utils.bulk_ops import dialect_insert, update_by_id
+from backend.utils.profit_rules import ProfitRuleEngine
+
+# 分潤記錄的有效期間
+COMMISSION_VALID_DAYS = 30
+# 訂單上的團媽欄位
+MOM_FIELDS = ('big_mom_id', 'middle_mom_id', 'small_mom_id')
+# 批次結果保留的錯誤訊息上限
+ERROR_LIMIT = 100
+# 分潤記錄的冪等鍵（對應唯一索引 uq_commission_order_user_ruleset）
+COMMISSION_KEY = ('order_id', 'user_id', 'ruleset_version')
+
 
 class CommissionCalculationService:
+    @staticmethod
+    def process_pending_commissions(chunk_size: Optional[int] = None, max_workers: int = 1) -> Dict:
+        """
+        批次處理已完成但尚未計算分潤的訂單
+        依訂單 ID 分批：每批重算訂單利潤、一次查詢取得團媽等級與會費狀態、
+        批次寫入分潤記錄與通知並回寫分潤紀錄，每批提交一次。
+        每批以 FOR UPDATE SKIP LOCKED 認領訂單，多個 worker 同時執行時各自處理不同訂單，
+        分潤記錄另以冪等鍵去重；認領不限建立月份、會掃描每個分區，
+        認領時一併取回分區鍵，之後回寫分潤紀錄時只探測訂單所在分區
+        """
+        chunk_size = chunk_size or Config.COMMISSION_CHUNK_SIZE
+        summary = {
+            'processed_count': 0,
+            'failed_count': 0,
+            'commission_count': 0,
+            'total_commission': 0.0,
+            'chunks': 0,
+            'errors': []
+        }
+        last_id = 0
+        while True:
+            claimed = dict(db.session.execute(
+                select(Order.id, Order.created_at).where(
+                    Order.status == 'completed',
+                    Order.profit_distribution_log.is_(None),
+                    Order.id > last_id
+                ).order_by(Order.id).limit(chunk_size).with_for_update(skip_locked=True)
+            ).all())
+            if not claimed:
+                break
+            order_ids = list(claimed)
+            last_id = order_ids[-1]
+
+            try:
+                result = CommissionCalculationService._process_commission_chunk(claimed, max_workers)
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                result = {
+                    'processed': 0,
+                    'failed': len(order_ids),
+                    'commission_count': 0,
+                    'total_commission': 0.0,
+                    'errors': [f'訂單 {order_ids[0]}-{order_ids[-1]} 分潤計算失敗：{str(e)}']
+                }
+
+            summary['chunks'] += 1
+            summary['processed_count'] += result['processed']
+            summary['failed_count'] += result['failed']
+            summary['commission_count'] += result['commission_count']
+            summary['total_commission'] += result['total_commission']
+            summary['errors'].extend(result['errors'][:ERROR_LIMIT - len(summary['errors'])])
+        return summary
+
+    @staticmethod
+    def _process_commission_chunk(claimed: Dict, max_workers: int = 1) -> Dict:
+        """
+        單批訂單的分潤計算與寫入（不提交）
+        :param claimed: {訂單 ID: 建立時間}，建立時間為訂單分區鍵，回寫分潤紀錄時只探測所在分區
+        """
+        order_ids = list(claimed)
+        recompute = SettlementOptimizationService.process_settlement_batch(
+            order_ids, max_workers=max_workers, commit=False
+        )
+        failed = set(recompute['failed_order_ids'])
+
+        now = datetime.utcnow()
+        records, logs = CommissionCalculationService.build_commission_records(
+            [order_id for order_id in order_ids if order_id not in failed], now
+        )
+        inserted = CommissionCalculationService.insert_commission_records(records, now)
+        if logs:
+            update_by_id(Order, [
+                {'id': order_id, 'created_at': claimed[order_id], 'profit_distribution_log': log}
+                for order_id, log in logs.items()
+            ])
+
+        return {
+            'processed': len(logs),
+            'failed': len(failed),
+            'commission_count': len(inserted),
+            'total_commission': sum(record['amount'] for record in inserted),
+            'errors': recompute['errors']
+        }
+
+    @staticmethod
+    def build_commission_records(order_ids: List, now=None):
+        """
+        依訂單上的團媽欄位（大、中、小團媽）與團媽目前等級的分潤比例產生分潤記錄，
+        會費已過期的團媽不分潤；所有分潤寫入路徑共用，確保重複或重疊計算時產生相同的冪等鍵與金額
+        :return: (分潤記錄列表, {訂單 ID: 分潤紀錄})
+        """
+        now = now or datetime.utcnow()
+        if not order_ids:
+            return [], {}
+        # 訂單與三位團媽的等級、會費狀態一次取得
+        moms = [aliased(User) for _ in MOM_FIELDS]
+        query = select(Order.id, Order.total_price, Order.profit_ruleset_version)
+        for field, mom in zip(MOM_FIELDS, moms):
+            query = query.add_columns(
+                mom.id, mom.group_mom_level, (mom.group_mom_fee_paid_until > now)
+            ).outerjoin(mom, mom.id == getattr(Order, field))
+        rows = db.session.execute(query.where(Order.id.in_(list(order_ids))).order_by(Order.id)).all()
+
+        expires_at = now + timedelta(days=COMMISSION_VALID_DAYS)
+        records = []
+        logs = {}
+        default_version = ProfitRuleEngine.current_version()
+        for row in rows:
+            order_id, total_price, ruleset_version = row[0], row[1], row[2] or default_version
+            order_records = []
+            for index in range(len(MOM_FIELDS)):
+                mom_id, level, fee_valid = row[3 + index * 3:6 + index * 3]
+                # 同一團媽重複出現在多個欄位時只分潤一次（冪等鍵含 user_id）
+                if mom_id is None or not fee_valid or any(r['user_id'] == mom_id for r in order_records):
+                    continue
+                order_records.append({
+                    'user_id': mom_id,
+                    'order_id': order_id,
+                    'amount': GroupMomService.commission_amount(total_price, level),
+                    'level': level,
+                    'ruleset_version': ruleset_version,
+                    'status': 'pending',
+                    'expires_at': expires_at,
+                    'created_at': now
+                })
+            records.extend(order_records)
+            logs[order_id] = {
+                'calculated_at': now.isoformat(),
+                'commission_records': [
+                    {'user_id': r['user_id'], 'amount': r['amount'], 'level': r['level']} for r in order_records
+                ]
+            }
+        return records, logs
+
     @staticmethod
     def calculate_and_record_commission(order_id: str) -> Dict:
         """
         計算並記錄訂單的分潤
+        鎖定訂單列後才計算，與批次處理或其他 worker 重疊時，已計算的訂單直接略過
         """
-        order = Order.query.get(order_id)
+        order = db.session.execute(
+            select(Order).where(Order.id == order_id).with_for_update()
+        ).scalar_one_or_none()
         if not order or order.status != 'completed':
+            db.session.rollback()
             return {
                 'success': False,
                 'message': '訂單不存在或未完成'
             }
+        if order.profit_distribution_log is not None:
+            db.session.rollback()
+            return {
+                'success': True,
+                'message': '訂單分潤已計算，略過',
+                'total_commission': 0.0,
+                'commission_count': 0
+            }
 
         try:
-            # 計算訂單利潤
-            profit_result = ProfitCalculator.calculate_order_profit(
-                selling_price=order.total_price,
-                cost=order.cost,
-                user_id=order.user_id
-            )
-            
-            # 取得團媽分潤資訊
-            commission_result = GroupMomService.calculate_commission(order_id)
-            if not commission_result['success']:
-                return commission_result
-
-            commission_records = []
-            # 創建分潤記錄
-            for commission in commission_result['commission_records']:
-                record = CommissionRecord(
-                    user_id=commission['user_id'],
-                    order_id=order_id,
-                    amount=commission['amount'],
-                    level=commission['level'],
-                    status='pending',
-                    expires_at=datetime.utcnow() + timedelta(days=30)
-                )
-                commission_records.append(record)
-
-            # 更新訂單分潤資訊
-            order.profit_breakdown = profit_result
-            order.profit_distribution_log = {
-                'calculated_at': datetime.utcnow().isoformat(),
-                'commission_records': [
-                    {
-                        'user_id': cr.user_id,
-                        'amount': cr.amount,
-                        'level': cr.level
-                    } for cr in commission_records
-                ]
-            }
+            # 以訂單的分潤規則集版本計算訂單利潤（與結算共用同一規則引擎）
+            if not order.calculate_profits():
+                # 只保存驗證失敗標記並結束交易，釋放訂單列鎖定
+                error_log = order.calculation_error_log
+                db.session.commit()
+                return {
+                    'success': False,
+                    'message': error_log
+                }
             
-            # 批量保存分潤記錄
-            db.session.bulk_save_objects(commission_records)
-            db.session.commit()
-
-            # 發送分潤通知
-            for record in commission_records:
-                notification = Notification(
-                    user_id=record.user_id,
-                    type='commission_pending',
-                    message=f'您有一筆新的分潤待確認，金額：NT$ {record.amount:,.2f}',
-                    related_id=record.id,
-                    category='financial',
-                    priority='normal',
-                    metadata={
-                        'order_id': order_id,
-                        'amount': record.amount,
-                        'expires_at': record.expires_at.isoformat()
-                    }
-                )
-                db.session.add(notification)
+            # 與批次處理共用分潤記錄的產生方式
+            now = datetime.utcnow()
+            commission_records, logs = CommissionCalculationService.build_commission_records([order.id], now)
+            order.profit_distribution_log = logs[order.id]
 
+            # 以冪等鍵去重寫入分潤記錄、帳本與通知，金額以實際新增的記錄計算
+            inserted = CommissionCalculationService.insert_commission_records(commission_records, now)
             db.session.commit()
 
             return {
                 'success': True,
                 'message': '分潤計算完成',
-                'total_commission': commission_result['total_commission'],
-                'commission_count': len(commission_records)
+                'total_commission': sum(record['amount'] for record in inserted),
+                'commission_count': len(inserted)
             }
 
         except Exception as e:
@@ -99,47 +220,125 @@ class CommissionCalculationService:
             }
 
     @staticmethod
-    def approve_commission_batch(commission_ids: List[str]) -> Dict:
+    def insert_commission_records(records: List[Dict], now=None, notify: bool = True) -> List:
+        """
+        以冪等鍵 (order_id, user_id, ruleset_version) 寫入待確認分潤記錄，已存在的鍵略過；
+        僅對實際新增的記錄寫入分潤帳本與通知（不提交），回傳新增的記錄
+        """
+        if not records:
+            return []
+        now = now or datetime.utcnow()
+        inserted = db.session.execute(
+            dialect_insert(CommissionRecord).on_conflict_do_nothing(index_elements=list(COMMISSION_KEY)).returning(
+                CommissionRecord.id, CommissionRecord.user_id, CommissionRecord.order_id, CommissionRecord.amount,
+                CommissionRecord.level, CommissionRecord.expires_at, CommissionRecord.created_at
+            ),
+            records
+        ).mappings().all()
+        CommissionLedgerService.record_entries([
+            ledger_entry(record['id'], record['user_id'], record['order_id'], record['level'], record['amount'],
+                         None, 'pending', record['created_at'])
+            for record in inserted
+        ])
+        if not notify:
+            return inserted
+        CommissionCalculationService._insert_notifications(
+            'commission_pending',
+            inserted,
+            lambda record: f"您有一筆新的分潤待確認，金額：NT$ {record['amount']:,.2f}",
+            lambda record: {
+                'order_id': record['order_id'],
+                'amount': record['amount'],
+                'expires_at': record['expires_at'].isoformat()
+            },
+            now
+        )
+        return inserted
+
+    @staticmethod
+    def _insert_notifications(notification_type, records, message, extra_data, now=None):
+        """
+        批次寫入分潤通知
+        :param records: 含 id、user_id、order_id、amount 的分潤記錄（dict 或 RETURNING 結果列）
+        :param message: 記錄 -> 通知內容
+        :param extra_data: 記錄 -> 額外資訊
+        """
+        if not records:
+            return
+        now = now or datetime.utcnow()
+        db.session.execute(insert(Notification.__table__), [
+            {
+                'user_id': record['user_id'],
+                'type': notification_type,
+                'message': message(record),
+                'related_id': record['id'],
+                'category': 'financial',
+                'priority': 'normal',
+                'created_at': now,
+                'extra_data': extra_data(record)
+            }
+            for record in records
+        ])
+
+    @staticmethod
+    def _update_returning(statement, from_status, to_status) -> List:
+        """
+        執行狀態變更的 UPDATE ... RETURNING 並寫入分潤帳本，
+        回傳異動的分潤記錄（id、user_id、order_id、amount、level、created_at）
+        """
+        changed = db.session.execute(
+            statement.returning(
+                CommissionRecord.id, CommissionRecord.user_id, CommissionRecord.order_id, CommissionRecord.amount,
+                CommissionRecord.level, CommissionRecord.created_at
+            ).execution_options(synchronize_session=False)
+        ).mappings().all()
+        CommissionLedgerService.record_entries([
+            ledger_entry(record['id'], record['user_id'], record['order_id'], record['level'], record['amount'],
+                         from_status, to_status, record['created_at'])
+            for record in changed
+        ])
+        return changed
+
+    @staticmethod
+    def approve_commission_batch(commission_ids: List[str], chunk_size: Optional[int] = None) -> Dict:
         """
         批量審核分潤
+        每批以 UPDATE ... RETURNING 將待審核記錄改為已審核，並在同一交易內批次寫入審核通過通知
         """
+        chunk_size = chunk_size or Config.COMMISSION_CHUNK_SIZE
+        commission_ids = list(commission_ids)
+        approved_count = 0
         try:
-            records = CommissionRecord.query.filter(
-                CommissionRecord.id.in_(commission_ids),
-                CommissionRecord.status == 'pending'
-            ).all()
+            for start in range(0, len(commission_ids), chunk_size):
+                now = datetime.utcnow()
+                approved = CommissionCalculationService._update_returning(
+                    update(CommissionRecord).where(
+                        CommissionRecord.id.in_(commission_ids[start:start + chunk_size]),
+                        CommissionRecord.status == 'pending'
+                    ).values(status='approved', approved_at=now),
+                    'pending', 'approved'
+                )
+                CommissionCalculationService._insert_notifications(
+                    'commission_approved',
+                    approved,
+                    lambda record: f"您的分潤 NT$ {record['amount']:,.2f} 已審核通過",
+                    lambda record: {'order_id': record['order_id'], 'amount': record['amount']},
+                    now
+                )
+                approved_count += len(approved)
 
-            if not records:
+            if not approved_count:
+                db.session.rollback()
                 return {
                     'success': False,
                     'message': '沒有找到待審核的分潤記錄'
                 }
-
-            for record in records:
-                record.status = 'approved'
-                record.approved_at = datetime.utcnow()
-
-                # 發送審核通過通知
-                notification = Notification(
-                    user_id=record.user_id,
-                    type='commission_approved',
-                    message=f'您的分潤 NT$ {record.amount:,.2f} 已審核通過',
-                    related_id=record.id,
-                    category='financial',
-                    priority='normal',
-                    metadata={
-                        'order_id': record.order_id,
-                        'amount': record.amount
-                    }
-                )
-                db.session.add(notification)
-
             db.session.commit()
 
             return {
                 'success': True,
-                'message': f'已審核 {len(records)} 筆分潤記錄',
-                'approved_count': len(records)
+                'message': f'已審核 {approved_count} 筆分潤記錄',
+                'approved_count': approved_count
             }
 
         except Exception as e:
@@ -150,46 +349,54 @@ class CommissionCalculationService:
             }
 
     @staticmethod
-    def check_and_process_expired_commissions() -> Dict:
+    def check_and_process_expired_commissions(chunk_size: Optional[int] = None) -> Dict:
         """
         檢查並處理過期的分潤記錄
+        依 ID 分批以 UPDATE ... RETURNING 標記過期並寫入過期通知，每批提交；
+        每批只保留該批的異動結果，記憶體用量與過期筆數無關
         """
+        chunk_size = chunk_size or Config.COMMISSION_CHUNK_SIZE
+        expired_count = 0
         try:
-            expired_records = CommissionRecord.query.filter(
-                CommissionRecord.status == 'pending',
-                CommissionRecord.expires_at < datetime.utcnow()
-            ).all()
-
-            for record in expired_records:
-                record.status = 'expired'
-
-                # 發送過期通知
-                notification = Notification(
-                    user_id=record.user_id,
-                    type='commission_expired',
-                    message=f'您的分潤 NT$ {record.amount:,.2f} 已過期',
-                    related_id=record.id,
-                    category='financial',
-                    priority='normal',
-                    metadata={
-                        'order_id': record.order_id,
-                        'amount': record.amount,
-                        'expired_at': datetime.utcnow().isoformat()
-                    }
+            while True:
+                now = datetime.utcnow()
+                batch = select(CommissionRecord.id).where(
+                    CommissionRecord.status == 'pending',
+                    CommissionRecord.expires_at < now
+                ).order_by(CommissionRecord.id).limit(chunk_size)
+                expired = CommissionCalculationService._update_returning(
+                    update(CommissionRecord).where(
+                        CommissionRecord.id.in_(batch.scalar_subquery()),
+                        CommissionRecord.status == 'pending'
+                    ).values(status='expired'),
+                    'pending', 'expired'
                 )
-                db.session.add(notification)
-
-            db.session.commit()
+                CommissionCalculationService._insert_notifications(
+                    'commission_expired',
+                    expired,
+                    lambda record: f"您的分潤 NT$ {record['amount']:,.2f} 已過期",
+                    lambda record: {
+                        'order_id': record['order_id'],
+                        'amount': record['amount'],
+                        'expired_at': now.isoformat()
+                    },
+                    now
+                )
+                db.session.commit()
+                expired_count += len(expired)
+                if len(expired) < chunk_size:
+                    break
 
             return {
                 'success': True,
-                'message': f'已處理 {len(expired_records)} 筆過期分潤記錄',
-                'expired_count': len(expired_records)
+                'message': f'已處理 {expired_count} 筆過期分潤記錄',
+                'expired_count': expired_count
             }
 
         except Exception as e:
             db.session.rollback()
             return {
                 'success': False,
-                'message': f'處理過期分潤失敗：{str(e)}'
+                'message': f'處理過期分潤失敗：{str(e)}',
+                'expired_count': expired_count
             }
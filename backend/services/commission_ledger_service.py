@@ -0,0 +1,177 @@
+from collections import defaultdict
+from datetime import date, datetime
+from typing import Dict, List, Optional
+from sqlalchemy import func, insert, select, text
+from backend.extensions import db
+from backend.models.commission import CommissionRecord
+from backend.models.commission_ledger import CommissionBalance, CommissionDailyRollup, CommissionLedgerEntry
+from backend.utils.bulk_ops import upsert
+
+AGGREGATE_FIELDS = ('count', 'amount')
+
+
+def ledger_entry(commission_id, user_id, order_id, level, amount, from_status, to_status, commission_created_at):
+    """分潤帳本異動：金額自 from_status 移至 to_status（None 表示新增或刪除）"""
+    return {
+        'commission_id': commission_id,
+        'user_id': user_id,
+        'order_id': order_id,
+        'level': level,
+        'amount': amount or 0,
+        'from_status': from_status,
+        'to_status': to_status,
+        'commission_created_at': commission_created_at,
+    }
+
+
+def _as_date(value):
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, str):
+        return date.fromisoformat(value[:10])
+    return value
+
+
+class CommissionLedgerService:
+    """
+    分潤帳本與餘額
+    分潤記錄的建立與狀態變動寫入只新增的帳本，並在同一交易內累加用戶各狀態餘額與每日彙總，
+    餘額畫面與管理報表只需讀取彙總列
+    """
+
+    @staticmethod
+    def record_entries(entries: List[Dict], connection=None):
+        """
+        寫入帳本並以差額累加用戶餘額與每日彙總
+        :param connection: 於 flush 事件中寫入時傳入 session.connection()，預設使用 db.session
+        """
+        entries = [entry for entry in entries if entry['from_status'] != entry['to_status']]
+        if not entries:
+            return
+        executor = connection or db.session
+        now = datetime.utcnow()
+        executor.execute(insert(CommissionLedgerEntry.__table__), [
+            {
+                'commission_id': entry['commission_id'],
+                'user_id': entry['user_id'],
+                'order_id': entry['order_id'],
+                'level': entry['level'],
+                'amount': entry['amount'],
+                'from_status': entry['from_status'],
+                'to_status': entry['to_status'],
+                'created_at': now,
+            }
+            for entry in entries
+        ])
+
+        balances = defaultdict(lambda: [0, 0.0])
+        rollups = defaultdict(lambda: [0, 0.0])
+        for entry in entries:
+            day = _as_date(entry['commission_created_at'] or now)
+            for status, sign in ((entry['from_status'], -1), (entry['to_status'], 1)):
+                if status is None:
+                    continue
+                for totals in (balances[(entry['user_id'], status)], rollups[(day, entry['level'], status)]):
+                    totals[0] += sign
+                    totals[1] += sign * entry['amount']
+
+        upsert(CommissionBalance, [
+            {'user_id': user_id, 'status': status, 'count': count, 'amount': amount, 'updated_at': now}
+            for (user_id, status), (count, amount) in balances.items() if count or amount
+        ], index_elements=('user_id', 'status'), set_columns=('updated_at',),
+            increment_columns=AGGREGATE_FIELDS, connection=connection)
+        upsert(CommissionDailyRollup, [
+            {'day': day, 'level': level, 'status': status, 'count': count, 'amount': amount, 'updated_at': now}
+            for (day, level, status), (count, amount) in rollups.items() if count or amount
+        ], index_elements=('day', 'level', 'status'), set_columns=('updated_at',),
+            increment_columns=AGGREGATE_FIELDS, connection=connection)
+
+    @staticmethod
+    def get_balances(user_id) -> Dict:
+        """用戶各狀態的分潤筆數與金額，格式 {status: {'count', 'amount'}}"""
+        return {
+            row.status: {'count': row.count or 0, 'amount': row.amount or 0}
+            for row in db.session.execute(
+                select(CommissionBalance.status, CommissionBalance.count, CommissionBalance.amount)
+                .where(CommissionBalance.user_id == user_id)
+            )
+        }
+
+    @staticmethod
+    def get_ledger(user_id, page=1, per_page=20):
+        """用戶的分潤帳本明細（新到舊）"""
+        return CommissionLedgerEntry.query.filter_by(user_id=user_id).order_by(
+            CommissionLedgerEntry.created_at.desc(), CommissionLedgerEntry.id.desc()
+        ).paginate(page=page, per_page=per_page, error_out=False)
+
+    @staticmethod
+    def get_report(start_date: Optional[date] = None, end_date: Optional[date] = None) -> Dict:
+        """
+        依分潤建立日期區間（含首尾日）彙總各狀態與各層級的筆數與金額
+        """
+        conditions = []
+        if start_date:
+            conditions.append(CommissionDailyRollup.day >= start_date)
+        if end_date:
+            conditions.append(CommissionDailyRollup.day <= end_date)
+
+        def aggregate(column):
+            return db.session.execute(
+                select(
+                    column,
+                    func.sum(CommissionDailyRollup.count),
+                    func.sum(CommissionDailyRollup.amount)
+                ).where(*conditions).group_by(column).order_by(column)
+            ).all()
+
+        return {
+            'status_statistics': [
+                {'status': status, 'count': int(count or 0), 'total_amount': float(amount or 0)}
+                for status, count, amount in aggregate(CommissionDailyRollup.status) if count
+            ],
+            'level_statistics': [
+                {'level': level, 'count': int(count or 0), 'total_amount': float(amount or 0)}
+                for level, count, amount in aggregate(CommissionDailyRollup.level) if count
+            ]
+        }
+
+    @staticmethod
+    def rebuild() -> int:
+        """
+        以 commission_records 全表彙總重建用戶餘額與每日彙總（帳本不變）
+        PostgreSQL 上先鎖定兩張彙總表，重建期間其他交易的差額寫入須等待重建提交後才累加，
+        不會被刪除或重複計入
+        """
+        if db.session.get_bind().dialect.name == 'postgresql':
+            db.session.execute(text(
+                f'LOCK TABLE {CommissionBalance.__tablename__}, {CommissionDailyRollup.__tablename__} '
+                'IN SHARE ROW EXCLUSIVE MODE'
+            ))
+        day = func.date(CommissionRecord.created_at, type_=db.Date)
+        balance_rows = db.session.execute(
+            select(
+                CommissionRecord.user_id, CommissionRecord.status,
+                func.count(CommissionRecord.id), func.sum(CommissionRecord.amount)
+            ).group_by(CommissionRecord.user_id, CommissionRecord.status)
+        ).all()
+        rollup_rows = db.session.execute(
+            select(
+                day.label('day'), CommissionRecord.level, CommissionRecord.status,
+                func.count(CommissionRecord.id), func.sum(CommissionRecord.amount)
+            ).group_by('day', CommissionRecord.level, CommissionRecord.status)
+        ).all()
+
+        now = datetime.utcnow()
+        CommissionBalance.query.delete()
+        CommissionDailyRollup.query.delete()
+        upsert(CommissionBalance, [
+            {'user_id': user_id, 'status': status, 'count': count, 'amount': amount or 0, 'updated_at': now}
+            for user_id, status, count, amount in balance_rows
+        ], index_elements=('user_id', 'status'), increment_columns=AGGREGATE_FIELDS)
+        upsert(CommissionDailyRollup, [
+            {'day': _as_date(day), 'level': level, 'status': status, 'count': count, 'amount': amount or 0,
+             'updated_at': now}
+            for day, level, status, count, amount in rollup_rows
+        ], index_elements=('day', 'level', 'status'), increment_columns=AGGREGATE_FIELDS)
+        db.session.commit()
+        return len(balance_rows)
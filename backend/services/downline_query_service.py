@@ -0,0 +1,134 @@
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+from sqlalchemy import and_, case, func
+from sqlalchemy.orm import aliased
+from backend.extensions import db
+from backend.models.downline_stats import DownlineStats
+from backend.models.referral_closure import ReferralClosure
+from backend.models.user import User
+from backend.services.group_mom_service import UPGRADE_ACTIVE_DAYS
+
+
+def _page(pagination, serialize) -> Dict:
+    return {
+        'items': [serialize(row) for row in pagination.items],
+        'total': pagination.total,
+        'page': pagination.page,
+        'per_page': pagination.per_page,
+        'pages': pagination.pages
+    }
+
+
+class DownlineQueryService:
+    """
+    下線查詢
+    以推薦閉包表取得任一用戶的整棵下線子樹，並以該用戶的下線統計（downline_stats）取得消費與活躍狀態；
+    各查詢皆為單一 SQL，不需逐層追溯
+    """
+
+    @staticmethod
+    def _scope(user_id, max_depth: Optional[int] = None) -> List:
+        conditions = [ReferralClosure.ancestor_id == user_id, ReferralClosure.depth > 0]
+        if max_depth is not None:
+            conditions.append(ReferralClosure.depth <= max_depth)
+        return conditions
+
+    @staticmethod
+    def _stats_join(user_id):
+        """用戶對各下線的消費統計（mom_id 為查詢用戶）"""
+        return and_(DownlineStats.mom_id == user_id, DownlineStats.downline_id == ReferralClosure.descendant_id)
+
+    @staticmethod
+    def _active(now):
+        return case((DownlineStats.last_order_date >= now - timedelta(days=UPGRADE_ACTIVE_DAYS), 1))
+
+    @staticmethod
+    def get_level_summary(user_id, max_depth: Optional[int] = None, now=None) -> List[Dict]:
+        """
+        各層下線的人數、訂單數、消費金額與近 90 天活躍人數（第 1 層為直屬下線）
+        """
+        now = now or datetime.utcnow()
+        rows = db.session.query(
+            ReferralClosure.depth,
+            func.count(ReferralClosure.descendant_id),
+            func.coalesce(func.sum(DownlineStats.order_count), 0),
+            func.coalesce(func.sum(DownlineStats.total_spent), 0),
+            func.count(DownlineQueryService._active(now))
+        ).outerjoin(
+            DownlineStats, DownlineQueryService._stats_join(user_id)
+        ).filter(
+            *DownlineQueryService._scope(user_id, max_depth)
+        ).group_by(ReferralClosure.depth).order_by(ReferralClosure.depth).all()
+        return [{
+            'depth': depth,
+            'member_count': member_count,
+            'order_count': int(order_count),
+            'total_spent': float(total_spent),
+            'active_count': active_count
+        } for depth, member_count, order_count, total_spent, active_count in rows]
+
+    @staticmethod
+    def get_downlines(user_id, max_depth: Optional[int] = None, page=1, per_page=20, now=None) -> Dict:
+        """
+        下線成員明細（依層數、用戶 ID 排序分頁）
+        """
+        now = now or datetime.utcnow()
+        pagination = db.session.query(
+            User.id, User.username, User.group_mom_level, User.is_active, User.referrer_id,
+            ReferralClosure.depth,
+            func.coalesce(DownlineStats.order_count, 0),
+            func.coalesce(DownlineStats.total_spent, 0),
+            DownlineStats.last_order_date,
+            DownlineQueryService._active(now)
+        ).join(
+            User, User.id == ReferralClosure.descendant_id
+        ).outerjoin(
+            DownlineStats, DownlineQueryService._stats_join(user_id)
+        ).filter(
+            *DownlineQueryService._scope(user_id, max_depth)
+        ).order_by(
+            ReferralClosure.depth, ReferralClosure.descendant_id
+        ).paginate(page=page, per_page=per_page, error_out=False)
+        return _page(pagination, lambda row: {
+            'user_id': row[0],
+            'username': row[1],
+            'group_mom_level': row[2],
+            'is_active': row[3],
+            'referrer_id': row[4],
+            'depth': row[5],
+            'order_count': int(row[6]),
+            'total_spent': float(row[7]),
+            'last_order_date': row[8].isoformat() if row[8] else None,
+            'is_recently_active': bool(row[9])
+        })
+
+    @staticmethod
+    def get_subteams(user_id, page=1, per_page=20, now=None) -> Dict:
+        """
+        各直屬下線所帶領的子團隊（含直屬下線本人）人數、消費金額與活躍人數，依消費金額排序分頁
+        """
+        now = now or datetime.utcnow()
+        leader = aliased(User)
+        total_spent = func.coalesce(func.sum(DownlineStats.total_spent), 0)
+        pagination = db.session.query(
+            leader.id, leader.username, leader.group_mom_level,
+            func.count(ReferralClosure.descendant_id),
+            total_spent,
+            func.count(DownlineQueryService._active(now))
+        ).join(
+            ReferralClosure, ReferralClosure.ancestor_id == leader.id
+        ).outerjoin(
+            DownlineStats, DownlineQueryService._stats_join(user_id)
+        ).filter(
+            leader.referrer_id == user_id
+        ).group_by(
+            leader.id, leader.username, leader.group_mom_level
+        ).order_by(total_spent.desc(), leader.id).paginate(page=page, per_page=per_page, error_out=False)
+        return _page(pagination, lambda row: {
+            'user_id': row[0],
+            'username': row[1],
+            'group_mom_level': row[2],
+            'member_count': row[3],
+            'total_spent': float(row[4]),
+            'active_count': row[5]
+        })
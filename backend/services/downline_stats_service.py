@@ -0,0 +1,258 @@
+import concurrent.futures
+import time
+from datetime import datetime
+from typing import Dict, Optional
+from sqlalchemy import Column, DateTime, Float, Integer, MetaData, Table, and_, delete, func, insert, select, text
+from backend.config import Config
+from backend.extensions import db
+from backend.models.downline_stats import DownlineStats
+from backend.models.order import Order
+from backend.models.referral_closure import ReferralClosure
+from backend.models.refund import Refund
+from backend.utils.bulk_ops import upsert
+
+STATS_FIELDS = ('order_count', 'total_spent')
+# 重建時平行寫入的暫存表（不屬於 db.metadata，不會被 create_all 建立），完成後於單一交易換入 downline_stats
+REBUILD_STAGING = Table(
+    'downline_stats_rebuild', MetaData(),
+    Column('mom_id', Integer, nullable=False),
+    Column('downline_id', Integer, nullable=False),
+    Column('order_count', Integer),
+    Column('total_spent', Float),
+    Column('last_order_date', DateTime)
+)
+STAGING_COLUMNS = ('mom_id', 'downline_id', 'order_count', 'total_spent', 'last_order_date')
+
+
+class DownlineStatsService:
+    """
+    下線消費統計
+    每筆 (上線, 下線) 記錄下線已完成訂單數、消費金額（扣除已完成的退款）與最近下單時間；
+    訂單完成、取消或退款完成時依買家的推薦閉包對所有上線增量累加。
+    上線包含尚未成為團媽的會員，會員升級檢查時即有完整統計
+    """
+
+    @staticmethod
+    def _refunded_by_order():
+        """各訂單已完成退款的金額（換貨不影響消費金額）"""
+        return select(
+            Refund.order_id,
+            func.sum(Refund.amount).label('refunded')
+        ).where(
+            Refund.status == 'completed',
+            Refund.refund_type != 'exchange'
+        ).group_by(Refund.order_id).subquery()
+
+    @staticmethod
+    def order_contributions(order_ids, connection=None) -> Dict:
+        """
+        指定訂單目前對各買家統計的貢獻（僅已完成訂單計入，扣除已完成退款）
+        :return: {買家 ID: {'order_count', 'total_spent'}}
+        """
+        if not order_ids:
+            return {}
+        refunded = DownlineStatsService._refunded_by_order()
+        rows = (connection or db.session).execute(
+            select(
+                Order.user_id,
+                func.count(Order.id),
+                func.sum(Order.total_price - func.coalesce(refunded.c.refunded, 0))
+            ).outerjoin(refunded, refunded.c.order_id == Order.id).where(
+                Order.id.in_(list(order_ids)),
+                Order.status == 'completed'
+            ).group_by(Order.user_id)
+        ).all()
+        return {
+            buyer_id: {'order_count': order_count, 'total_spent': total_spent or 0}
+            for buyer_id, order_count, total_spent in rows
+        }
+
+    @staticmethod
+    def apply_deltas(deltas, connection=None):
+        """
+        將買家統計差額累加至買家所有上線的統計列，並更新最近下單時間
+        :param deltas: {買家 ID: {欄位: 差額}}
+        :param connection: 於 flush 事件中寫入時傳入 session.connection()，預設使用 db.session
+        """
+        deltas = {
+            buyer_id: values for buyer_id, values in deltas.items()
+            if buyer_id is not None and any(values.get(field) for field in STATS_FIELDS)
+        }
+        if not deltas:
+            return
+        executor = connection or db.session
+        buyer_ids = list(deltas)
+        ancestors = executor.execute(
+            select(ReferralClosure.ancestor_id, ReferralClosure.descendant_id).where(
+                ReferralClosure.descendant_id.in_(buyer_ids),
+                ReferralClosure.depth > 0
+            )
+        ).all()
+        if not ancestors:
+            return
+        # 最近下單時間無法以差額還原，直接取買家目前已完成訂單的最大建立時間
+        last_order_dates = dict(executor.execute(
+            select(Order.user_id, func.max(Order.created_at)).where(
+                Order.user_id.in_(buyer_ids),
+                Order.status == 'completed'
+            ).group_by(Order.user_id)
+        ).all())
+
+        now = datetime.utcnow()
+        upsert(DownlineStats, [
+            {
+                'mom_id': mom_id,
+                'downline_id': buyer_id,
+                'order_count': deltas[buyer_id].get('order_count', 0),
+                'total_spent': deltas[buyer_id].get('total_spent', 0),
+                'last_order_date': last_order_dates.get(buyer_id),
+                'created_at': now,
+                'updated_at': now
+            }
+            for mom_id, buyer_id in ancestors
+        ], index_elements=('mom_id', 'downline_id'), set_columns=('last_order_date', 'updated_at'),
+            increment_columns=STATS_FIELDS, connection=connection)
+
+    @staticmethod
+    def move_subtree(user_id, removed_ancestors, added_ancestors, connection=None):
+        """
+        推薦人變更時搬移子樹成員（含用戶本人）的統計
+        各買家目前的彙總對不再是上線者以負差額扣除（扣完的列刪除），對新增的上線以正差額累加
+        :param removed_ancestors: 搬移後不再是子樹上線的用戶 ID
+        :param added_ancestors: 搬移後新增的子樹上線 ID
+        """
+        if not removed_ancestors and not added_ancestors:
+            return
+        executor = connection or db.session
+        subtree = select(ReferralClosure.descendant_id).where(ReferralClosure.ancestor_id == user_id)
+        refunded = DownlineStatsService._refunded_by_order()
+        totals = executor.execute(
+            select(
+                Order.user_id,
+                func.count(Order.id),
+                func.sum(Order.total_price - func.coalesce(refunded.c.refunded, 0)),
+                func.max(Order.created_at)
+            ).outerjoin(refunded, refunded.c.order_id == Order.id).where(
+                Order.user_id.in_(subtree),
+                Order.status == 'completed'
+            ).group_by(Order.user_id)
+        ).all()
+        if not totals:
+            return
+
+        now = datetime.utcnow()
+        upsert(DownlineStats, [
+            {
+                'mom_id': mom_id,
+                'downline_id': buyer_id,
+                'order_count': sign * order_count,
+                'total_spent': sign * (total_spent or 0),
+                'last_order_date': last_order_date,
+                'created_at': now,
+                'updated_at': now
+            }
+            for ancestors, sign in ((removed_ancestors, -1), (added_ancestors, 1))
+            for mom_id in ancestors
+            for buyer_id, order_count, total_spent, last_order_date in totals
+        ], index_elements=('mom_id', 'downline_id'), set_columns=('last_order_date', 'updated_at'),
+            increment_columns=STATS_FIELDS, connection=connection)
+        if removed_ancestors:
+            executor.execute(delete(DownlineStats).where(
+                DownlineStats.mom_id.in_(list(removed_ancestors)),
+                DownlineStats.downline_id.in_(subtree),
+                DownlineStats.order_count <= 0
+            ))
+
+    @staticmethod
+    def _buyer_totals(first_id, last_id):
+        """買家 ID 區間內各買家的已完成訂單彙總（扣除已完成退款）"""
+        refunded = DownlineStatsService._refunded_by_order()
+        return select(
+            Order.user_id.label('buyer_id'),
+            func.count(Order.id).label('order_count'),
+            func.sum(Order.total_price - func.coalesce(refunded.c.refunded, 0)).label('total_spent'),
+            func.max(Order.created_at).label('last_order_date')
+        ).outerjoin(refunded, refunded.c.order_id == Order.id).where(
+            Order.status == 'completed',
+            Order.user_id.between(first_id, last_id)
+        ).group_by(Order.user_id).subquery()
+
+    @staticmethod
+    def _rebuild_range(engine, first_id, last_id) -> int:
+        """以獨立連線將一段買家 ID 區間的統計列寫入暫存表"""
+        order_totals = DownlineStatsService._buyer_totals(first_id, last_id)
+        rows = select(
+            ReferralClosure.ancestor_id,
+            order_totals.c.buyer_id,
+            order_totals.c.order_count,
+            order_totals.c.total_spent,
+            order_totals.c.last_order_date
+        ).select_from(order_totals).join(
+            ReferralClosure,
+            and_(ReferralClosure.descendant_id == order_totals.c.buyer_id, ReferralClosure.depth > 0)
+        )
+        with engine.begin() as connection:
+            return connection.execute(
+                insert(REBUILD_STAGING).from_select(list(STAGING_COLUMNS), rows)
+            ).rowcount
+
+    @staticmethod
+    def rebuild(chunk_size: Optional[int] = None, max_workers: Optional[int] = None) -> Dict:
+        """
+        以訂單與退款全表重建下線統計（供首次部署、推薦關係大量調整或對帳修正使用）
+        依買家 ID 切段，各段以獨立連線平行 INSERT ... SELECT 至暫存表，再於單一交易清空 downline_stats 並換入；
+        PostgreSQL 上整個重建期間鎖定 downline_stats（重建互斥）並阻擋訂單、退款與推薦閉包表的寫入，
+        flush 事件的增量不會與重建交錯而遺失或重複，讀取端在換入前仍看到舊統計
+        """
+        chunk_size = chunk_size or Config.DOWNLINE_STATS_CHUNK_SIZE
+        max_workers = max_workers or Config.DOWNLINE_STATS_WORKERS
+        started = time.monotonic()
+        engine = db.engine
+
+        if db.session.get_bind().dialect.name == 'postgresql':
+            db.session.execute(text(f'LOCK TABLE {DownlineStats.__tablename__} IN SHARE ROW EXCLUSIVE MODE'))
+            db.session.execute(text(
+                f'LOCK TABLE {Order.__tablename__}, {Refund.__tablename__}, {ReferralClosure.__tablename__} '
+                'IN SHARE MODE'
+            ))
+        with engine.begin() as connection:
+            REBUILD_STAGING.drop(connection, checkfirst=True)
+            REBUILD_STAGING.create(connection)
+        try:
+            first_id, last_id = db.session.execute(
+                select(func.min(Order.user_id), func.max(Order.user_id)).where(Order.status == 'completed')
+            ).one()
+            ranges = [] if first_id is None else [
+                (start, min(start + chunk_size - 1, last_id)) for start in range(first_id, last_id + 1, chunk_size)
+            ]
+            if max_workers > 1 and len(ranges) > 1:
+                with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+                    list(executor.map(lambda bounds: DownlineStatsService._rebuild_range(engine, *bounds), ranges))
+            else:
+                for bounds in ranges:
+                    DownlineStatsService._rebuild_range(engine, *bounds)
+
+            now = datetime.utcnow()
+            DownlineStats.query.delete()
+            rows = db.session.execute(insert(DownlineStats).from_select(
+                [*STAGING_COLUMNS, 'created_at', 'updated_at'],
+                select(
+                    *(REBUILD_STAGING.c[name] for name in STAGING_COLUMNS),
+                    db.literal(now, db.DateTime),
+                    db.literal(now, db.DateTime)
+                )
+            )).rowcount
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        finally:
+            with engine.begin() as connection:
+                REBUILD_STAGING.drop(connection, checkfirst=True)
+
+        return {
+            'rows': rows,
+            'ranges': len(ranges),
+            'workers': min(max_workers, len(ranges)) or 1,
+            'elapsed_seconds': round(time.monotonic() - started, 3)
+        }
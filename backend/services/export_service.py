@@ -205,7 +205,7 @@ class ExportService:
         mom_sheet.set_column('B:E', 12)
         
         # 異常檢測表
-        anomalies = SettlementOptimizationService.detect_anomalies(period)
+        anomalies = SettlementOptimizationService.detect_anomalies(period, analysis=analysis)
         if anomalies:
             anomaly_sheet = workbook.add_worksheet('異常檢測')
             headers = ['類型', '欄位', '數值', '結算類型', '偏差/變化率']
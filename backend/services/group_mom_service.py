@@ -1,15 +1,49 @@
 from datetime import datetime, timedelta
+from backend.config import Config
 from backend.extensions import db
 from backend.models.group_mom_level import GroupMomLevel
 from backend.models.user import User
 from backend.models.payment import Payment
 from backend.models.group_mom_application import GroupMomApplication
-from backend.models.order import Order
 from backend.models.downline_stats import DownlineStats
-from sqlalchemy import func
+from backend.models.audit import AuditLog
+from backend.models.notification import Notification
+from backend.models.user_status_event import UserStatusEvent
+from backend.services.referral_service import MOM_REFERRAL_COUNTER_FIELDS, ReferralService
+from sqlalchemy import and_, func, insert, select, update
+from sqlalchemy.orm import aliased
+from collections import defaultdict
 from decimal import Decimal
+import time
+
+# 團媽分潤比例（依團媽等級）
+COMMISSION_RATES = {
+    1: Decimal('0.05'),  # 小團媽 5%
+    2: Decimal('0.10'),  # 中團媽 10%
+    3: Decimal('0.15')   # 大團媽 15%
+}
+
+# 等級升級條件
+UPGRADE_ACTIVE_DAYS = 90  # 活躍下線：近 90 天內有完成訂單
+UPGRADE_MAX_LEVEL = 3
+UPGRADE_QUALIFIED_DOWNLINES = 10  # 中、大團媽需要的同等級團媽下線數
+UPGRADE_MIN_SALES = {1: 50000, 2: 100000, 3: 200000}  # 各等級最低銷售額要求
+
+FEE_REMINDER_DAYS = 7  # 會費到期前幾天開始提醒
+
+
+def required_active_downlines(current_level):
+    """升級所需的活躍下線數：會員升小團媽需 50 個，其餘 10 個"""
+    return 50 if current_level == 0 else 10
+
 
 class GroupMomService:
+    @staticmethod
+    def commission_amount(total_price, level) -> float:
+        """團媽分潤金額：訂單金額 × 等級分潤比例，四捨六入至分"""
+        rate = COMMISSION_RATES.get(level, Decimal('0'))
+        return float((Decimal(str(total_price)) * rate).quantize(Decimal('0.01')))
+
     @staticmethod
     def apply_for_group_mom(user_id, target_level_id, payment_proof):
         """
@@ -188,39 +222,91 @@ class GroupMomService:
         return payment
 
     @staticmethod
-    def check_and_notify_expiring_fees():
-        """檢查即將到期的會費並發送通知"""
-        expiring_soon = datetime.utcnow() + timedelta(days=7)  # 7天內到期
-        users = User.query.filter(
-            User.group_mom_level > 0,
-            User.group_mom_fee_paid_until <= expiring_soon
+    def check_and_notify_expiring_fees(now=None) -> list:
+        """
+        檢查即將到期（7 天內）的會費，以單一 INSERT 批次建立繳費提醒通知
+        同一會費有效期只提醒一次：以單一 UPDATE 將 group_mom_fee_reminded_until 設為目前有效期，
+        RETURNING 取得本次需提醒的用戶（續費後有效期改變才會再次提醒）
+        :return: 新建通知的 ID，由呼叫端以單一批次任務發送
+        """
+        now = now or datetime.utcnow()
+        expiring_soon = now + timedelta(days=FEE_REMINDER_DAYS)
+        users = db.session.execute(
+            update(User).where(
+                User.group_mom_level > 0,
+                User.group_mom_fee_paid_until >= now,
+                User.group_mom_fee_paid_until <= expiring_soon,
+                User.group_mom_fee_reminded_until.is_distinct_from(User.group_mom_fee_paid_until)
+            ).values(
+                group_mom_fee_reminded_until=User.group_mom_fee_paid_until
+            ).returning(
+                User.id, User.group_mom_fee_paid_until
+            ).execution_options(synchronize_session=False)
         ).all()
-        
-        for user in users:
-            # TODO: 發送通知提醒繳費
-            pass
-        
-        return users
+        if not users:
+            db.session.commit()
+            return []
+
+        notification_ids = db.session.execute(
+            insert(Notification.__table__).returning(Notification.id), [{
+                'user_id': user_id,
+                'type': 'fee_expiring',
+                'message': f'您的團媽會費將於 {paid_until:%Y-%m-%d} 到期，請儘速繳費以維持團媽資格',
+                'category': 'financial',
+                'priority': 'normal',
+                'created_at': now,
+                'extra_data': {'fee_paid_until': paid_until.isoformat()}
+            } for user_id, paid_until in sorted(users)]
+        ).scalars().all()
+        # 先提交，發送任務才讀得到通知
+        db.session.commit()
+        return notification_ids
 
     @staticmethod
-    def deactivate_expired_group_moms():
-        """停用過期未繳費的團媽帳號"""
-        expired_users = User.query.filter(
-            User.group_mom_level > 0,
-            User.group_mom_fee_paid_until < datetime.utcnow()
-        ).all()
-        
-        for user in expired_users:
-            user.group_mom_level = 0
-            user.group_mom_status = 'none'
-            user.status_history.append({
-                'action': 'deactivate',
-                'reason': 'fee_expired',
-                'timestamp': datetime.utcnow().isoformat()
-            })
-        
+    def deactivate_expired_group_moms(now=None) -> list:
+        """
+        停用過期未繳費的團媽帳號
+        依等級各以一個 UPDATE ... WHERE 等級 = :level RETURNING 將等級歸零（原等級即該次的 level，不需先查詢 ID），
+        狀態事件一次寫入 user_status_events，並調整推薦人的各等級直屬下線計數
+        :return: 停用的用戶 [{'user_id', 'old_level'}]
+        """
+        now = now or datetime.utcnow()
+        deactivated = []
+        for old_level in MOM_REFERRAL_COUNTER_FIELDS:
+            deactivated.extend(
+                (user_id, old_level, referrer_id)
+                for user_id, referrer_id in db.session.execute(
+                    update(User).where(
+                        User.group_mom_level == old_level,
+                        User.group_mom_fee_paid_until < now
+                    ).values(
+                        group_mom_level=0,
+                        group_mom_status='none'
+                    ).returning(
+                        User.id, User.referrer_id
+                    ).execution_options(synchronize_session=False)
+                )
+            )
+        if not deactivated:
+            db.session.commit()
+            return []
+
+        # Core UPDATE 不經過 flush 事件，自行調整推薦人的各等級直屬下線計數
+        counter_deltas = defaultdict(lambda: defaultdict(int))
+        for _, old_level, referrer_id in deactivated:
+            counter_deltas[referrer_id][MOM_REFERRAL_COUNTER_FIELDS[old_level]] -= 1
+        ReferralService.apply_referral_counter_deltas(counter_deltas)
+
+        db.session.execute(insert(UserStatusEvent), [{
+            'user_id': user_id,
+            'action': 'deactivate',
+            'reason': 'fee_expired',
+            'from_level': old_level,
+            'to_level': 0,
+            'created_at': now
+        } for user_id, old_level, _ in deactivated])
         db.session.commit()
-        return expired_users
+        return [{'user_id': user_id, 'old_level': old_level} for user_id, old_level, _ in sorted(deactivated)]
 
     @staticmethod
     def check_and_process_level_upgrade(user_id: str) -> dict:
@@ -234,7 +320,7 @@ class GroupMomService:
 
         # 獲取當前等級
         current_level = user.group_mom_level or 0
-        if current_level >= 3:  # 已是最高等級
+        if current_level >= UPGRADE_MAX_LEVEL:  # 已是最高等級
             return {'success': False, 'message': '已是最高等級'}
 
         # 檢查會費狀態
@@ -249,13 +335,13 @@ class GroupMomService:
             )
             .filter(
                 DownlineStats.mom_id == user_id,
-                DownlineStats.last_order_date >= datetime.utcnow() - timedelta(days=90)
+                DownlineStats.last_order_date >= datetime.utcnow() - timedelta(days=UPGRADE_ACTIVE_DAYS)
             )
             .first()
         )
 
         # 檢查下線數量要求
-        required_downlines = 50 if current_level == 0 else 10
+        required_downlines = required_active_downlines(current_level)
         if not downline_stats or downline_stats.total_count < required_downlines:
             return {
                 'success': False,
@@ -277,16 +363,16 @@ class GroupMomService:
                 .scalar()
             )
 
-            if qualified_downlines < 10:
+            if qualified_downlines < UPGRADE_QUALIFIED_DOWNLINES:
                 return {
                     'success': False,
-                    'message': f'需要10個同等級團媽下線，目前只有{qualified_downlines}個',
+                    'message': f'需要{UPGRADE_QUALIFIED_DOWNLINES}個同等級團媽下線，目前只有{qualified_downlines}個',
                     'current': qualified_downlines,
-                    'required': 10
+                    'required': UPGRADE_QUALIFIED_DOWNLINES
                 }
 
         # 檢查銷售業績要求
-        min_sales = {1: 50000, 2: 100000, 3: 200000}  # 各等級最低銷售額要求
+        min_sales = UPGRADE_MIN_SALES
         if not downline_stats or downline_stats.total_spent < min_sales.get(current_level + 1, 0):
             return {
                 'success': False,
@@ -311,49 +397,138 @@ class GroupMomService:
             return {'success': False, 'message': str(e)}
 
     @staticmethod
-    def calculate_commission(order_id: str) -> dict:
+    def evaluate_level_upgrades(now=None) -> list:
         """
-        計算訂單的團媽分潤
+        批次評估會費有效團媽的升級條件（與 check_and_process_level_upgrade 相同）
+        活躍下線數與銷售額、同等級合格下線數各以一個分組子查詢取得，與候選團媽一次查詢
+        :return: 各候選團媽的 {'user_id', 'level', 'active_downlines', 'total_spent', 'qualified_downlines', 'eligible'}
         """
-        order = Order.query.get(order_id)
-        if not order:
-            return {'success': False, 'message': '訂單不存在'}
+        now = now or datetime.utcnow()
+        active = select(
+            DownlineStats.mom_id,
+            func.count(DownlineStats.id).label('active_downlines'),
+            func.sum(DownlineStats.total_spent).label('total_spent')
+        ).where(
+            DownlineStats.last_order_date >= now - timedelta(days=UPGRADE_ACTIVE_DAYS)
+        ).group_by(DownlineStats.mom_id).subquery()
+        mom, downline = aliased(User), aliased(User)
+        qualified = select(
+            DownlineStats.mom_id,
+            func.count(downline.id).label('qualified_downlines')
+        ).join(mom, mom.id == DownlineStats.mom_id).join(downline, and_(
+            downline.id == DownlineStats.downline_id,
+            downline.group_mom_level == mom.group_mom_level,
+            downline.group_mom_fee_paid_until > now
+        )).group_by(DownlineStats.mom_id).subquery()
 
-        try:
-            # 獲取分潤比例設定
-            commission_rates = {
-                1: Decimal('0.05'),  # 小團媽 5%
-                2: Decimal('0.10'),  # 中團媽 10%
-                3: Decimal('0.15')   # 大團媽 15%
-            }
-
-            # 計算可分配金額
-            distributable_amount = Decimal(str(order.total_price))
-            commission_records = []
-
-            # 檢查並計算各級團媽的分潤
-            for mom_type in ['big_mom_id', 'middle_mom_id', 'small_mom_id']:
-                mom_id = getattr(order, mom_type)
-                if not mom_id:
-                    continue
+        rows = db.session.execute(
+            select(
+                User.id, User.group_mom_level,
+                func.coalesce(active.c.active_downlines, 0),
+                func.coalesce(active.c.total_spent, 0),
+                func.coalesce(qualified.c.qualified_downlines, 0)
+            ).outerjoin(active, active.c.mom_id == User.id)
+            .outerjoin(qualified, qualified.c.mom_id == User.id)
+            .where(
+                User.role == 'member',
+                User.group_mom_level > 0,
+                User.group_mom_level < UPGRADE_MAX_LEVEL,
+                User.group_mom_fee_paid_until > now
+            ).order_by(User.id)
+        ).all()
 
-                mom = User.query.get(mom_id)
-                if not mom or not mom.is_group_mom_fee_valid():
-                    continue
+        evaluations = []
+        for user_id, level, active_downlines, total_spent, qualified_downlines in rows:
+            evaluations.append({
+                'user_id': user_id,
+                'level': level,
+                'active_downlines': active_downlines,
+                'total_spent': float(total_spent),
+                'qualified_downlines': qualified_downlines,
+                'eligible': (
+                    active_downlines >= required_active_downlines(level)
+                    and qualified_downlines >= UPGRADE_QUALIFIED_DOWNLINES
+                    and total_spent >= UPGRADE_MIN_SALES[level + 1]
+                )
+            })
+        return evaluations
 
-                rate = commission_rates.get(mom.group_mom_level, Decimal('0'))
-                commission_amount = (distributable_amount * rate).quantize(Decimal('0.01'))
+    @staticmethod
+    def process_level_upgrades() -> dict:
+        """
+        批次處理團媽等級自動升級
+        評估後依等級分批 UPDATE 調升符合資格的團媽（評估後等級已變動者略過），
+        每位升級團媽寫入一筆稽核紀錄，並回報各階段耗時
+        """
+        timings = {}
+        started = time.monotonic()
+        now = datetime.utcnow()
+        evaluations = GroupMomService.evaluate_level_upgrades(now)
+        eligible = {e['user_id']: e for e in evaluations if e['eligible']}
+        timings['evaluate'] = round(time.monotonic() - started, 3)
 
-                commission_records.append({
-                    'user_id': mom_id,
-                    'amount': float(commission_amount),
-                    'level': mom.group_mom_level
-                })
+        stage = time.monotonic()
+        try:
+            upgraded = []
+            if eligible:
+                by_level = defaultdict(list)
+                for user_id, evaluation in sorted(eligible.items()):
+                    by_level[evaluation['level']].append(user_id)
+                # 依等級分批 UPDATE，IN 清單不超過 GROUP_MOM_UPGRADE_CHUNK_SIZE；
+                # 等級條件放在 WHERE 中：評估後等級已被其他流程變更者不升級
+                chunk_size = Config.GROUP_MOM_UPGRADE_CHUNK_SIZE
+                for level, user_ids in by_level.items():
+                    for start in range(0, len(user_ids), chunk_size):
+                        upgraded.extend(db.session.execute(
+                            update(User).where(
+                                User.id.in_(user_ids[start:start + chunk_size]),
+                                User.group_mom_level == level
+                            ).values(
+                                group_mom_level=level + 1
+                            ).returning(
+                                User.id, User.group_mom_level, User.referrer_id
+                            ).execution_options(synchronize_session=False)
+                        ).all())
+                # Core UPDATE 不經過 flush 事件，自行調整推薦人的各等級直屬下線計數
+                counter_deltas = defaultdict(lambda: defaultdict(int))
+                for user_id, new_level, referrer_id in upgraded:
+                    counter_deltas[referrer_id][MOM_REFERRAL_COUNTER_FIELDS[new_level - 1]] -= 1
+                    counter_deltas[referrer_id][MOM_REFERRAL_COUNTER_FIELDS[new_level]] += 1
+                ReferralService.apply_referral_counter_deltas(counter_deltas)
+            timings['update'] = round(time.monotonic() - stage, 3)
 
-            return {
-                'success': True,
-                'commission_records': commission_records,
-                'total_commission': sum(r['amount'] for r in commission_records)
-            }
+            stage = time.monotonic()
+            if upgraded:
+                db.session.execute(insert(AuditLog), [{
+                    'action': 'group_mom_level_upgrade',
+                    'target_type': 'user',
+                    'target_id': user_id,
+                    'user_id': str(user_id),
+                    'reason': f'自動升級為{new_level}級團媽',
+                    'data': {
+                        'old_level': new_level - 1,
+                        'new_level': new_level,
+                        'active_downlines': eligible[user_id]['active_downlines'],
+                        'total_spent': eligible[user_id]['total_spent'],
+                        'qualified_downlines': eligible[user_id]['qualified_downlines'],
+                        'upgraded_at': now.isoformat()
+                    },
+                    'created_at': now
+                } for user_id, new_level, _ in upgraded])
+            db.session.commit()
+            timings['audit'] = round(time.monotonic() - stage, 3)
         except Exception as e:
-            return {'success': False, 'message': str(e)}
\ No newline at end of file
+            db.session.rollback()
+            return {'success': False, 'message': str(e), 'timings': timings}
+
+        timings['total'] = round(time.monotonic() - started, 3)
+        return {
+            'success': True,
+            'candidate_count': len(evaluations),
+            'upgrade_count': len(upgraded),
+            'upgrades': [
+                {'user_id': user_id, 'old_level': new_level - 1, 'new_level': new_level}
+                for user_id, new_level, _ in sorted(upgraded)
+            ],
+            'timings': timings
+        }
@@ -4,6 +4,7 @@ from backend.models.product import Product
 from backend.models.user import User
 from backend.models.company_account import CompanyAccount
 from backend.models.settlement import UnsettledOrder
+from backend.services.referral_service import ReferralService
 from datetime import datetime, timedelta
 
 class OrderService:
@@ -39,7 +40,9 @@ class OrderService:
             total_price=total_price,
             payment_deadline=payment_deadline,
             recipient_id=data['recipient_id'],
-            status='pending'
+            status='pending',
+            # 下單時的團媽鏈快照
+            **ReferralService.get_mom_chain(user_id)
         )
         
         # 創建未結算訂單記錄
@@ -0,0 +1,117 @@
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import text
+from backend.extensions import db
+from backend.config import Config
+from backend.utils.partitioning import (
+    PARTITIONED_TABLES, ARCHIVE_SCHEMA, add_months, create_partition_sql, default_partition_name,
+    month_rows_condition, month_start, months_between, parse_partition_name, partition_name,
+    split_default_partition_sql
+)
+
+
+class PartitionService:
+    """
+    分區維護
+    預先建立未來月份分區，避免新資料落入預設分區；
+    超過保留月數的分區自母表卸離並移至 archive schema，期別查詢只需掃描相關分區
+    """
+
+    @staticmethod
+    def is_supported(bind=None):
+        """僅 PostgreSQL 使用宣告式分區（SQLite 測試環境為一般資料表）"""
+        return (bind or db.session.get_bind()).dialect.name == 'postgresql'
+
+    @staticmethod
+    def list_partitions(table):
+        """母表目前掛載的分區名稱"""
+        rows = db.session.execute(text("""
+            SELECT child.relname
+            FROM pg_inherits
+            JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+            WHERE pg_inherits.inhparent = CAST(:table AS regclass)
+        """), {'table': table}).scalars()
+        return set(rows)
+
+    @staticmethod
+    def missing_partitions(table, existing, today, months_ahead):
+        """當月至 months_ahead 個月後尚未建立的分區月份"""
+        current = month_start(today)
+        return [
+            month for month in months_between(current, add_months(current, months_ahead))
+            if partition_name(table, month) not in existing
+        ]
+
+    @staticmethod
+    def expired_partitions(table, existing, today, retention_months):
+        """早於保留期間的月分區名稱（預設分區不卸離）"""
+        cutoff = add_months(month_start(today), -retention_months)
+        expired = []
+        for name in existing:
+            parsed = parse_partition_name(name)
+            if parsed and parsed[0] == table and parsed[1] is not None and parsed[1] < cutoff:
+                expired.append(name)
+        return sorted(expired)
+
+    @staticmethod
+    def ensure_future_partitions(months_ahead=None, today=None):
+        """
+        建立當月起 months_ahead 個月的分區
+        預設分區已收到該月資料時，先將資料搬入新建的月分區
+        :return: 新建的分區名稱
+        """
+        if not PartitionService.is_supported():
+            return []
+        months_ahead = Config.PARTITION_MONTHS_AHEAD if months_ahead is None else months_ahead
+        today = today or datetime.utcnow().date()
+
+        created = []
+        for table in PARTITIONED_TABLES:
+            existing = PartitionService.list_partitions(table)
+            default = default_partition_name(table)
+            for month in PartitionService.missing_partitions(table, existing, today, months_ahead):
+                statements = [create_partition_sql(table, month)]
+                if default in existing and db.session.execute(text(
+                    f'SELECT EXISTS (SELECT 1 FROM {default} WHERE {month_rows_condition(table, month)})'
+                )).scalar():
+                    statements = split_default_partition_sql(table, month)
+                for statement in statements:
+                    db.session.execute(text(statement))
+                created.append(partition_name(table, month))
+        db.session.commit()
+        return created
+
+    @staticmethod
+    def archive_partitions(retention_months=None, today=None):
+        """
+        卸離超過保留月數的分區並移至 archive schema
+        卸離後的資料表仍可直接查詢或備份後刪除
+        :return: 已封存的分區名稱
+        """
+        if not PartitionService.is_supported():
+            return []
+        retention_months = Config.PARTITION_RETENTION_MONTHS if retention_months is None else retention_months
+        today = today or datetime.utcnow().date()
+
+        archived = []
+        for table in PARTITIONED_TABLES:
+            existing = PartitionService.list_partitions(table)
+            for name in PartitionService.expired_partitions(table, existing, today, retention_months):
+                db.session.execute(text(f'CREATE SCHEMA IF NOT EXISTS {ARCHIVE_SCHEMA}'))
+                db.session.execute(text(f'ALTER TABLE {table} DETACH PARTITION {name}'))
+                db.session.execute(text(f'ALTER TABLE {name} SET SCHEMA {ARCHIVE_SCHEMA}'))
+                archived.append(name)
+        db.session.commit()
+        return archived
+
+    @staticmethod
+    def maintain_partitions(today=None):
+        """每月分區維護：補建未來分區並封存過期分區"""
+        result = {
+            'created': PartitionService.ensure_future_partitions(today=today),
+            'archived': PartitionService.archive_partitions(today=today)
+        }
+        current_app.logger.info(
+            f"分區維護完成：新建 {len(result['created'])} 個，封存 {len(result['archived'])} 個"
+        )
+        return result
@@ -0,0 +1,145 @@
+import random
+from collections import defaultdict
+from datetime import datetime
+from sqlalchemy import case, extract, func, select, text
+from backend.config import Config
+from backend.extensions import db
+from backend.models.order import Order
+from backend.models.settlement import Settlement
+from backend.models.platform_summary import PlatformSummary
+from backend.utils.bulk_ops import upsert
+
+# 全平台合計（讀取時加總各期別）的期別代號
+ALL_PERIODS = 'all'
+SUMMARY_FIELDS = ('total_revenue', 'settled_amount', 'unsettled_amount', 'platform_profit', 'tax_amount')
+
+
+def settlement_period(date):
+    """日期所屬結算期別：1-15 日為 a，16 日後為 b"""
+    return f"{date.year}{date.month:02d}{'a' if date.day <= 15 else 'b'}"
+
+
+def previous_settlement_period(period):
+    """上一個結算期別：b 期的上一期為同月 a 期，a 期的上一期為上月 b 期"""
+    if period.endswith('b'):
+        return f"{period[:-1]}a"
+    year, month = int(period[:4]), int(period[4:6])
+    year, month = (year - 1, 12) if month == 1 else (year, month - 1)
+    return f"{year}{month:02d}b"
+
+
+class PlatformSummaryService:
+    """
+    平台金流總覽
+    依結算期別維護營收、已結算、未結算、平台利潤與稅金的累計值，
+    訂單與結算單狀態變動時以差額增量更新；每期別分為 PLATFORM_SUMMARY_SHARDS 個分片列，
+    各資料庫連線固定寫入同一分片，同期別的並行交易不會全部等待同一列鎖
+    """
+
+    @staticmethod
+    def order_contribution(status, total_price, platform_profit, tax_amount, settled_at):
+        """單筆訂單對總覽各欄位的貢獻（僅已完成訂單計入）"""
+        if status != 'completed':
+            return {}
+        return {
+            'total_revenue': total_price or 0,
+            'unsettled_amount': (total_price or 0) if settled_at is None else 0,
+            'platform_profit': platform_profit or 0,
+            'tax_amount': tax_amount or 0
+        }
+
+    @staticmethod
+    def settlement_contribution(status, total_amount):
+        """單張結算單對總覽的貢獻（僅已撥款結算單計入）"""
+        if status != 'paid':
+            return {}
+        return {'settled_amount': total_amount or 0}
+
+    @staticmethod
+    def _shard(connection) -> int:
+        """連線固定使用的分片（記錄於 DBAPI 連線的 info，連線池重用時不變）"""
+        return connection.info.setdefault('platform_summary_shard', random.randrange(Config.PLATFORM_SUMMARY_SHARDS))
+
+    @staticmethod
+    def apply_deltas(deltas, connection=None):
+        """
+        累加各期別差額至本連線的分片列（依期別排序寫入，交易間鎖定順序一致）
+        :param deltas: {period: {欄位: 差額}}
+        """
+        merged = defaultdict(lambda: defaultdict(float))
+        for period, values in deltas.items():
+            for field, value in values.items():
+                if value:
+                    merged[period][field] += value
+        if not merged:
+            return
+
+        shard = PlatformSummaryService._shard(connection or db.session.connection())
+        now = datetime.utcnow()
+        upsert(PlatformSummary, [
+            dict({field: values.get(field, 0) for field in SUMMARY_FIELDS}, period=period, shard=shard, updated_at=now)
+            for period, values in sorted(merged.items())
+        ], index_elements=('period', 'shard'), set_columns=('updated_at',),
+            increment_columns=SUMMARY_FIELDS, connection=connection)
+
+    @staticmethod
+    def rebuild():
+        """
+        以全表彙總重建總覽（供首次部署或對帳修正使用）
+        PostgreSQL 上先鎖定總覽表，重建期間其他交易的差額寫入須等待重建提交後才累加，不會遺失或重複計入
+        """
+        if db.session.get_bind().dialect.name == 'postgresql':
+            db.session.execute(text(f'LOCK TABLE {PlatformSummary.__tablename__} IN SHARE ROW EXCLUSIVE MODE'))
+        half = case((extract('day', Order.created_at) <= 15, 'a'), else_='b')
+        order_rows = db.session.execute(
+            select(
+                extract('year', Order.created_at).label('year'),
+                extract('month', Order.created_at).label('month'),
+                half.label('half'),
+                func.sum(Order.total_price).label('total_revenue'),
+                func.sum(case((Order.settled_at.is_(None), Order.total_price), else_=0)).label('unsettled_amount'),
+                func.sum(Order.platform_profit).label('platform_profit'),
+                func.sum(Order.tax_amount).label('tax_amount')
+            ).where(
+                Order.status == 'completed'
+            ).group_by('year', 'month', 'half')
+        ).all()
+        settlement_rows = db.session.execute(
+            select(
+                Settlement.period,
+                func.sum(Settlement.total_amount).label('settled_amount')
+            ).where(
+                Settlement.status == 'paid'
+            ).group_by(Settlement.period)
+        ).all()
+
+        deltas = defaultdict(dict)
+        for row in order_rows:
+            period = f"{int(row.year)}{int(row.month):02d}{row.half}"
+            deltas[period].update({
+                'total_revenue': row.total_revenue or 0,
+                'unsettled_amount': row.unsettled_amount or 0,
+                'platform_profit': row.platform_profit or 0,
+                'tax_amount': row.tax_amount or 0
+            })
+        for row in settlement_rows:
+            deltas[row.period]['settled_amount'] = row.settled_amount or 0
+
+        PlatformSummary.query.delete()
+        PlatformSummaryService.apply_deltas(deltas)
+        db.session.commit()
+        return len(deltas)
+
+    @staticmethod
+    def get_summary(period=None):
+        """讀取總覽：加總期別的各分片列，未指定期別時加總所有期別（全平台合計）"""
+        query = select(
+            *(func.coalesce(func.sum(getattr(PlatformSummary, field)), 0) for field in SUMMARY_FIELDS),
+            func.max(PlatformSummary.updated_at)
+        )
+        if period:
+            query = query.where(PlatformSummary.period == period)
+        *totals, updated_at = db.session.execute(query).one()
+        summary = dict(zip(SUMMARY_FIELDS, (float(total) for total in totals)), period=period or ALL_PERIODS)
+        summary['updated_at'] = updated_at.isoformat() if updated_at else None
+        return summary
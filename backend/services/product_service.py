@@ -1,7 +1,8 @@
-from extensions import db
-from models.product import Product
-from models.user import User
-from models.order import Order
+from backend.extensions import db
+from backend.models.product import Product
+from backend.models.user import User
+from backend.models.order import Order
+from backend.utils.profit_rules import ProfitRuleEngine
 from sqlalchemy import func, desc, or_
 from datetime import datetime, timedelta
 
@@ -26,6 +27,7 @@ class ProductService:
         )
         db.session.add(product)
         db.session.commit()
+        self._prepare_profit_templates(product)
         return product
 
     def get_all_products(self):
@@ -68,6 +70,7 @@ class ProductService:
         if product.supplier_id != user_id:
             raise ValueError("Only the supplier can update this product")
         
+        pricing = (product.price, product.cost)
         product.name = data.get('name', product.name)
         product.description = data.get('description', product.description)
         product.price = float(data.get('price', product.price)) if 'price' in data else product.price
@@ -75,8 +78,16 @@ class ProductService:
         product.category = data.get('category', product.category)
         product.image_url = data.get('image_url', product.image_url)
         db.session.commit()
+        if (product.price, product.cost) != pricing:
+            self._prepare_profit_templates(product)
         return product
 
+    @staticmethod
+    def _prepare_profit_templates(product):
+        """商品建立或改價時預先建立單位分潤範本，該商品的訂單計算分潤時直接命中"""
+        if product.price is not None and product.cost is not None:
+            ProfitRuleEngine.prepare_unit_templates(product.price, product.cost)
+
     def get_hot_products(self, limit=5):
         """獲取熱賣商品，根據訂單數量排序"""
         subquery = db.session.query(
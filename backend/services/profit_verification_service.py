@@ -0,0 +1,141 @@
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+from flask import current_app
+from sqlalchemy import select
+from backend.extensions import db
+from backend.config import Config
+from backend.models.order import Order
+from backend.utils.profit_calculator import MONEY_SCALE, ProfitCalculator
+from backend.utils.bulk_ops import update_by_id
+
+# 驗證失敗寫入 calculation_error_log 的前綴；僅清除本作業標記過的訂單
+VERIFICATION_ERROR_PREFIX = '分潤明細驗證失敗'
+# 報表列出的失敗訂單上限
+REPORT_FAILED_LIMIT = 100
+
+
+class ProfitVerificationService:
+    """
+    分潤明細批次驗證
+    依訂單 ID 分批串流讀取 orders.profit_breakdown，以整數金額單位核對拆分項目加總與售價；
+    每批只更新驗證結果有變動的訂單並立即提交，不對訂單表持有長時間鎖定
+    """
+
+    @staticmethod
+    def verify_orders(
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        chunk_size: Optional[int] = None
+    ) -> Dict:
+        """
+        驗證建立時間介於 [start, end) 的訂單分潤明細
+        :return: 彙總報表（掃描、通過、失敗、缺少明細、更新筆數與失敗訂單）
+        """
+        started = time.perf_counter()
+        chunk_size = chunk_size or Config.PROFIT_VERIFICATION_CHUNK_SIZE
+        report = {
+            'start': start.isoformat() if start else None,
+            'end': end.isoformat() if end else None,
+            'scanned': 0,
+            'verified': 0,
+            'failed': 0,
+            'missing': 0,
+            'flagged': 0,
+            'cleared': 0,
+            'chunks': 0,
+            'failed_orders': [],
+        }
+
+        conditions = []
+        if start is not None:
+            conditions.append(Order.created_at >= start)
+        if end is not None:
+            conditions.append(Order.created_at < end)
+        last_id = 0
+        while True:
+            rows = db.session.execute(
+                select(
+                    Order.id, Order.created_at, Order.total_price, Order.profit_breakdown,
+                    Order.calculation_verified, Order.calculation_error_log
+                ).where(Order.id > last_id, *conditions).order_by(Order.id).limit(chunk_size)
+            ).all()
+            if not rows:
+                break
+            last_id = rows[-1].id
+            ProfitVerificationService._verify_chunk(rows, report)
+            # 每批提交，結束讀取交易並釋放更新列的鎖
+            db.session.commit()
+            report['chunks'] += 1
+
+        report['elapsed_seconds'] = round(time.perf_counter() - started, 4)
+        current_app.logger.info(
+            '分潤明細驗證完成：掃描 %s 筆，通過 %s 筆，失敗 %s 筆，缺少明細 %s 筆，耗時 %ss',
+            report['scanned'], report['verified'], report['failed'], report['missing'], report['elapsed_seconds']
+        )
+        return report
+
+    @staticmethod
+    def _verify_chunk(rows: List, report: Dict):
+        """驗證一批訂單並批次寫回變動的驗證旗標"""
+        report['scanned'] += len(rows)
+        checked = [row for row in rows if isinstance(row.profit_breakdown, dict)]
+        report['missing'] += sum(1 for row in rows if row.profit_breakdown is None)
+        malformed = [row for row in rows if row.profit_breakdown is not None and not isinstance(row.profit_breakdown, dict)]
+
+        differences = ProfitVerificationService._differences(checked)
+        updates = []
+        for row, difference in zip(checked, differences):
+            if difference is not None and abs(difference) <= MONEY_SCALE // 100:
+                report['verified'] += 1
+                if (row.calculation_error_log or '').startswith(VERIFICATION_ERROR_PREFIX):
+                    updates.append({
+                        'id': row.id, 'created_at': row.created_at,
+                        'calculation_verified': True, 'calculation_error_log': None
+                    })
+                    report['cleared'] += 1
+                continue
+            if difference is None:
+                error = f'{VERIFICATION_ERROR_PREFIX}：分潤明細格式錯誤'
+            else:
+                error = f'{VERIFICATION_ERROR_PREFIX}：拆分項目加總與售價差額 {difference / MONEY_SCALE:.6f}'
+            ProfitVerificationService._flag(row, error, difference, report, updates)
+        for row in malformed:
+            ProfitVerificationService._flag(row, f'{VERIFICATION_ERROR_PREFIX}：分潤明細格式錯誤', None, report, updates)
+
+        if updates:
+            update_by_id(Order, updates)
+
+    @staticmethod
+    def _flag(row, error, difference, report, updates):
+        report['failed'] += 1
+        if len(report['failed_orders']) < REPORT_FAILED_LIMIT:
+            report['failed_orders'].append({
+                'order_id': row.id,
+                'difference': difference / MONEY_SCALE if difference is not None else None,
+            })
+        if row.calculation_verified is not False or row.calculation_error_log != error:
+            updates.append({
+                'id': row.id, 'created_at': row.created_at,
+                'calculation_verified': False, 'calculation_error_log': error
+            })
+            report['flagged'] += 1
+
+    @staticmethod
+    def _differences(rows: List) -> List[Optional[int]]:
+        """向量化計算差額；明細含非數值時改逐筆計算以定位格式錯誤的訂單"""
+        if not rows:
+            return []
+        try:
+            return ProfitCalculator.partition_differences(
+                [row.total_price for row in rows], [row.profit_breakdown for row in rows]
+            ).tolist()
+        except (TypeError, ValueError):
+            pass
+        differences = []
+        for row in rows:
+            try:
+                differences.append(int(ProfitCalculator.partition_differences([row.total_price], [row.profit_breakdown])[0]))
+            except (TypeError, ValueError):
+                differences.append(None)
+        return differences
@@ -0,0 +1,255 @@
+import time
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+from sqlalchemy import and_, bindparam, delete, func, insert, literal, or_, select, true, update
+from sqlalchemy.orm import aliased
+from backend.config import Config
+from backend.extensions import db
+from backend.models.user import User
+from backend.models.referral_closure import ReferralClosure
+from backend.services.downline_stats_service import DownlineStatsService
+
+# 團媽等級對應的訂單欄位（1: 小團媽, 2: 中團媽, 3: 大團媽）
+MOM_CHAIN_FIELDS = {1: 'small_mom_id', 2: 'middle_mom_id', 3: 'big_mom_id'}
+# 推薦人的直屬下線計數欄位（依團媽等級）
+MOM_REFERRAL_COUNTER_FIELDS = {1: 'small_mom_referral_count', 2: 'middle_mom_referral_count', 3: 'big_mom_referral_count'}
+REFERRAL_COUNTER_FIELDS = ('referral_count', *MOM_REFERRAL_COUNTER_FIELDS.values())
+
+
+class ReferralService:
+    """
+    推薦關係上線解析
+    以閉包表 referral_closure 保存每位用戶的所有上線與層數，
+    上線鏈與團媽鏈只需一次索引查詢；User.referrer_id 變動時由 flush 事件增量維護
+    """
+
+    @staticmethod
+    def add_user(user_id, referrer_id=None, connection=None):
+        """新用戶：自身一列，並複製推薦人的所有上線（層數 + 1）"""
+        connection = connection or db.session.connection()
+        connection.execute(insert(ReferralClosure).values(ancestor_id=user_id, descendant_id=user_id, depth=0))
+        if referrer_id is not None:
+            connection.execute(insert(ReferralClosure).from_select(
+                ['ancestor_id', 'descendant_id', 'depth'],
+                select(ReferralClosure.ancestor_id, literal(user_id), ReferralClosure.depth + 1)
+                .where(ReferralClosure.descendant_id == referrer_id)
+            ))
+
+    @staticmethod
+    def move_user(user_id, referrer_id=None, connection=None):
+        """
+        變更推薦人：整棵下線子樹隨之搬移
+        先刪除子樹與原上線之間的關係，再以新推薦人的上線 × 子樹成員補上新關係；
+        子樹成員的下線統計自原上線扣除、累加至新上線（兩者共同的上線不變）
+        """
+        connection = connection or db.session.connection()
+        subtree = select(ReferralClosure.descendant_id).where(ReferralClosure.ancestor_id == user_id)
+        new_ancestors = set()
+        if referrer_id is not None:
+            in_subtree = connection.execute(
+                select(ReferralClosure.depth).where(
+                    ReferralClosure.ancestor_id == user_id, ReferralClosure.descendant_id == referrer_id
+                )
+            ).first()
+            if in_subtree is not None:
+                raise ValueError('推薦人不可為自己或自己的下線')
+            new_ancestors = set(connection.execute(
+                select(ReferralClosure.ancestor_id).where(ReferralClosure.descendant_id == referrer_id)
+            ).scalars())
+
+        old_ancestors = select(ReferralClosure.ancestor_id).where(
+            ReferralClosure.descendant_id == user_id, ReferralClosure.depth > 0
+        )
+        removed = set(connection.execute(old_ancestors).scalars())
+        connection.execute(delete(ReferralClosure).where(
+            ReferralClosure.descendant_id.in_(subtree),
+            ReferralClosure.ancestor_id.in_(old_ancestors)
+        ))
+        if referrer_id is not None:
+            upline = aliased(ReferralClosure)
+            downline = aliased(ReferralClosure)
+            connection.execute(insert(ReferralClosure).from_select(
+                ['ancestor_id', 'descendant_id', 'depth'],
+                select(upline.ancestor_id, downline.descendant_id, upline.depth + downline.depth + 1)
+                .select_from(upline)
+                .join(downline, true())
+                .where(upline.descendant_id == referrer_id, downline.ancestor_id == user_id)
+            ))
+        # Core 寫入不經過 flush 事件，自行搬移下線統計
+        DownlineStatsService.move_subtree(
+            user_id, removed - new_ancestors, new_ancestors - removed, connection=connection
+        )
+
+    @staticmethod
+    def remove_user(user_id, connection=None):
+        connection = connection or db.session.connection()
+        connection.execute(delete(ReferralClosure).where(
+            (ReferralClosure.ancestor_id == user_id) | (ReferralClosure.descendant_id == user_id)
+        ))
+
+    @staticmethod
+    def rebuild(connection=None) -> int:
+        """
+        依 users.referrer_id 全量重建閉包表（首次部署或對帳修正使用）
+        逐層以 INSERT ... SELECT 展開，每層一條語句
+        :return: 最大層數
+        """
+        connection = connection or db.session.connection()
+        connection.execute(delete(ReferralClosure))
+        connection.execute(insert(ReferralClosure).from_select(
+            ['ancestor_id', 'descendant_id', 'depth'],
+            select(User.id, User.id, literal(0))
+        ))
+        user_count = connection.execute(select(func.count(User.id))).scalar()
+        depth = 0
+        while True:
+            inserted = connection.execute(insert(ReferralClosure).from_select(
+                ['ancestor_id', 'descendant_id', 'depth'],
+                select(ReferralClosure.ancestor_id, User.id, literal(depth + 1))
+                .select_from(User)
+                .join(ReferralClosure, ReferralClosure.descendant_id == User.referrer_id)
+                .where(ReferralClosure.depth == depth)
+            )).rowcount
+            if not inserted:
+                return depth
+            depth += 1
+            if depth > user_count:
+                raise ValueError('推薦關係存在循環，無法建立閉包表')
+
+    @staticmethod
+    def referral_counter_contribution(is_active, group_mom_level) -> Dict:
+        """單一用戶對其推薦人直屬下線計數的貢獻"""
+        contribution = {}
+        if is_active:
+            contribution['referral_count'] = 1
+        field = MOM_REFERRAL_COUNTER_FIELDS.get(group_mom_level)
+        if field:
+            contribution[field] = 1
+        return contribution
+
+    @staticmethod
+    def apply_referral_counter_deltas(deltas, connection=None):
+        """
+        以 欄位 = 欄位 + 差額 累加推薦人的直屬下線計數
+        :param deltas: {推薦人 ID: {欄位: 差額}}
+        :param connection: 於 flush 事件中寫入時傳入 session.connection()，預設使用 db.session
+        """
+        rows = [
+            dict({f'delta_{field}': values.get(field, 0) for field in REFERRAL_COUNTER_FIELDS}, user_id=referrer_id)
+            for referrer_id, values in deltas.items()
+            if referrer_id is not None and any(values.values())
+        ]
+        if not rows:
+            return
+        table = User.__table__
+        (connection or db.session).execute(
+            update(table).where(table.c.id == bindparam('user_id')).values({
+                field: func.coalesce(table.c[field], 0) + bindparam(f'delta_{field}')
+                for field in REFERRAL_COUNTER_FIELDS
+            }),
+            rows
+        )
+
+    @staticmethod
+    def reconcile_referral_counters(chunk_size: Optional[int] = None) -> Dict:
+        """
+        對帳直屬下線計數：依用戶 ID 分段，每段以單一關聯子查詢 UPDATE 只改寫不一致的用戶並提交
+        """
+        chunk_size = chunk_size or Config.REFERRAL_RECONCILE_CHUNK_SIZE
+        started = time.monotonic()
+        summary = {'scanned': 0, 'corrected': 0, 'chunks': 0}
+        users = User.__table__
+        referral = users.alias('referral')
+        conditions = {'referral_count': referral.c.is_active.is_(True)}
+        conditions.update({
+            field: referral.c.group_mom_level == level for level, field in MOM_REFERRAL_COUNTER_FIELDS.items()
+        })
+        actual = {
+            field: select(func.count()).where(referral.c.referrer_id == users.c.id, condition).scalar_subquery()
+            for field, condition in conditions.items()
+        }
+        first_id, last_id = bindparam('first_id'), bindparam('last_id')
+        statement = update(users).where(
+            users.c.id.between(first_id, last_id),
+            or_(*(users.c[field].is_distinct_from(subquery) for field, subquery in actual.items()))
+        ).values(actual)
+        boundary = 0
+        while True:
+            user_ids = db.session.execute(
+                select(users.c.id).where(users.c.id > boundary).order_by(users.c.id).limit(chunk_size)
+            ).scalars().all()
+            if not user_ids:
+                break
+            boundary = user_ids[-1]
+            result = db.session.execute(statement, {'first_id': user_ids[0], 'last_id': boundary})
+            db.session.commit()
+
+            summary['chunks'] += 1
+            summary['scanned'] += len(user_ids)
+            summary['corrected'] += result.rowcount
+        summary['elapsed_seconds'] = round(time.monotonic() - started, 3)
+        return summary
+
+    @staticmethod
+    def get_upline_ids(user_id, max_depth: Optional[int] = None) -> List:
+        """由近到遠的上線用戶 ID"""
+        query = select(ReferralClosure.ancestor_id).where(
+            ReferralClosure.descendant_id == user_id, ReferralClosure.depth > 0
+        )
+        if max_depth is not None:
+            query = query.where(ReferralClosure.depth <= max_depth)
+        return db.session.execute(query.order_by(ReferralClosure.depth)).scalars().all()
+
+    @staticmethod
+    def get_group_mom_upline(user_id, limit: Optional[int] = None) -> List[User]:
+        """由近到遠的團媽上線（group_mom_level > 0）"""
+        query = User.query.join(
+            ReferralClosure, ReferralClosure.ancestor_id == User.id
+        ).filter(
+            ReferralClosure.descendant_id == user_id,
+            ReferralClosure.depth > 0,
+            User.group_mom_level > 0
+        ).order_by(ReferralClosure.depth)
+        if limit is not None:
+            query = query.limit(limit)
+        return query.all()
+
+    @staticmethod
+    def get_mom_chain(user_id, fee_valid_only: bool = False) -> Dict:
+        """用戶的大/中/小團媽，格式 {'big_mom_id', 'middle_mom_id', 'small_mom_id'}"""
+        return ReferralService.get_mom_chains([user_id], fee_valid_only)[user_id]
+
+    @staticmethod
+    def get_mom_chains(user_ids: Iterable, fee_valid_only: bool = False) -> Dict:
+        """
+        批次解析團媽鏈：一次查詢取得所有用戶的團媽上線
+        由近到遠取第一位小團媽、其上第一位中團媽、再其上第一位大團媽；
+        較高等級團媽之上的低等級團媽不列入
+        :param fee_valid_only: 僅計入會費有效的團媽
+        """
+        user_ids = list(user_ids)
+        chains = {user_id: dict.fromkeys(MOM_CHAIN_FIELDS.values()) for user_id in user_ids}
+        if not user_ids:
+            return chains
+
+        conditions = [
+            ReferralClosure.descendant_id.in_(user_ids),
+            ReferralClosure.depth > 0,
+            User.group_mom_level > 0
+        ]
+        if fee_valid_only:
+            conditions.append(User.group_mom_fee_paid_until > datetime.utcnow())
+        rows = db.session.execute(
+            select(ReferralClosure.descendant_id, User.id, User.group_mom_level)
+            .join(User, User.id == ReferralClosure.ancestor_id)
+            .where(and_(*conditions))
+            .order_by(ReferralClosure.descendant_id, ReferralClosure.depth)
+        )
+        reached = defaultdict(int)
+        for descendant_id, mom_id, level in rows:
+            if level <= reached[descendant_id] or level not in MOM_CHAIN_FIELDS:
+                continue
+            chains[descendant_id][MOM_CHAIN_FIELDS[level]] = mom_id
+            reached[descendant_id] = level
+        return chains
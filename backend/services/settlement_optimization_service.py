@@ -1,63 +1,207 @@
+import copy
+import os
+import threading
+import time
+from collections import OrderedDict, defaultdict
 from datetime import datetime, timedelta
-from sqlalchemy import and_, or_, text
-from models.order import Order
-from models.settlement import Settlement, UnsettledOrder
-from models.audit import AuditLog
-from extensions import db
+from sqlalchemy import and_, or_, case, cast, func, insert, select, text
+from backend.models.order import Order
+from backend.models.settlement import Settlement, SettlementItem, UnsettledOrder
+from backend.models.user import User
+from backend.models.audit import AuditLog
+from backend.extensions import db
+from backend.utils.profit_calculator import ProfitCalculator
+from backend.utils.profit_rules import ProfitRuleEngine, register_ruleset
+from backend.services.partition_service import PartitionService
+from backend.utils.partitioning import PARTITIONED_TABLES
+from backend.utils.bulk_ops import update_by_id
+from backend.services.platform_summary_service import (
+    PlatformSummaryService, previous_settlement_period, settlement_period
+)
 import concurrent.futures
-from typing import List, Dict
+from typing import List, Dict, Tuple
+import numpy as np
 import pandas as pd
 
+
+def _recompute_profit_chunk(rows: List[Tuple], rulesets: Dict = None) -> List[Tuple]:
+    """
+    子程序執行：依訂單的分潤規則集版本分組，以向量化批次 API 重算一批訂單分潤
+    :param rows: (order_id, total_price, cost, has_big_mom, has_middle_mom, has_small_mom, has_referrer, ruleset_version)
+    :param rulesets: {版本: 規則集定義}，由主程序隨批次傳入；spawn/forkserver 啟動的子程序只有匯入時建立的規則集，
+                     執行期間註冊的版本須先在子程序註冊（已發布的版本定義不同時 register_ruleset 會拋出錯誤）
+    :return: (order_id, 分潤明細或 None, 錯誤訊息或 None)
+    """
+    for version, ruleset in (rulesets or {}).items():
+        register_ruleset(version, ruleset)
+    by_version = defaultdict(list)
+    for row in rows:
+        by_version[row[7]].append(row)
+    results = []
+    for version, version_rows in by_version.items():
+        results.extend(_recompute_version_rows(version, version_rows))
+    return results
+
+
+def _recompute_version_rows(version: str, rows: List[Tuple]) -> List[Tuple]:
+    """同一規則集版本的訂單批次重算，資料異常時改逐筆計算以定位錯誤訂單"""
+    order_ids, total_prices, costs, has_big, has_middle, has_small, has_referrer, _ = zip(*rows)
+    try:
+        batch = ProfitRuleEngine.evaluate_batch(
+            total_prices, costs, has_big, has_middle, has_small, has_referrer, version=version
+        )
+    except Exception:
+        return _recompute_profit_rows(rows)
+
+    verified = ProfitCalculator.verify_breakdown_batch(total_prices, batch).tolist()
+    keys = list(batch)
+    columns = zip(*(batch[key].tolist() for key in keys))
+    return [
+        (order_id, dict(zip(keys, values), ruleset_version=version), None) if ok
+        else (order_id, None, '金流計算驗證失敗')
+        for order_id, ok, values in zip(order_ids, verified, columns)
+    ]
+
+
+def _recompute_profit_rows(rows: List[Tuple]) -> List[Tuple]:
+    """逐筆重算分潤，個別訂單計算失敗不影響其他訂單"""
+    results = []
+    for order_id, total_price, cost, has_big, has_middle, has_small, has_referrer, version in rows:
+        try:
+            breakdown = ProfitRuleEngine.evaluate(
+                total_price, cost, has_big, has_middle, has_small, has_referrer=has_referrer, version=version
+            )
+            if ProfitCalculator.verify_breakdown(total_price, breakdown):
+                results.append((order_id, breakdown, None))
+            else:
+                results.append((order_id, None, '金流計算驗證失敗'))
+        except Exception as e:
+            results.append((order_id, None, str(e)))
+    return results
+
+
+# 自動稽核規則：mask 接收欄位化的訂單特徵 DataFrame 回傳布林遮罩，details 產生單筆違規說明
+# 可用特徵：id, user_id, total_price, platform_profit, status, created_at,
+#          profit_rate, recent_orders, user_orders, user_returns, return_rate
+AUDIT_RULES = [
+    {
+        'name': 'high_value_order',
+        'mask': lambda df: df['total_price'] >= 50000,
+        'details': lambda row: f'訂單金額 {row.total_price} 超過 50,000'
+    },
+    {
+        'name': 'abnormal_profit_rate',
+        'mask': lambda df: (df['status'] == 'completed') & (df['profit_rate'] > 0.3),  # 利潤率超過 30%
+        'details': lambda row: f'利潤率 {row.profit_rate*100:.1f}% 異常'
+    },
+    {
+        'name': 'frequent_orders',
+        'mask': lambda df: df['recent_orders'] >= 5,  # 24小時內超過5筆訂單
+        'details': lambda row: f'用戶在24小時內下了 {row.recent_orders} 筆訂單'
+    },
+    {
+        'name': 'high_return_rate',
+        'mask': lambda df: (df['user_orders'] >= 5) & (df['return_rate'] > 0.4),  # 退貨率超過40%
+        'details': lambda row: f'用戶退貨率 {row.return_rate*100:.1f}% 過高'
+    }
+]
+
+
 class SettlementOptimizationService:
     BATCH_SIZE = 1000
-    MAX_WORKERS = 4
+    # 快速重複訂單的時間窗
+    FREQUENT_ORDER_WINDOW = timedelta(hours=24)
+    # 結算分析快取：(期別, 資料版本) -> 分析結果，保留最近使用的期別
+    ANALYSIS_CACHE_SIZE = 24
+    _analysis_cache = OrderedDict()
+    _analysis_cache_lock = threading.Lock()
+    MAX_WORKERS = os.cpu_count() or 1
     
     @staticmethod
-    def process_settlement_batch(orders: List[Order]) -> Dict:
-        """使用多線程處理結算批次"""
-        with concurrent.futures.ThreadPoolExecutor(max_workers=SettlementOptimizationService.MAX_WORKERS) as executor:
-            # 將訂單分批處理
-            batches = [
-                orders[i:i + SettlementOptimizationService.BATCH_SIZE]
-                for i in range(0, len(orders), SettlementOptimizationService.BATCH_SIZE)
-            ]
-            
-            # 並行處理每個批次
-            futures = [
-                executor.submit(SettlementOptimizationService._process_batch, batch)
+    def process_settlement_batch(orders: List, max_workers: int = None, commit: bool = True) -> Dict:
+        """
+        以多程序平行重算訂單分潤
+        只傳遞訂單的純數值欄位給子程序，結果回到主程序後以主鍵批次 UPDATE 寫回
+        :param orders: Order 物件或訂單 ID 列表
+        :param commit: 為 False 時由呼叫端與其他寫入一併提交
+        """
+        started = time.perf_counter()
+        max_workers = max_workers or SettlementOptimizationService.MAX_WORKERS
+        batch_size = SettlementOptimizationService.BATCH_SIZE
+        order_ids = [order.id if isinstance(order, Order) else order for order in orders]
+        ruleset_version = ProfitRuleEngine.current_version()
+
+        # 讀取重算所需欄位與目前金額（用於平台總覽差額）
+        rows = []
+        current = {}
+        for start in range(0, len(order_ids), batch_size):
+            for row in db.session.execute(
+                select(
+                    Order.id, Order.total_price, Order.cost,
+                    Order.big_mom_id.isnot(None), Order.middle_mom_id.isnot(None),
+                    Order.small_mom_id.isnot(None), Order.referrer_id.isnot(None),
+                    Order.status, Order.settled_at, Order.created_at,
+                    Order.platform_profit, Order.tax_amount, Order.profit_ruleset_version
+                ).where(Order.id.in_(order_ids[start:start + batch_size]))
+            ):
+                rows.append(tuple(row[:7]) + (row.profit_ruleset_version or ruleset_version,))
+                current[row.id] = row
+        batches = [rows[i:i + batch_size] for i in range(0, len(rows), batch_size)]
+
+        # 並行處理每個批次（單一批次或單核時直接在主程序計算）
+        if max_workers > 1 and len(batches) > 1:
+            # 規則集定義隨批次傳給子程序，不依賴子程序匯入時的 RULESETS
+            rulesets = [
+                {version: ProfitRuleEngine.get_ruleset(version) for version in {row[7] for row in batch}}
                 for batch in batches
             ]
-            
-            # 收集結果
-            results = [future.result() for future in concurrent.futures.as_completed(futures)]
-            
-        # 合併結果
+            with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers) as executor:
+                results = [
+                    result for chunk in executor.map(_recompute_profit_chunk, batches, rulesets) for result in chunk
+                ]
+        else:
+            results = [result for batch in batches for result in _recompute_profit_chunk(batch)]
+
+        # 批次寫回
+        updates = []
+        errors = []
+        total_amount = 0
+        summary_deltas = defaultdict(lambda: defaultdict(float))
+        for order_id, breakdown, error in results:
+            if breakdown is None:
+                errors.append(f'訂單 {order_id} 計算失敗: {error}')
+                updates.append({
+                    'id': order_id,
+                    'created_at': current[order_id].created_at,
+                    'calculation_verified': False,
+                    'calculation_error_log': error
+                })
+                continue
+            values = Order.profit_columns(breakdown)
+            before = current[order_id]
+            # 帶上分區鍵，UPDATE 只探測該訂單所在分區
+            updates.append(dict(values, id=order_id, created_at=before.created_at))
+            total_amount += before.total_price
+            if before.status == 'completed':
+                period = settlement_period(before.created_at)
+                summary_deltas[period]['platform_profit'] += values['platform_profit'] - (before.platform_profit or 0)
+                summary_deltas[period]['tax_amount'] += values['tax_amount'] - (before.tax_amount or 0)
+
+        for start in range(0, len(updates), batch_size):
+            update_by_id(Order, updates[start:start + batch_size])
+        # 批次更新不經過 ORM flush，需自行累加平台總覽差額
+        PlatformSummaryService.apply_deltas(summary_deltas)
+        if commit:
+            db.session.commit()
+
         return {
-            'total_processed': sum(r['processed_count'] for r in results),
-            'total_amount': sum(r['total_amount'] for r in results),
-            'errors': [e for r in results for e in r['errors']]
+            'total_processed': len(results) - len(errors),
+            'failed_order_ids': [order_id for order_id, breakdown, _ in results if breakdown is None],
+            'total_amount': total_amount,
+            'errors': errors,
+            'workers': max_workers if len(batches) > 1 else 1,
+            'elapsed_seconds': round(time.perf_counter() - started, 4)
         }
-    
-    @staticmethod
-    def _process_batch(orders: List[Order]) -> Dict:
-        """處理單個批次的訂單"""
-        results = {
-            'processed_count': 0,
-            'total_amount': 0,
-            'errors': []
-        }
-        
-        for order in orders:
-            try:
-                if order.calculate_profits():
-                    results['processed_count'] += 1
-                    results['total_amount'] += order.total_price
-                else:
-                    results['errors'].append(f'訂單 {order.id} 計算失敗')
-            except Exception as e:
-                results['errors'].append(f'訂單 {order.id} 處理錯誤: {str(e)}')
-        
-        return results
 
     @staticmethod
     def optimize_database_queries():
@@ -78,120 +222,219 @@ class SettlementOptimizationService:
         # 更新資料庫統計資訊
         db.session.execute(text('ANALYZE orders, settlements;'))
         
-        # 設置資料表自動維護
-        db.session.execute(text("""
-            ALTER TABLE orders SET (
-                autovacuum_vacuum_scale_factor = 0.05,
-                autovacuum_analyze_scale_factor = 0.02
-            );
-            
-            ALTER TABLE settlements SET (
-                autovacuum_vacuum_scale_factor = 0.05,
-                autovacuum_analyze_scale_factor = 0.02
-            );
-        """))
+        # 預先建立未來月份分區
+        PartitionService.ensure_future_partitions()
+
+        # 設置資料表自動維護（分區母表不接受儲存參數，改設於各分區）
+        tables = []
+        for table in PARTITIONED_TABLES:
+            partitions = PartitionService.list_partitions(table)
+            tables.extend(sorted(partitions) if partitions else [table])
+        for table in tables:
+            db.session.execute(text(f"""
+                ALTER TABLE {table} SET (
+                    autovacuum_vacuum_scale_factor = 0.05,
+                    autovacuum_analyze_scale_factor = 0.02
+                )
+            """))
 
     @staticmethod
-    def automated_auditing_rules(orders: List[Order]):
-        """執行自動化稽核規則"""
-        violations = []
-        
-        for order in orders:
-            # 檢查高額訂單
-            if order.total_price >= 50000:
-                violations.append({
-                    'order_id': order.id,
-                    'rule': 'high_value_order',
-                    'details': f'訂單金額 {order.total_price} 超過 50,000'
-                })
-            
-            # 檢查異常利潤率
-            if order.status == 'completed':
-                profit_rate = order.platform_profit / order.total_price
-                if profit_rate > 0.3:  # 利潤率超過 30%
-                    violations.append({
-                        'order_id': order.id,
-                        'rule': 'abnormal_profit_rate',
-                        'details': f'利潤率 {profit_rate*100:.1f}% 異常'
-                    })
-            
-            # 檢查快速重複訂單
-            recent_orders = Order.query.filter(
-                Order.user_id == order.user_id,
-                Order.id != order.id,
-                Order.created_at >= order.created_at - timedelta(hours=24)
-            ).count()
-            
-            if recent_orders >= 5:  # 24小時內超過5筆訂單
-                violations.append({
-                    'order_id': order.id,
-                    'rule': 'frequent_orders',
-                    'details': f'用戶在24小時內下了 {recent_orders} 筆訂單'
-                })
-            
-            # 檢查退貨率
-            if order.user_id:
-                user_orders = Order.query.filter(
-                    Order.user_id == order.user_id,
-                    Order.status == 'completed'
-                ).count()
-                
-                user_returns = Order.query.filter(
-                    Order.user_id == order.user_id,
-                    Order.return_status.isnot(None)
-                ).count()
-                
-                if user_orders >= 5 and (user_returns / user_orders) > 0.4:  # 退貨率超過40%
-                    violations.append({
-                        'order_id': order.id,
-                        'rule': 'high_return_rate',
-                        'details': f'用戶退貨率 {(user_returns/user_orders)*100:.1f}% 過高'
-                    })
-        
+    def register_audit_rule(name, mask, details):
+        """註冊自動稽核規則"""
+        AUDIT_RULES.append({'name': name, 'mask': mask, 'details': details})
+
+    @staticmethod
+    def _recent_order_counts(audited: pd.DataFrame, history: pd.DataFrame, window: timedelta) -> np.ndarray:
+        """
+        計算每筆受稽核訂單前 window 時間內同一用戶的其他訂單數
+        將 (用戶, 時間) 編碼為單一遞增整數鍵，以兩次 searchsorted 取得時間窗兩端位置
+        """
+        if audited.empty or history.empty:
+            return np.zeros(len(audited), dtype=np.int64)
+
+        user_ids = pd.Index(history['user_id'].unique())
+        audited_codes = user_ids.get_indexer(audited['user_id'])
+        history_codes = user_ids.get_indexer(history['user_id'])
+        audited_us = audited['created_at'].to_numpy(dtype='datetime64[us]').astype(np.int64)
+        history_us = history['created_at'].to_numpy(dtype='datetime64[us]').astype(np.int64)
+        window_us = int(window.total_seconds() * 1_000_000)
+
+        origin = int(audited_us.min()) - window_us
+        span = int(max(history_us.max(), audited_us.max())) - origin + 1
+        # 用戶數 × 時間跨度超過 int64 時降低時間解析度
+        scale = max(1, -(-(len(user_ids) * span) // 2 ** 62))
+        band = span // scale + 1
+
+        history_keys = np.sort(history_codes * band + (history_us - origin) // scale)
+        lower = np.searchsorted(history_keys, audited_codes * band + (audited_us - window_us - origin) // scale, 'left')
+        upper = np.searchsorted(history_keys, audited_codes * band + (audited_us - origin) // scale, 'right')
+        # 扣除訂單本身；無用戶的訂單不計
+        return np.where(audited_codes >= 0, upper - lower - 1, 0)
+
+    @staticmethod
+    def _audit_features(order_ids: List[int]) -> pd.DataFrame:
+        """以欄位化擷取與兩次彙總查詢建立稽核特徵"""
+        columns = ['id', 'user_id', 'total_price', 'platform_profit', 'status', 'created_at']
+        audited = pd.DataFrame(db.session.execute(
+            select(Order.id, Order.user_id, Order.total_price, Order.platform_profit, Order.status, Order.created_at)
+            .where(Order.id.in_(order_ids))
+            .order_by(Order.id)
+        ).all(), columns=columns)
+        if audited.empty:
+            return audited
+
+        user_ids = audited['user_id'].dropna().unique().tolist()
+        window = SettlementOptimizationService.FREQUENT_ORDER_WINDOW
+
+        # 每位用戶的完成訂單數與退貨數
+        user_stats = pd.DataFrame(db.session.execute(
+            select(
+                Order.user_id,
+                func.sum(case((Order.status == 'completed', 1), else_=0)).label('user_orders'),
+                func.count(Order.return_status).label('user_returns')
+            ).where(Order.user_id.in_(user_ids)).group_by(Order.user_id)
+        ).all(), columns=['user_id', 'user_orders', 'user_returns'])
+
+        # 時間窗內同一用戶的下單時間
+        history = pd.DataFrame(db.session.execute(
+            select(Order.user_id, Order.created_at).where(
+                Order.user_id.in_(user_ids),
+                Order.created_at >= audited['created_at'].min() - window,
+                Order.created_at <= audited['created_at'].max()
+            )
+        ).all(), columns=['user_id', 'created_at'])
+
+        features = audited.merge(user_stats, on='user_id', how='left')
+        features[['user_orders', 'user_returns']] = features[['user_orders', 'user_returns']].fillna(0).astype(int)
+        features['profit_rate'] = features['platform_profit'].astype(float) / features['total_price']
+        features['return_rate'] = np.where(
+            features['user_orders'] > 0,
+            features['user_returns'] / features['user_orders'].where(features['user_orders'] > 0, 1),
+            0.0
+        )
+        features['recent_orders'] = SettlementOptimizationService._recent_order_counts(audited, history, window)
+        return features
+
+    @staticmethod
+    def automated_auditing_rules(orders: List):
+        """
+        執行自動化稽核規則
+        稽核特徵以固定次數的查詢取得，規則以向量化遮罩評估，違規紀錄批次寫入 AuditLog
+        :param orders: Order 物件或訂單 ID 列表
+        """
+        order_ids = [order.id if isinstance(order, Order) else order for order in orders]
+        features = SettlementOptimizationService._audit_features(order_ids)
+        if features.empty:
+            return []
+
+        hits = []
+        for rule_index, rule in enumerate(AUDIT_RULES):
+            mask = rule['mask'](features).fillna(False).to_numpy(dtype=bool)
+            hits.extend((position, rule_index) for position in np.flatnonzero(mask))
+        hits.sort()
+
+        rows = list(features.itertuples(index=False))
+        violations = [{
+            'order_id': int(rows[position].id),
+            'rule': AUDIT_RULES[rule_index]['name'],
+            'details': AUDIT_RULES[rule_index]['details'](rows[position])
+        } for position, rule_index in hits]
+
         # 記錄違規情況
-        for violation in violations:
-            audit_log = AuditLog(
-                action='audit_rule_violation',
-                target_type='order',
-                target_id=violation['order_id'],
-                reason=violation['rule'],
-                data={
+        if violations:
+            detected_at = datetime.now().isoformat()
+            db.session.execute(insert(AuditLog), [{
+                'action': 'audit_rule_violation',
+                'target_type': 'order',
+                'target_id': violation['order_id'],
+                'reason': violation['rule'],
+                'data': {
                     'details': violation['details'],
-                    'detected_at': datetime.now().isoformat()
+                    'detected_at': detected_at
                 }
-            )
-            db.session.add(audit_log)
-        
+            } for violation in violations])
         db.session.commit()
         return violations
 
+    @staticmethod
+    def _settlement_data_query(period: str, *columns):
+        """期別結算分析的資料範圍：結算單經由結算明細列關聯訂單與結算對象"""
+        return select(*columns).join(
+            User, User.id == cast(Settlement.user_id, db.Integer)
+        ).join(
+            SettlementItem, SettlementItem.settlement_id == Settlement.id
+        ).join(
+            Order, Order.id == SettlementItem.order_id
+        ).where(Settlement.period == period)
+
+    @staticmethod
+    def settlement_data_version(period: str) -> Tuple:
+        """
+        期別結算資料版本，與分析查詢使用相同關聯：
+        明細列數、結算單／明細列／訂單（含分潤欄位批次更新）的最後更新時間，
+        以及結算對象團媽等級的加權和（users 無更新時間欄位），任一項異動即改變
+        """
+        row = db.session.execute(SettlementOptimizationService._settlement_data_query(
+            period,
+            func.count(SettlementItem.id),
+            func.max(Settlement.updated_at),
+            func.max(SettlementItem.updated_at),
+            func.max(Order.updated_at),
+            func.sum(func.coalesce(User.group_mom_level, 0) * Settlement.id)
+        )).one()
+        return tuple(value.isoformat() if isinstance(value, datetime) else value for value in row)
+
+    @staticmethod
+    def clear_analysis_cache():
+        with SettlementOptimizationService._analysis_cache_lock:
+            SettlementOptimizationService._analysis_cache.clear()
+
     @staticmethod
     def settlement_data_analysis(period: str):
+        """
+        結算數據分析（依期別與資料版本快取）
+        已結算完成的期別只會計算一次，分析、異常檢測、匯出與報表任務共用同一結果；
+        快取為各程序獨立，每次讀取前都重新查詢資料版本，其他程序的異動同樣會使快取失效
+        """
+        cache = SettlementOptimizationService._analysis_cache
+        lock = SettlementOptimizationService._analysis_cache_lock
+        key = (period, SettlementOptimizationService.settlement_data_version(period))
+        with lock:
+            if key in cache:
+                cache.move_to_end(key)
+                return copy.deepcopy(cache[key])
+
+        analysis = SettlementOptimizationService._compute_settlement_data_analysis(period)
+        with lock:
+            # 同期別的舊版本不再使用
+            for stale in [k for k in cache if k[0] == period]:
+                del cache[stale]
+            cache[key] = analysis
+            while len(cache) > SettlementOptimizationService.ANALYSIS_CACHE_SIZE:
+                cache.popitem(last=False)
+        return copy.deepcopy(analysis)
+
+    @staticmethod
+    def _compute_settlement_data_analysis(period: str):
         """結算數據分析"""
-        # 使用 pandas 進行數據分析
-        query = text("""
-            SELECT 
-                s.settlement_type,
-                s.total_amount,
-                s.commission_amount,
-                s.tax_amount,
-                s.net_amount,
-                s.status,
-                u.group_mom_level,
-                o.total_price,
-                o.platform_profit,
-                o.supplier_fee
-            FROM settlements s
-            JOIN users u ON s.user_id = u.id
-            JOIN json_array_elements(s.order_details::json) AS od 
-                ON true
-            JOIN orders o ON o.id = (od->>'order_id')::integer
-            WHERE s.period = :period
-        """)
+        # 經由結算明細列以索引關聯訂單，使用 pandas 進行數據分析
+        query = SettlementOptimizationService._settlement_data_query(
+            period,
+            Settlement.settlement_type,
+            Settlement.total_amount,
+            Settlement.commission_amount,
+            Settlement.tax_amount,
+            Settlement.net_amount,
+            Settlement.status,
+            User.group_mom_level,
+            Order.total_price,
+            Order.platform_profit,
+            Order.supplier_fee
+        )
         
         # 執行查詢並轉換為 DataFrame
-        result = db.session.execute(query, {'period': period})
-        df = pd.DataFrame(result.fetchall(), columns=result.keys())
+        result = db.session.execute(query)
+        df = pd.DataFrame(result.fetchall(), columns=list(result.keys()))
         
         # 計算各種統計指標
         analysis = {
@@ -220,10 +463,23 @@ class SettlementOptimizationService:
         return analysis
 
     @staticmethod
-    def detect_anomalies(period: str):
-        """檢測異常情況"""
-        analysis = SettlementOptimizationService.settlement_data_analysis(period)
-        df = pd.DataFrame(analysis['by_type'])
+    def _type_totals(analysis) -> pd.DataFrame:
+        """依結算類型彙總的金額（by_type 的 sum 欄位）"""
+        by_type = pd.DataFrame(analysis['by_type'])
+        if by_type.empty:
+            return pd.DataFrame(columns=['total_amount', 'commission_amount', 'tax_amount'])
+        return pd.DataFrame({
+            col: by_type[(col, 'sum')] for col in ['total_amount', 'commission_amount', 'tax_amount']
+        })
+
+    @staticmethod
+    def detect_anomalies(period: str, analysis=None):
+        """
+        檢測異常情況
+        :param analysis: 已取得的本期分析結果，未提供時由快取讀取
+        """
+        analysis = analysis or SettlementOptimizationService.settlement_data_analysis(period)
+        df = SettlementOptimizationService._type_totals(analysis)
         
         anomalies = []
         
@@ -231,6 +487,8 @@ class SettlementOptimizationService:
         for col in ['total_amount', 'commission_amount', 'tax_amount']:
             mean = df[col].mean()
             std = df[col].std()
+            if not std:
+                continue
             outliers = df[abs(df[col] - mean) > 2 * std]
             
             for idx, value in outliers.iterrows():
@@ -243,15 +501,15 @@ class SettlementOptimizationService:
                 })
         
         # 檢測趨勢異常
-        prev_period = f"{period[:-1]}{'a' if period[-1] == 'b' else 'b'}"
+        prev_period = previous_settlement_period(period)
         prev_analysis = SettlementOptimizationService.settlement_data_analysis(prev_period)
-        prev_df = pd.DataFrame(prev_analysis['by_type'])
+        prev_df = SettlementOptimizationService._type_totals(prev_analysis)
         
         for col in ['total_amount', 'commission_amount']:
-            change = (df[col] - prev_df[col]) / prev_df[col]
+            change = ((df[col] - prev_df[col]) / prev_df[col]).dropna()
             significant_changes = change[abs(change) > 0.3]  # 30% 變化
             
-            for idx, value in significant_changes.iterrows():
+            for idx, value in significant_changes.items():
                 anomalies.append({
                     'type': 'trend_change',
                     'field': col,
@@ -261,4 +519,4 @@ class SettlementOptimizationService:
                     'previous_value': prev_df.loc[idx, col]
                 })
         
-        return anomalies
\ No newline at end of file
+        return anomalies
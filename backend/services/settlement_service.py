@@ -1,20 +1,33 @@
+import time
 from datetime import datetime, timedelta
-from sqlalchemy import and_, or_
+from collections import defaultdict
+from itertools import groupby
+from sqlalchemy import and_, or_, case, cast, func, insert, literal, select, union_all, update
+from flask import current_app
 from backend.models.order import Order
-from backend.models.settlement import Settlement, UnsettledOrder, SettlementStatement, SettlementItem
+from backend.models.product import Product
+from backend.models.settlement import (
+    Settlement, UnsettledOrder, SettlementStatement, SettlementItem, SettlementRun, SettlementRunTotal
+)
 from backend.models.user import User
 from backend.extensions import db
 from backend.config import Config
-from backend.utils.profit_calculator import ProfitCalculator
+from backend.utils.profit_rules import ProfitRuleEngine
+from backend.utils.bulk_ops import upsert
+from backend.services.platform_summary_service import PlatformSummaryService, settlement_period
 
 class SettlementService:
+    # 結算批次串流訂單明細時每批處理的筆數
+    DETAIL_CHUNK_SIZE = 5000
+    # 過期掃描每批更新的結算單數，每批各自提交以縮短鎖定時間
+    EXPIRY_BATCH_SIZE = 1000
+    # 結算明細為這些狀態時不再占用訂單，訂單可由下一次結算執行重新認領
+    RELEASED_ITEM_STATUSES = ('rejected', 'cancelled')
+
     @staticmethod
     def create_settlement_period():
         """建立結算期別代號"""
-        today = datetime.now()
-        if today.day <= 15:
-            return f"{today.year}{today.month:02d}a"
-        return f"{today.year}{today.month:02d}b"
+        return settlement_period(datetime.now())
 
     @staticmethod
     def process_paid_order(order):
@@ -35,104 +48,366 @@ class SettlementService:
         return True
 
     @staticmethod
-    def generate_settlement_batch():
-        """生成結算批次"""
-        current_period = SettlementService.create_settlement_period()
-        
-        # 找出所有已完成且未結算的訂單
-        orders = Order.query.filter(
+    def _eligible_conditions():
+        """可結算訂單：已完成、未結算且金流驗證通過"""
+        return and_(
+            Order.status == 'completed',
+            Order.settled_at.is_(None),
+            Order.calculation_verified == True
+        )
+
+    @staticmethod
+    def _eligible_orders_cte(run_id, after_order_id=None, upto_order_id=None):
+        """已由指定結算執行認領的訂單，可限定訂單編號區間 (after_order_id, upto_order_id]"""
+        conditions = [SettlementService._eligible_conditions(), Order.settlement_run_id == run_id]
+        if after_order_id is not None:
+            conditions.append(Order.id > after_order_id)
+        if upto_order_id is not None:
+            conditions.append(Order.id <= upto_order_id)
+
+        return select(
+            Order.id,
+            Product.supplier_id,
+            Order.big_mom_id,
+            Order.middle_mom_id,
+            Order.small_mom_id,
+            Order.supplier_amount,
+            Order.big_mom_amount,
+            Order.middle_mom_amount,
+            Order.small_mom_amount,
+            Order.platform_fee,
+            Order.tax_amount,
+            Order.total_price,
+            Order.tracking_number,
+            Order.shipped_at,
+            Order.return_status
+        ).outerjoin(
+            Product, Product.id == Order.product_id
+        ).where(and_(*conditions)).cte('eligible_orders')
+
+    @staticmethod
+    def _settlement_shares(eligible):
+        """
+        將每筆訂單展開為供應商及大/中/小團媽的結算份額（UNION ALL）
+        同一位團媽在同一訂單擔任多個層級時，金額取較高層級，與逐筆計算一致
+        """
+        user_id_type = db.String(36)
+        settlement_type = db.String(20)
+        detail_columns = (
+            eligible.c.id.label('order_id'),
+            eligible.c.platform_fee,
+            eligible.c.tax_amount,
+            eligible.c.total_price,
+            eligible.c.tracking_number,
+            eligible.c.shipped_at,
+            eligible.c.return_status
+        )
+
+        supplier_shares = select(
+            cast(eligible.c.supplier_id, user_id_type).label('user_id'),
+            literal('supplier', settlement_type).label('settlement_type'),
+            eligible.c.supplier_amount.label('amount'),
+            *detail_columns
+        ).where(eligible.c.supplier_id.isnot(None))
+
+        big_mom_shares = select(
+            cast(eligible.c.big_mom_id, user_id_type),
+            literal('mom', settlement_type),
+            eligible.c.big_mom_amount,
+            *detail_columns
+        ).where(eligible.c.big_mom_id.isnot(None))
+
+        middle_mom_shares = select(
+            cast(eligible.c.middle_mom_id, user_id_type),
+            literal('mom', settlement_type),
+            case(
+                (eligible.c.big_mom_id == eligible.c.middle_mom_id, eligible.c.big_mom_amount),
+                else_=eligible.c.middle_mom_amount
+            ),
+            *detail_columns
+        ).where(eligible.c.middle_mom_id.isnot(None))
+
+        small_mom_shares = select(
+            cast(eligible.c.small_mom_id, user_id_type),
+            literal('mom', settlement_type),
+            case(
+                (eligible.c.big_mom_id == eligible.c.small_mom_id, eligible.c.big_mom_amount),
+                (eligible.c.middle_mom_id == eligible.c.small_mom_id, eligible.c.middle_mom_amount),
+                else_=eligible.c.small_mom_amount
+            ),
+            *detail_columns
+        ).where(eligible.c.small_mom_id.isnot(None))
+
+        return union_all(
+            supplier_shares, big_mom_shares, middle_mom_shares, small_mom_shares
+        ).subquery('settlement_shares')
+
+    @staticmethod
+    def _write_settlement_details(shares, settlement_ids):
+        """
+        依 (結算類型, 用戶) 排序串流讀取訂單明細，
+        分批寫入結算明細列（settlement_items），並以主鍵批次更新對帳單的出貨/退貨明細
+        """
+        chunk_size = SettlementService.DETAIL_CHUNK_SIZE
+        stream = db.session.execute(
+            select(shares).order_by(
+                shares.c.settlement_type, shares.c.user_id, shares.c.order_id
+            ).execution_options(yield_per=chunk_size)
+        )
+
+        item_rows = []
+        statement_updates = []
+
+        def flush():
+            if item_rows:
+                db.session.execute(SettlementItem.__table__.insert(), item_rows)
+                item_rows.clear()
+            if statement_updates:
+                db.session.execute(update(SettlementStatement), statement_updates)
+                statement_updates.clear()
+
+        for key, rows in groupby(stream, key=lambda row: (row.settlement_type, row.user_id)):
+            rows = list(rows)
+            settlement_id, statement_id = settlement_ids[key]
+            item_rows.extend({
+                'settlement_id': settlement_id,
+                'order_id': row.order_id,
+                'amount': row.amount,
+                'status': 'pending'
+            } for row in rows)
+            statement_updates.append({
+                'id': statement_id,
+                'shipping_details': [{
+                    'order_id': row.order_id,
+                    'tracking_number': row.tracking_number,
+                    'shipped_at': row.shipped_at.isoformat() if row.shipped_at else None
+                } for row in rows],
+                'return_deductions': [{
+                    'order_id': row.order_id,
+                    'amount': row.total_price,
+                    'status': row.return_status
+                } for row in rows if row.return_status]
+            })
+            if len(item_rows) >= chunk_size:
+                flush()
+        flush()
+
+    @staticmethod
+    def get_settlement_lines(settlement_id):
+        """結算明細列（依 settlement_items 索引關聯訂單）"""
+        rows = db.session.execute(
+            select(
+                SettlementItem.order_id,
+                SettlementItem.amount,
+                SettlementItem.status,
+                Order.total_price,
+                Order.tracking_number,
+                Order.shipped_at,
+                Order.return_status
+            ).join(
+                Order, Order.id == SettlementItem.order_id
+            ).where(
+                SettlementItem.settlement_id == settlement_id
+            ).order_by(SettlementItem.order_id)
+        ).all()
+        return [{
+            'order_id': row.order_id,
+            'amount': row.amount,
+            'status': row.status,
+            'total_price': row.total_price,
+            'tracking_number': row.tracking_number,
+            'shipped_at': row.shipped_at.isoformat() if row.shipped_at else None,
+            'return_status': row.return_status
+        } for row in rows]
+
+    @staticmethod
+    def get_resumable_run():
+        """
+        認領中斷的結算執行（失敗，或執行中但心跳逾時）
+        以單一 UPDATE ... RETURNING 將狀態改回執行中並更新心跳，候選列以 SKIP LOCKED 選取，
+        多個 worker 同時續跑時只有一個取得同一筆執行
+        :return: 已認領的結算執行（由呼叫端提交），無可續跑的執行時為 None
+        """
+        now = datetime.utcnow()
+        stale_before = now - timedelta(seconds=Config.SETTLEMENT_RUN_STALE_SECONDS)
+        resumable = or_(
+            SettlementRun.status == 'failed',
             and_(
-                Order.status == 'completed',
-                Order.settled_at.is_(None),
-                Order.calculation_verified == True
+                SettlementRun.status == 'running',
+                or_(SettlementRun.heartbeat_at.is_(None), SettlementRun.heartbeat_at < stale_before)
             )
+        )
+        candidate = select(SettlementRun.id).where(resumable).order_by(
+            SettlementRun.id.desc()
+        ).limit(1).with_for_update(skip_locked=True)
+        run_id = db.session.scalar(
+            update(SettlementRun).where(
+                SettlementRun.id == candidate.scalar_subquery(),
+                resumable
+            ).values(
+                status='running',
+                heartbeat_at=now
+            ).returning(SettlementRun.id).execution_options(synchronize_session=False)
+        )
+        if run_id is None:
+            return None
+        return db.session.get(SettlementRun, run_id, populate_existing=True)
+
+    @staticmethod
+    def _process_run_chunk(run):
+        """
+        以 keyset 分頁認領下一批可結算訂單並累加各 (用戶, 結算類型) 小計
+        認領、小計與檢查點在同一交易內寫入，中斷時整批回滾；
+        可結算訂單不限建立月份，認領依 id 比對須探測各分區的主鍵索引
+        :return: 本批訂單數，0 表示已無待處理訂單
+        """
+        next_chunk = select(Order.id).where(
+            SettlementService._eligible_conditions(),
+            Order.settlement_run_id.is_(None),
+            Order.id > run.last_order_id
+        ).order_by(Order.id).limit(run.chunk_size)
+
+        claimed_ids = db.session.scalars(
+            update(Order).where(
+                Order.id.in_(next_chunk.scalar_subquery())
+            ).values(
+                settlement_run_id=run.id
+            ).returning(Order.id).execution_options(synchronize_session=False)
         ).all()
+        if not claimed_ids:
+            return 0
 
-        # 按用戶和類型分組
-        settlements = {}
-        for order in orders:
-            # 供應商結算
-            supplier_key = (order.product.supplier_id, 'supplier')
-            if supplier_key not in settlements:
-                settlements[supplier_key] = []
-            settlements[supplier_key].append(order)
-            
-            # 團媽結算
-            if order.big_mom_id:
-                big_mom_key = (order.big_mom_id, 'mom')
-                if big_mom_key not in settlements:
-                    settlements[big_mom_key] = []
-                settlements[big_mom_key].append(order)
-            
-            if order.middle_mom_id:
-                middle_mom_key = (order.middle_mom_id, 'mom')
-                if middle_mom_key not in settlements:
-                    settlements[middle_mom_key] = []
-                settlements[middle_mom_key].append(order)
-                
-            if order.small_mom_id:
-                small_mom_key = (order.small_mom_id, 'mom')
-                if small_mom_key not in settlements:
-                    settlements[small_mom_key] = []
-                settlements[small_mom_key].append(order)
-
-        # 建立結算記錄
-        for (user_id, settlement_type), orders in settlements.items():
-            total_amount = sum(
-                order.supplier_amount if settlement_type == 'supplier'
-                else (order.big_mom_amount if order.big_mom_id == user_id
-                else order.middle_mom_amount if order.middle_mom_id == user_id
-                else order.small_mom_amount)
-                for order in orders
-            )
-            
-            settlement = Settlement(
-                period=current_period,
-                settlement_type=settlement_type,
-                user_id=user_id,
-                total_amount=total_amount,
-                net_amount=total_amount,
-                order_count=len(orders),
-                order_details=[{
-                    'order_id': order.id,
-                    'amount': order.supplier_amount if settlement_type == 'supplier'
-                    else (order.big_mom_amount if order.big_mom_id == user_id
-                    else order.middle_mom_amount if order.middle_mom_id == user_id
-                    else order.small_mom_amount)
-                } for order in orders]
+        upto_order_id = max(claimed_ids)
+        shares = SettlementService._settlement_shares(
+            SettlementService._eligible_orders_cte(run.id, run.last_order_id, upto_order_id)
+        )
+        chunk_totals = db.session.execute(
+            select(
+                shares.c.settlement_type,
+                shares.c.user_id,
+                func.sum(shares.c.amount).label('total_amount'),
+                func.count().label('order_count'),
+                func.sum(shares.c.platform_fee).label('platform_fee'),
+                func.sum(shares.c.tax_amount).label('tax_amount')
+            ).group_by(shares.c.settlement_type, shares.c.user_id)
+        ).all()
+
+        upsert(SettlementRunTotal, [{
+            'run_id': run.id,
+            'settlement_type': row.settlement_type,
+            'user_id': row.user_id,
+            'total_amount': row.total_amount or 0,
+            'order_count': row.order_count,
+            'platform_fee': row.platform_fee or 0,
+            'tax_amount': row.tax_amount or 0
+        } for row in chunk_totals],
+            index_elements=('run_id', 'settlement_type', 'user_id'),
+            increment_columns=('total_amount', 'order_count', 'platform_fee', 'tax_amount'))
+
+        # 記錄檢查點並更新心跳
+        run.heartbeat_at = datetime.utcnow()
+        run.last_order_id = upto_order_id
+        run.processed_orders += len(claimed_ids)
+        run.processed_chunks += 1
+        return len(claimed_ids)
+
+    @staticmethod
+    def _finalize_run(run):
+        """依累計小計批次建立結算單與對帳單，並串流寫入訂單明細"""
+        totals = SettlementRunTotal.query.filter_by(run_id=run.id).order_by(
+            SettlementRunTotal.settlement_type, SettlementRunTotal.user_id
+        ).all()
+
+        settlement_ids = []
+        if totals:
+            # 批次建立結算記錄（RETURNING 取回 id，不需逐筆 commit）
+            settlement_ids = db.session.scalars(
+                insert(Settlement).returning(Settlement.id, sort_by_parameter_order=True),
+                [{
+                    'period': run.period,
+                    'settlement_type': row.settlement_type,
+                    'user_id': row.user_id,
+                    'total_amount': row.total_amount,
+                    'net_amount': row.total_amount,
+                    'order_count': row.order_count
+                } for row in totals]
+            ).all()
+
+            # 批次建立對帳單
+            dispute_deadline = datetime.now() + timedelta(days=3)
+            platform_fee_rate = ProfitRuleEngine.get_ruleset()['platform_fee_rate']
+            statement_ids = db.session.scalars(
+                insert(SettlementStatement).returning(SettlementStatement.id, sort_by_parameter_order=True),
+                [{
+                    'settlement_id': settlement_id,
+                    'statement_type': row.settlement_type,
+                    'period': run.period,
+                    'total_orders': row.order_count,
+                    'total_amount': row.total_amount,
+                    'dispute_deadline': dispute_deadline,
+                    'commission_details': {
+                        'rate': platform_fee_rate,
+                        'amount': row.platform_fee
+                    },
+                    'tax_details': {
+                        'amount': row.tax_amount
+                    }
+                } for settlement_id, row in zip(settlement_ids, totals)]
+            ).all()
+
+            SettlementService._write_settlement_details(
+                SettlementService._settlement_shares(SettlementService._eligible_orders_cte(run.id)),
+                {
+                    (row.settlement_type, row.user_id): (settlement_id, statement_id)
+                    for row, settlement_id, statement_id in zip(totals, settlement_ids, statement_ids)
+                }
             )
-            db.session.add(settlement)
-            db.session.commit()  # 先 commit 以產生 settlement.id
-            # 建立對帳單
-            statement = SettlementStatement(
-                settlement_id=settlement.id,
-                statement_type=settlement_type,
-                period=current_period,
-                total_orders=len(orders),
-                total_amount=total_amount,
-                dispute_deadline=datetime.now() + timedelta(days=3),
-                commission_details={
-                    'rate': Config.PLATFORM_FEE_RATE,
-                    'amount': sum(order.platform_fee for order in orders)
-                },
-                tax_details={
-                    'amount': sum(order.tax_amount for order in orders)
-                },
-                shipping_details=[{
-                    'order_id': order.id,
-                    'tracking_number': order.tracking_number,
-                    'shipped_at': order.shipped_at.isoformat() if order.shipped_at else None
-                } for order in orders],
-                return_deductions=[{
-                    'order_id': order.id,
-                    'amount': order.total_price,
-                    'status': order.return_status
-                } for order in orders if order.return_status]
+
+        run.status = 'completed'
+        run.completed_at = datetime.utcnow()
+        run.error_message = None
+        return {
+            'run_id': run.id,
+            'period': run.period,
+            'settlement_count': len(settlement_ids),
+            'order_count': sum(row.order_count for row in totals)
+        }
+
+    @staticmethod
+    def generate_settlement_batch(chunk_size=None, run=None):
+        """
+        生成結算批次
+        以 keyset 分頁逐批認領訂單，於 SQL 依 (用戶, 結算類型) 分組加總後累加至執行小計，
+        每批提交一次作為檢查點；中斷的執行會從最後檢查點續跑。
+        全部處理完畢後批次寫入結算單與對帳單。
+        :param run: 已由 get_resumable_run 認領的結算執行，未傳入時自行認領或建立新執行
+        """
+        run = run or SettlementService.get_resumable_run()
+        if not run:
+            run = SettlementRun(
+                period=SettlementService.create_settlement_period(),
+                status='running',
+                chunk_size=chunk_size or Config.SETTLEMENT_CHUNK_SIZE,
+                last_order_id=0,
+                processed_orders=0,
+                processed_chunks=0
             )
-            db.session.add(statement)
-        
+            db.session.add(run)
         db.session.commit()
 
+        try:
+            while SettlementService._process_run_chunk(run):
+                db.session.commit()
+            result = SettlementService._finalize_run(run)
+            db.session.commit()
+            return result
+        except Exception as e:
+            db.session.rollback()
+            run.status = 'failed'
+            run.error_message = str(e)
+            db.session.commit()
+            raise
+
     @staticmethod
     def confirm_statement(statement_id, user_id):
         """確認對帳單"""
@@ -151,46 +426,104 @@ class SettlementService:
 
     @staticmethod
     def process_payment(settlement_id):
-        """處理撥款"""
-        settlement = Settlement.query.get(settlement_id)
-        if not settlement or not settlement.is_confirmed:
-            return False
-            
+        """處理撥款；結算單先前已撥款時同樣視為成功，重試不會失敗"""
+        result = SettlementService.process_payments([settlement_id])
+        return result['settlement_count'] == 1 or bool(result['already_paid_ids'])
+
+    @staticmethod
+    def process_payments(settlement_ids):
+        """
+        批次撥款
+        以單一 UPDATE ... RETURNING 將已確認的結算單標記為已撥款，
+        再依結算明細列以集合式 UPDATE 回寫訂單結算時間，不逐筆查詢訂單；
+        結算單與訂單皆只以 id 比對（呼叫端不持有分區鍵，訂單建立時間也不限於結算單期別），
+        無法分區修剪，每個 id 須探測各分區的主鍵索引，成本隨分區數增加。
+        先前已撥款的結算單另列於 already_paid_ids，重試撥款時視為成功而非失敗
+        :return: 撥款結果與處理量統計
+        """
+        started = time.perf_counter()
+        paid_at = datetime.now()
+
         # 這裡應該調用實際的支付系統API
         # 目前先模擬支付成功
-        settlement.status = 'paid'
-        settlement.paid_at = datetime.now()
-        
-        # 更新相關訂單的結算狀態
-        for order_detail in settlement.order_details:
-            order = Order.query.get(order_detail['order_id'])
-            if order:
-                order.settled_at = datetime.now()
-                
-        db.session.commit()
-        return True
+        paid = db.session.execute(
+            update(Settlement).where(
+                Settlement.id.in_(settlement_ids),
+                Settlement.is_confirmed == True,
+                Settlement.status != 'paid'
+            ).values(
+                status='paid',
+                paid_at=paid_at
+            ).returning(
+                Settlement.id, Settlement.period, Settlement.total_amount
+            ).execution_options(synchronize_session=False)
+        ).all()
+        summary_deltas = defaultdict(lambda: defaultdict(float))
+        for row in paid:
+            summary_deltas[row.period]['settled_amount'] += row.total_amount or 0
 
-    @staticmethod
-    def get_platform_summary():
-        """獲取平台金流總覽"""
-        current_period = SettlementService.create_settlement_period()
-        
-        return {
-            'period': current_period,
-            'total_revenue': db.session.query(db.func.sum(Order.total_price))\
-                .filter(Order.status == 'completed').scalar() or 0,
-            'settled_amount': db.session.query(db.func.sum(Settlement.total_amount))\
-                .filter(Settlement.status == 'paid').scalar() or 0,
-            'unsettled_amount': db.session.query(db.func.sum(Order.total_price))\
-                .filter(and_(
-                    Order.status == 'completed',
+        # 更新相關訂單的結算狀態（依結算明細列關聯訂單）
+        paid_ids = [row.id for row in paid]
+        already_paid_ids = db.session.scalars(
+            select(Settlement.id).where(
+                Settlement.id.in_(settlement_ids),
+                Settlement.id.notin_(paid_ids),
+                Settlement.status == 'paid'
+            ).order_by(Settlement.id)
+        ).all()
+        chunk_size = SettlementService.DETAIL_CHUNK_SIZE
+        order_count = 0
+        for start in range(0, len(paid_ids), chunk_size):
+            batch_ids = paid_ids[start:start + chunk_size]
+            settled_orders = db.session.execute(
+                update(Order).where(
+                    Order.id.in_(
+                        select(SettlementItem.order_id).where(SettlementItem.settlement_id.in_(batch_ids))
+                    ),
                     Order.settled_at.is_(None)
-                )).scalar() or 0,
-            'platform_profit': db.session.query(db.func.sum(Order.platform_profit))\
-                .filter(Order.status == 'completed').scalar() or 0,
-            'tax_amount': db.session.query(db.func.sum(Order.tax_amount))\
-                .filter(Order.status == 'completed').scalar() or 0
+                ).values(
+                    settled_at=paid_at
+                ).returning(
+                    Order.status, Order.total_price, Order.created_at
+                ).execution_options(synchronize_session=False)
+            ).all()
+            db.session.execute(
+                update(SettlementItem).where(
+                    SettlementItem.settlement_id.in_(batch_ids)
+                ).values(status='paid').execution_options(synchronize_session=False)
+            )
+            order_count += len(settled_orders)
+            for row in settled_orders:
+                if row.status == 'completed':
+                    summary_deltas[settlement_period(row.created_at)]['unsettled_amount'] -= row.total_price or 0
+
+        # 批次更新不經過 ORM flush，需自行累加平台總覽差額
+        PlatformSummaryService.apply_deltas(summary_deltas)
+        db.session.commit()
+
+        elapsed = time.perf_counter() - started
+        metrics = {
+            'settlement_ids': paid_ids,
+            'settlement_count': len(paid),
+            'already_paid_ids': already_paid_ids,
+            'order_count': order_count,
+            'elapsed_seconds': round(elapsed, 4),
+            'settlements_per_second': round(len(paid) / elapsed, 2) if elapsed else None,
+            'orders_per_second': round(order_count / elapsed, 2) if elapsed else None
         }
+        current_app.logger.info(
+            f"Processed payout for {metrics['settlement_count']} settlements / "
+            f"{metrics['order_count']} orders in {metrics['elapsed_seconds']}s"
+        )
+        return metrics
+
+    @staticmethod
+    def get_platform_summary(period=None):
+        """獲取平台金流總覽（讀取增量維護的總覽表，不掃描訂單）"""
+        summary = PlatformSummaryService.get_summary(period)
+        summary['summary_period'] = summary.pop('period')
+        summary['period'] = SettlementService.create_settlement_period()
+        return summary
 
     @staticmethod
     def create_settlement(orders, settlement_type='mom'):
@@ -208,12 +541,17 @@ class SettlementService:
         )
         db.session.add(settlement)
         
-        # 計算各訂單分潤
+        # 計算各訂單分潤（沿用訂單的分潤規則集版本）
         for order in orders:
-            profits = ProfitCalculator.calculate_order_profit(
-                order.selling_price,
+            profits = ProfitRuleEngine.evaluate(
+                order.total_price,
                 order.cost,
-                order.user_id
+                has_big_mom=bool(order.big_mom_id),
+                has_middle_mom=bool(order.middle_mom_id),
+                has_small_mom=bool(order.small_mom_id),
+                has_referrer=bool(order.referrer_id),
+                version=order.profit_ruleset_version,
+                quantity=order.quantity
             )
             
             # 建立結算項目
@@ -284,41 +622,108 @@ class SettlementService:
         # 更新所有結算項目狀態
         for item in settlement.items:
             item.status = 'rejected'
+        db.session.flush()
+        SettlementService._release_orders([settlement.id])
             
         db.session.commit()
         return settlement
     
     @staticmethod
-    def check_expired_settlements():
+    def _release_orders(settlement_ids):
+        """
+        結算單被拒絕或取消後，清除其訂單的結算執行標記，讓下一次結算執行重新認領
+        同一訂單另有未被拒絕或取消的結算明細（例如其他團媽的結算單仍有效）時保留標記，避免重複結算
+        :return: 釋出的訂單數
+        """
+        live_item = select(SettlementItem.id).where(
+            SettlementItem.order_id == Order.id,
+            SettlementItem.status.notin_(SettlementService.RELEASED_ITEM_STATUSES)
+        ).exists()
+        return db.session.execute(
+            update(Order).where(
+                Order.id.in_(
+                    select(SettlementItem.order_id).where(SettlementItem.settlement_id.in_(settlement_ids))
+                ),
+                Order.settlement_run_id.isnot(None),
+                Order.settled_at.is_(None),
+                ~live_item
+            ).values(settlement_run_id=None).execution_options(synchronize_session=False)
+        ).rowcount
+
+    @staticmethod
+    def _sweep_in_batches(conditions, values, batch_size, on_batch=None):
+        """
+        分批以 UPDATE ... WHERE id IN (SELECT ... LIMIT n) 更新符合條件的結算單，每批提交一次
+        條件需在更新後不再成立，避免重複處理
+        :return: (更新筆數, 批次數)
+        """
+        updated = 0
+        batches = 0
+        while True:
+            batch = select(Settlement.id).where(*conditions).order_by(
+                Settlement.id
+            ).limit(batch_size).with_for_update(skip_locked=True)
+            ids = db.session.scalars(
+                update(Settlement).where(
+                    Settlement.id.in_(batch.scalar_subquery())
+                ).values(**values).returning(Settlement.id).execution_options(synchronize_session=False)
+            ).all()
+            if not ids:
+                return updated, batches
+            if on_batch:
+                on_batch(ids)
+            db.session.commit()
+            updated += len(ids)
+            batches += 1
+
+    @staticmethod
+    def check_expired_settlements(batch_size=None):
         """
         檢查已過期的結算單
         - 超過30天未處理的pending結算單
         - 超過90天的已完成結算單
+        以集合式 UPDATE 分批處理，每批提交一次，不一次鎖定整張表
+        :return: 各項更新筆數與耗時
         """
-        # 檢查未處理的結算單
-        pending_expire_date = datetime.utcnow() - timedelta(days=30)
-        expired_pending = Settlement.query.filter(
-            Settlement.status == 'pending',
-            Settlement.created_at < pending_expire_date
-        ).all()
-        
+        started = time.perf_counter()
+        batch_size = batch_size or SettlementService.EXPIRY_BATCH_SIZE
+        now = datetime.utcnow()
+        rejected_items = 0
+
+        def reject_items(settlement_ids):
+            nonlocal rejected_items
+            rejected_items += db.session.execute(
+                update(SettlementItem).where(
+                    SettlementItem.settlement_id.in_(settlement_ids)
+                ).values(status='rejected').execution_options(synchronize_session=False)
+            ).rowcount
+            SettlementService._release_orders(settlement_ids)
+
         # 自動拒絕過期的未處理結算單
-        for settlement in expired_pending:
-            settlement.status = 'rejected'
-            settlement.rejected_at = datetime.utcnow()
-            settlement.reject_reason = '系統自動拒絕：超過30天未處理'
-            for item in settlement.items:
-                item.status = 'rejected'
-                
-        # 檢查已完成的結算單
-        complete_expire_date = datetime.utcnow() - timedelta(days=90)
-        expired_complete = Settlement.query.filter(
-            Settlement.status.in_(['approved', 'rejected']),
-            Settlement.created_at < complete_expire_date
-        ).all()
-        
+        pending_expire_date = now - timedelta(days=30)
+        rejected, reject_batches = SettlementService._sweep_in_batches(
+            (Settlement.status == 'pending', Settlement.created_at < pending_expire_date),
+            {'status': 'rejected', 'rejected_at': now, 'reject_reason': '系統自動拒絕：超過30天未處理'},
+            batch_size,
+            on_batch=reject_items
+        )
+
         # 標記過期的已完成結算單
-        for settlement in expired_complete:
-            settlement.is_expired = True
-            
-        db.session.commit()
\ No newline at end of file
+        complete_expire_date = now - timedelta(days=90)
+        expired, expire_batches = SettlementService._sweep_in_batches(
+            (
+                Settlement.status.in_(['approved', 'rejected']),
+                Settlement.created_at < complete_expire_date,
+                or_(Settlement.is_expired == False, Settlement.is_expired.is_(None))
+            ),
+            {'is_expired': True},
+            batch_size
+        )
+
+        return {
+            'rejected_count': rejected,
+            'rejected_item_count': rejected_items,
+            'expired_count': expired,
+            'batches': reject_batches + expire_batches,
+            'elapsed_seconds': round(time.perf_counter() - started, 4)
+        }
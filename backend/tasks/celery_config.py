@@ -32,6 +32,10 @@ beat_schedule = {
         'task': 'tasks.commission_tasks.check_group_mom_upgrades',
         'schedule': crontab(hour='0', minute='0'),  # 每天凌晨執行
     },
+    'reconcile-referral-counters': {
+        'task': 'tasks.commission_tasks.reconcile_referral_counters',
+        'schedule': crontab(hour='3', minute='30'),  # 每天凌晨3點30分執行
+    },
     'process-pending-commissions': {
         'task': 'tasks.commission_tasks.process_pending_commissions',
         'schedule': crontab(minute='0'),  # 每小時整點執行
@@ -2,6 +2,7 @@ from celery import shared_task
 from datetime import datetime, timedelta
 from backend.services.group_mom_service import GroupMomService
 from backend.services.commission_calculation_service import CommissionCalculationService
+from backend.services.referral_service import ReferralService
 from backend.models.user import User
 from backend.models.order import Order
 from backend.extensions import db
@@ -16,32 +17,35 @@ def check_group_mom_upgrades():
     每天執行一次
     """
     try:
-        # 獲取所有活躍的團媽
-        active_moms = User.query.filter(
-            User.role == 'member',
-            User.group_mom_level > 0,
-            User.group_mom_fee_paid_until > datetime.utcnow()
-        ).all()
+        # 批次評估所有會費有效的團媽，單一 UPDATE 升級並寫入稽核紀錄
+        result = GroupMomService.process_level_upgrades()
+        if not result['success']:
+            raise RuntimeError(result['message'])
 
-        upgrade_results = []
-        for mom in active_moms:
-            result = GroupMomService.check_and_process_level_upgrade(mom.id)
-            if result['success']:
-                upgrade_results.append({
-                    'user_id': mom.id,
-                    'old_level': mom.group_mom_level - 1,
-                    'new_level': mom.group_mom_level
-                })
+        logger.info(f"團媽升級檢查完成，{result['candidate_count']} 位候選，共 {result['upgrade_count']} 位升級，"
+                    f"各階段耗時 {result['timings']}")
+        return result
 
-        logger.info(f'團媽升級檢查完成，共 {len(upgrade_results)} 位升級')
+    except Exception as e:
+        logger.error(f'團媽升級檢查失敗：{str(e)}')
         return {
-            'success': True,
-            'upgrade_count': len(upgrade_results),
-            'upgrades': upgrade_results
+            'success': False,
+            'error': str(e)
         }
 
+@shared_task
+def reconcile_referral_counters():
+    """
+    對帳用戶的直屬下線計數
+    每天執行一次
+    """
+    try:
+        summary = ReferralService.reconcile_referral_counters()
+        logger.info(f"直屬下線計數對帳完成，檢查 {summary['scanned']} 位用戶，修正 {summary['corrected']} 位")
+        return dict(summary, success=True)
+
     except Exception as e:
-        logger.error(f'團媽升級檢查失敗：{str(e)}')
+        logger.error(f'直屬下線計數對帳失敗：{str(e)}')
         return {
             'success': False,
             'error': str(e)
@@ -54,27 +58,12 @@ def process_pending_commissions():
     每小時執行一次
     """
     try:
-        # 獲取所有已完成但未計算分潤的訂單
-        pending_orders = Order.query.filter(
-            Order.status == 'completed',
-            Order.profit_distribution_log.is_(None)
-        ).all()
-
-        results = []
-        for order in pending_orders:
-            result = CommissionCalculationService.calculate_and_record_commission(order.id)
-            results.append({
-                'order_id': order.id,
-                'success': result['success'],
-                'message': result.get('message')
-            })
-
-        logger.info(f'分潤計算完成，處理了 {len(results)} 筆訂單')
-        return {
-            'success': True,
-            'processed_count': len(results),
-            'results': results
-        }
+        summary = CommissionCalculationService.process_pending_commissions()
+        logger.info(
+            f"分潤計算完成，處理了 {summary['processed_count']} 筆訂單，"
+            f"新增 {summary['commission_count']} 筆分潤，{summary['failed_count']} 筆失敗"
+        )
+        return dict(summary, success=True)
 
     except Exception as e:
         logger.error(f'分潤計算失敗：{str(e)}')
@@ -90,18 +79,24 @@ def check_expired_items():
     每天執行一次
     """
     try:
-        # 檢查過期會費
-        expired_memberships = GroupMomService.check_expired_memberships()
-        
+        from backend.tasks.notification_tasks import send_batch_notifications
+
+        # 停用過期會費的團媽（單一 UPDATE），再為 7 天內到期者批次建立提醒
+        expired_memberships = GroupMomService.deactivate_expired_group_moms()
+        reminder_ids = GroupMomService.check_and_notify_expiring_fees()
+        if reminder_ids:
+            send_batch_notifications.delay(reminder_ids)
+
         # 檢查過期分潤
         expired_commissions = CommissionCalculationService.check_and_process_expired_commissions()
 
-        logger.info(f'過期檢查完成，{len(expired_memberships)} 位團媽降級，'
+        logger.info(f'過期檢查完成，{len(expired_memberships)} 位團媽降級，{len(reminder_ids)} 位團媽會費到期提醒，'
                    f'{expired_commissions.get("expired_count", 0)} 筆分潤過期')
                    
         return {
             'success': True,
             'expired_memberships': len(expired_memberships),
+            'fee_reminders': len(reminder_ids),
             'expired_commissions': expired_commissions.get('expired_count', 0)
         }
 
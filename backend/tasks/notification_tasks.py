@@ -43,12 +43,10 @@ def send_notification(notification_id: int):
 @shared_task
 def send_batch_notifications(notification_ids: List[int]):
     """
-    批量異步發送通知
+    批量發送通知
+    在同一個任務內依序發送，不再為每則通知另外排程子任務並等待結果
     """
-    results = []
-    for notification_id in notification_ids:
-        result = send_notification.delay(notification_id)
-        results.append(result.get())  # 等待任務完成並獲取結果
+    results = [send_notification(notification_id) for notification_id in notification_ids]
 
     return {
         'success': True,
@@ -75,9 +75,9 @@ def generate_settlement_report():
         # 生成結算報表
         report = ExportService.export_settlement_report(period)
         
-        # 獲取結算分析
+        # 獲取結算分析（與匯出共用同一期別快取）
         analysis = SettlementOptimizationService.settlement_data_analysis(period)
-        anomalies = SettlementOptimizationService.detect_anomalies(period)
+        anomalies = SettlementOptimizationService.detect_anomalies(period, analysis=analysis)
         
         # 創建審計報告
         audit_report = AuditReport(
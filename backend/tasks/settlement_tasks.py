@@ -2,6 +2,7 @@ from datetime import datetime, timedelta
 from apscheduler.schedulers.background import BackgroundScheduler
 from backend.services.settlement_service import SettlementService
 from backend.services.notification_service import NotificationService
+from backend.services.partition_service import PartitionService
 from backend.models.settlement import UnsettledOrder
 from backend.models.order import Order
 from backend.extensions import db
@@ -14,6 +15,20 @@ from backend.models.settlement import Settlement
 def setup_settlement_tasks(app):
     scheduler = BackgroundScheduler()
     
+    # 排程器啟動時續跑中斷的結算執行
+    @scheduler.scheduled_job('date', misfire_grace_time=300)
+    def resume_interrupted_settlement_run():
+        with app.app_context():
+            run = SettlementService.get_resumable_run()
+            if run:
+                SettlementService.generate_settlement_batch(run=run)
+
+    # 每月 1 號補建未來月分區並封存過期分區
+    @scheduler.scheduled_job('cron', day='1', hour=0, minute=30)
+    def maintain_partitions():
+        with app.app_context():
+            PartitionService.maintain_partitions()
+
     # 每天凌晨執行結算批次
     @scheduler.scheduled_job('cron', hour=0, minute=0)
     def generate_daily_settlements():
@@ -218,7 +233,8 @@ def generate_daily_settlements():
 def check_expired_settlements():
     """檢查過期結算單"""
     try:
-        SettlementService.check_expired_settlements()
+        result = SettlementService.check_expired_settlements()
+        print(f"過期結算單掃描完成: {result}")
     except Exception as e:
         print(f"檢查過期結算單時發生錯誤: {str(e)}")
 
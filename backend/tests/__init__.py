@@ -0,0 +1,13 @@
+from sqlalchemy import MetaData
+
+
+def create_tables(engine, *models):
+    """
+    以獨立 MetaData 建立測試所需資料表
+    部分測試會清空 db.Model.metadata，因此不依賴 db.create_all()
+    """
+    metadata = MetaData()
+    for model in models:
+        model.__table__.to_metadata(metadata)
+    metadata.create_all(engine)
+    return metadata
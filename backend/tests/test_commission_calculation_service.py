@@ -0,0 +1,221 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+import unittest
+from unittest.mock import patch
+from datetime import datetime, timedelta
+from sqlalchemy import null, select, update
+from backend.services.commission_calculation_service import CommissionCalculationService
+from backend.services.group_mom_service import GroupMomService
+from backend.services.commission import CommissionService
+from backend.models.user import User
+from backend.models.order import Order
+from backend.models.refund import Refund
+from backend.models.downline_stats import DownlineStats
+from backend.models.product import Product
+from backend.models.commission import CommissionRecord
+from backend.models.commission_ledger import CommissionBalance, CommissionDailyRollup, CommissionLedgerEntry
+from backend.models.notification import Notification
+from backend.models.referral_closure import ReferralClosure
+from backend.models.logistics_company import LogisticsCompany
+from backend.models.recipient import Recipient
+from backend.models.settlement import SettlementRun
+from backend.models.platform_summary import PlatformSummary
+from backend.extensions import db
+from backend.app import create_app
+from backend.config import TestingConfig
+from backend.tests import create_tables
+
+class TestCommissionCalculationService(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(TestingConfig)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        create_tables(
+            db.engine, User, ReferralClosure, LogisticsCompany, Recipient, SettlementRun, Product, Order,
+            Refund, DownlineStats, CommissionRecord, CommissionLedgerEntry, CommissionBalance, CommissionDailyRollup,
+            Notification, PlatformSummary
+        )
+        paid_until = datetime.utcnow() + timedelta(days=30)
+        db.session.add_all([
+            User(id=1, username='big', email='b@test.com', group_mom_level=3, group_mom_fee_paid_until=paid_until),
+            User(id=2, username='middle', email='m@test.com', group_mom_level=2, group_mom_fee_paid_until=paid_until),
+            User(id=3, username='small', email='s@test.com', group_mom_level=1, group_mom_fee_paid_until=paid_until),
+            # 會費已過期的小團媽不分潤
+            User(id=4, username='expired', email='e@test.com', group_mom_level=1,
+                 group_mom_fee_paid_until=datetime.utcnow() - timedelta(days=1)),
+            User(id=5, username='buyer', email='u@test.com'),
+        ])
+        chains = [(1, 2, 3), (1, None, 3), (None, 2, 4), (1, 2, 4), (None, None, None)]
+        for order_id in range(1, 21):
+            big, middle, small = chains[order_id % len(chains)]
+            db.session.add(Order(
+                id=order_id, user_id=5, product_id=1, quantity=1, total_price=1000 + order_id * 13.37,
+                cost=600 + order_id * 3, status='completed',
+                big_mom_id=big, middle_mom_id=middle, small_mom_id=small
+            ))
+        db.session.add(Order(id=21, user_id=5, product_id=1, quantity=1, total_price=500, cost=300,
+                             status='pending', big_mom_id=1))
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        self.app_context.pop()
+
+    def _records(self, order_ids):
+        return sorted(
+            (r.order_id, r.user_id, r.level, r.amount, r.status)
+            for r in CommissionRecord.query.filter(CommissionRecord.order_id.in_(order_ids))
+        )
+
+    def test_batch_matches_per_order_calculation(self):
+        """批次處理與逐筆 calculate_and_record_commission 產生相同的分潤記錄"""
+        legacy_ids = list(range(1, 11))
+        for order_id in legacy_ids:
+            CommissionCalculationService.calculate_and_record_commission(order_id)
+        summary = CommissionCalculationService.process_pending_commissions(chunk_size=3)
+
+        self.assertEqual(summary['processed_count'], 10)
+        self.assertEqual(summary['chunks'], 4)
+        self.assertEqual(summary['failed_count'], 0)
+        for legacy_id in legacy_ids:
+            legacy = [record[1:3] for record in self._records([legacy_id])]
+            batch = [record[1:3] for record in self._records([legacy_id + 10])]
+            self.assertEqual(legacy, batch, msg=f'訂單 {legacy_id}')
+
+        # 金額與單筆計算公式相同
+        for record in CommissionRecord.query.filter(CommissionRecord.order_id > 10):
+            expected = GroupMomService.commission_amount(db.session.get(Order, record.order_id).total_price, record.level)
+            self.assertEqual(record.amount, expected)
+        self.assertEqual(summary['commission_count'], CommissionRecord.query.filter(CommissionRecord.order_id > 10).count())
+
+    def test_writes_notifications_logs_and_profits(self):
+        CommissionCalculationService.process_pending_commissions(chunk_size=4)
+        records = CommissionRecord.query.all()
+        notifications = Notification.query.filter_by(type='commission_pending').all()
+        self.assertEqual(sorted(n.related_id for n in notifications), sorted(r.id for r in records))
+        for notification in notifications:
+            record = db.session.get(CommissionRecord, notification.related_id)
+            self.assertEqual(str(notification.user_id), str(record.user_id))
+            self.assertEqual(notification.extra_data['order_id'], record.order_id)
+
+        order = db.session.get(Order, 5)
+        self.assertTrue(order.calculation_verified)
+        self.assertIsNotNone(order.platform_profit)
+        self.assertEqual(
+            [(r['user_id'], r['level']) for r in order.profit_distribution_log['commission_records']],
+            [(1, 3), (2, 2), (3, 1)]
+        )
+        self.assertEqual(db.session.get(Order, 4).profit_distribution_log['commission_records'], [])
+        self.assertIsNone(db.session.get(Order, 21).profit_distribution_log)
+
+        # 已處理的訂單不重複計算
+        summary = CommissionCalculationService.process_pending_commissions()
+        self.assertEqual((summary['processed_count'], summary['commission_count']), (0, 0))
+        self.assertEqual(CommissionRecord.query.count(), len(records))
+    def test_overlapping_runs_do_not_duplicate(self):
+        """同一訂單重複計算或與其他 worker 重疊時，冪等鍵避免產生重複分潤與通知"""
+        self.assertEqual(CommissionCalculationService.calculate_and_record_commission(5)['commission_count'], 3)
+        skipped = CommissionCalculationService.calculate_and_record_commission(5)
+        self.assertTrue(skipped['success'])
+        self.assertEqual(skipped['commission_count'], 0)
+
+        # 模擬另一個 worker 已寫入分潤記錄但尚未回寫訂單分潤紀錄
+        first = CommissionCalculationService.process_pending_commissions()
+        db.session.execute(update(Order).where(Order.id.in_([1, 10])).values(profit_distribution_log=null()))
+        db.session.commit()
+        second = CommissionCalculationService.process_pending_commissions()
+        self.assertEqual(second['processed_count'], 2)
+        self.assertEqual(second['commission_count'], 0)
+
+        keys = db.session.execute(
+            select(CommissionRecord.order_id, CommissionRecord.user_id, CommissionRecord.ruleset_version)
+        ).all()
+        self.assertEqual(len(keys), len(set(keys)))
+        self.assertEqual(len(keys), first['commission_count'] + 3)
+        self.assertEqual(Notification.query.filter_by(type='commission_pending').count(), len(keys))
+        self.assertEqual(
+            sum(balance.count for balance in CommissionBalance.query.filter_by(status='pending')), len(keys)
+        )
+
+    def test_moms_sharing_a_level_are_both_paid(self):
+        """小團媽升級後與中團媽同為 2 級時兩人都分潤；所有寫入路徑產生相同的記錄與金額"""
+        db.session.get(User, 3).group_mom_level = 2
+        db.session.commit()
+        result = CommissionCalculationService.calculate_and_record_commission(5)
+        self.assertEqual(
+            [record[1:4] for record in self._records([5])],
+            [(1, 3, GroupMomService.commission_amount(db.session.get(Order, 5).total_price, 3)),
+             (2, 2, GroupMomService.commission_amount(db.session.get(Order, 5).total_price, 2)),
+             (3, 2, GroupMomService.commission_amount(db.session.get(Order, 5).total_price, 2))]
+        )
+        self.assertEqual(result['commission_count'], 3)
+        self.assertAlmostEqual(result['total_commission'], sum(record[3] for record in self._records([5])))
+
+        self.assertTrue(CommissionService.calculate_commission(10))
+        expected = sorted(
+            (record['order_id'], record['user_id'], record['level'], record['amount'], 'pending')
+            for record in CommissionCalculationService.build_commission_records([10])[0]
+        )
+        self.assertEqual(self._records([10]), expected)
+
+    def test_failed_profit_verification_ends_transaction(self):
+        """利潤驗證失敗時保存錯誤標記並結束交易，不留下未提交的變更"""
+        with patch('backend.utils.profit_calculator.ProfitCalculator.verify_breakdown', return_value=False):
+            result = CommissionCalculationService.calculate_and_record_commission(5)
+        self.assertFalse(result['success'])
+        self.assertEqual(result['message'], '金流計算驗證失敗')
+        self.assertFalse(db.session.dirty or db.session.new or db.session().in_transaction())
+
+        db.session.expire_all()
+        order = db.session.get(Order, 5)
+        self.assertFalse(order.calculation_verified)
+        self.assertIsNone(order.profit_distribution_log)
+        self.assertEqual(CommissionRecord.query.count(), 0)
+
+    def _add_records(self, count, expires_at, first_order_id=1):
+        db.session.add_all([
+            CommissionRecord(user_id=1 + index % 3, order_id=first_order_id + index, amount=10 + index, level=1,
+                             expires_at=expires_at)
+            for index in range(count)
+        ])
+        db.session.commit()
+        return [record.id for record in CommissionRecord.query.order_by(CommissionRecord.id)]
+
+    def test_approve_commission_batch(self):
+        record_ids = self._add_records(7, datetime.utcnow() + timedelta(days=1))
+        db.session.get(CommissionRecord, record_ids[0]).status = 'rejected'
+        db.session.commit()
+
+        result = CommissionCalculationService.approve_commission_batch(record_ids, chunk_size=3)
+        self.assertEqual(result['approved_count'], 6)
+        self.assertEqual(
+            CommissionRecord.query.filter_by(status='approved').filter(CommissionRecord.approved_at.isnot(None)).count(), 6
+        )
+        notifications = Notification.query.filter_by(type='commission_approved').all()
+        self.assertEqual(sorted(n.related_id for n in notifications), record_ids[1:])
+        self.assertEqual(notifications[0].message, f'您的分潤 NT$ {db.session.get(CommissionRecord, notifications[0].related_id).amount:,.2f} 已審核通過')
+
+        self.assertFalse(CommissionCalculationService.approve_commission_batch(record_ids)['success'])
+        self.assertEqual(Notification.query.filter_by(type='commission_approved').count(), 6)
+
+    def test_expire_commissions_in_chunks(self):
+        """分批標記過期並寫入通知，未過期或已審核的記錄不受影響"""
+        expired_ids = self._add_records(10, datetime.utcnow() - timedelta(minutes=1))
+        self._add_records(2, datetime.utcnow() + timedelta(days=1), first_order_id=11)
+        db.session.get(CommissionRecord, expired_ids[0]).status = 'approved'
+        db.session.commit()
+
+        result = CommissionCalculationService.check_and_process_expired_commissions(chunk_size=4)
+        self.assertEqual(result['expired_count'], 9)
+        self.assertEqual(
+            sorted(r.id for r in CommissionRecord.query.filter_by(status='expired')), expired_ids[1:]
+        )
+        self.assertEqual(CommissionRecord.query.filter_by(status='pending').count(), 2)
+        notifications = Notification.query.filter_by(type='commission_expired').all()
+        self.assertEqual(sorted(n.related_id for n in notifications), expired_ids[1:])
+        self.assertIn('expired_at', notifications[0].extra_data)
+        self.assertEqual(CommissionCalculationService.check_and_process_expired_commissions()['expired_count'], 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,143 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+import random
+import unittest
+from datetime import date, datetime, timedelta
+from sqlalchemy import func, select
+from backend.services.commission_calculation_service import CommissionCalculationService
+from backend.services.commission_ledger_service import CommissionLedgerService
+from backend.models.user import User
+from backend.models.order import Order
+from backend.models.refund import Refund
+from backend.models.downline_stats import DownlineStats
+from backend.models.product import Product
+from backend.models.commission import CommissionRecord
+from backend.models.commission_ledger import CommissionBalance, CommissionDailyRollup, CommissionLedgerEntry
+from backend.models.notification import Notification
+from backend.models.referral_closure import ReferralClosure
+from backend.models.logistics_company import LogisticsCompany
+from backend.models.recipient import Recipient
+from backend.models.settlement import SettlementRun
+from backend.models.platform_summary import PlatformSummary
+from backend.extensions import db
+from backend.app import create_app
+from backend.config import TestingConfig
+from backend.tests import create_tables
+
+STATUSES = ('pending', 'approved', 'rejected', 'paid', 'expired')
+
+class TestCommissionLedgerService(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(TestingConfig)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        create_tables(
+            db.engine, User, ReferralClosure, LogisticsCompany, Recipient, SettlementRun, Product, Order,
+            Refund, DownlineStats, CommissionRecord, CommissionLedgerEntry, CommissionBalance, CommissionDailyRollup,
+            Notification, PlatformSummary
+        )
+
+    def tearDown(self):
+        db.session.remove()
+        self.app_context.pop()
+
+    def _balances(self):
+        return {
+            (row.user_id, row.status): (row.count, round(row.amount, 6))
+            for row in CommissionBalance.query.all() if row.count or round(row.amount, 6)
+        }
+
+    def _expected_balances(self):
+        return {
+            (user_id, status): (count, round(amount, 6))
+            for user_id, status, count, amount in db.session.execute(
+                select(CommissionRecord.user_id, CommissionRecord.status,
+                       func.count(CommissionRecord.id), func.sum(CommissionRecord.amount))
+                .group_by(CommissionRecord.user_id, CommissionRecord.status)
+            )
+        }
+
+    def test_random_changes_match_aggregates(self):
+        """隨機新增、變更狀態與金額、刪除後，餘額與每日彙總和全表彙總一致"""
+        rng = random.Random(19)
+        order_ids = iter(range(1, 1000))
+        for _ in range(30):
+            action = rng.random()
+            records = CommissionRecord.query.all()
+            if action < 0.4 or not records:
+                db.session.add_all([
+                    CommissionRecord(user_id=rng.randint(1, 5), order_id=next(order_ids),
+                                     amount=round(rng.uniform(1, 100), 2), level=rng.randint(1, 3),
+                                     created_at=datetime(2026, 10, rng.randint(1, 5)),
+                                     expires_at=datetime(2026, 11, 30))
+                    for _ in range(rng.randint(1, 4))
+                ])
+            elif action < 0.8:
+                record = rng.choice(records)
+                record.status = rng.choice(STATUSES)
+                if rng.random() < 0.3:
+                    record.amount = round(rng.uniform(1, 100), 2)
+            else:
+                db.session.delete(rng.choice(records))
+            db.session.commit()
+
+        self.assertEqual(self._balances(), self._expected_balances())
+        report = CommissionLedgerService.get_report(date(2026, 10, 2), date(2026, 10, 4))
+        in_range = CommissionRecord.query.filter(
+            CommissionRecord.created_at >= datetime(2026, 10, 2), CommissionRecord.created_at < datetime(2026, 10, 5)
+        ).all()
+        self.assertEqual(
+            {(s['status'], s['count'], round(s['total_amount'], 6)) for s in report['status_statistics']},
+            {
+                (status, len(matched), round(sum(r.amount for r in matched), 6))
+                for status in STATUSES
+                for matched in [[r for r in in_range if r.status == status]] if matched
+            }
+        )
+
+        incremental = self._balances()
+        CommissionLedgerService.rebuild()
+        self.assertEqual(self._balances(), incremental)
+
+    def test_batch_paths_write_ledger(self):
+        """批次計算、審核與過期以 Core 語句更新時同樣寫入帳本與餘額"""
+        paid_until = datetime.utcnow() + timedelta(days=30)
+        db.session.add_all([
+            User(id=1, username='big', email='b@test.com', group_mom_level=3, group_mom_fee_paid_until=paid_until),
+            User(id=2, username='small', email='s@test.com', group_mom_level=1, group_mom_fee_paid_until=paid_until),
+            User(id=3, username='buyer', email='u@test.com'),
+        ])
+        db.session.add_all([
+            Order(id=order_id, user_id=3, product_id=1, quantity=1, total_price=1000, cost=600,
+                  status='completed', big_mom_id=1, small_mom_id=2)
+            for order_id in range(1, 7)
+        ])
+        db.session.commit()
+
+        CommissionCalculationService.process_pending_commissions(chunk_size=4)
+        self.assertEqual(CommissionLedgerService.get_balances(2), {'pending': {'count': 6, 'amount': 300.0}})
+
+        records = CommissionRecord.query.filter_by(user_id=2).order_by(CommissionRecord.id).all()
+        CommissionCalculationService.approve_commission_batch([r.id for r in records[:2]])
+        db.session.execute(
+            CommissionRecord.__table__.update().where(CommissionRecord.id == records[2].id)
+            .values(expires_at=datetime.utcnow() - timedelta(days=1))
+        )
+        db.session.commit()
+        CommissionCalculationService.check_and_process_expired_commissions()
+
+        self.assertEqual(CommissionLedgerService.get_balances(2), {
+            'pending': {'count': 3, 'amount': 150.0},
+            'approved': {'count': 2, 'amount': 100.0},
+            'expired': {'count': 1, 'amount': 50.0},
+        })
+        self.assertEqual(self._balances(), self._expected_balances())
+        self.assertEqual(CommissionLedgerService.get_ledger(2).total, 9)
+        report = CommissionLedgerService.get_report()
+        self.assertEqual(
+            [(s['level'], s['count']) for s in report['level_statistics']], [(1, 6), (3, 6)]
+        )
+
+if __name__ == '__main__':
+    unittest.main()
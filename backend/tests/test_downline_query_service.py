@@ -0,0 +1,114 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+import random
+import unittest
+from datetime import datetime, timedelta
+from backend.services.downline_query_service import DownlineQueryService
+from backend.models.user import User
+from backend.models.order import Order
+from backend.models.refund import Refund
+from backend.models.product import Product
+from backend.models.downline_stats import DownlineStats
+from backend.models.referral_closure import ReferralClosure
+from backend.models.logistics_company import LogisticsCompany
+from backend.models.recipient import Recipient
+from backend.models.settlement import SettlementRun
+from backend.models.platform_summary import PlatformSummary
+from backend.extensions import db
+from backend.app import create_app
+from backend.config import TestingConfig
+from backend.tests import create_tables
+
+class TestDownlineQueryService(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(TestingConfig)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        create_tables(
+            db.engine, User, ReferralClosure, LogisticsCompany, Recipient, SettlementRun, Product, Order, Refund,
+            DownlineStats, PlatformSummary
+        )
+        rng = random.Random(24)
+        self.referrers = {1: None}
+        for user_id in range(2, 121):
+            self.referrers[user_id] = rng.randint(max(1, user_id - 20), user_id - 1)
+        db.session.add_all([
+            User(id=user_id, username=f'u{user_id}', email=f'u{user_id}@test.com', referrer_id=referrer_id)
+            for user_id, referrer_id in self.referrers.items()
+        ])
+        db.session.commit()
+        now = datetime.utcnow()
+        db.session.add_all([
+            Order(user_id=rng.randint(2, 120), product_id=1, quantity=1, total_price=rng.choice([100, 250, 999]),
+                  cost=50, status='completed', created_at=now - timedelta(days=rng.choice([5, 30, 200])))
+            for _ in range(150)
+        ])
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        self.app_context.pop()
+
+    def _depths(self, user_id):
+        """逐一往上追溯，回傳 {下線 ID: 層數}"""
+        depths = {}
+        for descendant in self.referrers:
+            ancestor, depth = self.referrers[descendant], 1
+            while ancestor is not None:
+                if ancestor == user_id:
+                    depths[descendant] = depth
+                    break
+                ancestor, depth = self.referrers[ancestor], depth + 1
+        return depths
+
+    def _spent(self, user_ids):
+        orders = Order.query.filter(Order.user_id.in_(user_ids)).all()
+        cutoff = datetime.utcnow() - timedelta(days=90)
+        return (
+            sum(order.total_price for order in orders),
+            len({order.user_id for order in orders if order.created_at >= cutoff})
+        )
+
+    def test_level_summary_matches_tree_walk(self):
+        for user_id in (1, 5, 30):
+            depths = self._depths(user_id)
+            summary = DownlineQueryService.get_level_summary(user_id)
+            self.assertEqual(sum(level['member_count'] for level in summary), len(depths))
+            for level in summary:
+                members = [member for member, depth in depths.items() if depth == level['depth']]
+                spent, active = self._spent(members)
+                self.assertEqual(level['member_count'], len(members))
+                self.assertAlmostEqual(level['total_spent'], spent)
+                self.assertEqual(level['active_count'], active)
+            limited = DownlineQueryService.get_level_summary(user_id, max_depth=2)
+            self.assertEqual(limited, [level for level in summary if level['depth'] <= 2])
+
+    def test_downlines_paginated(self):
+        depths = self._depths(1)
+        pages = [DownlineQueryService.get_downlines(1, page=page, per_page=25) for page in range(1, 6)]
+        self.assertEqual(pages[0]['total'], len(depths))
+        items = [item for page in pages for item in page['items']]
+        self.assertEqual(
+            [(item['user_id'], item['depth']) for item in items],
+            sorted(depths.items(), key=lambda pair: (pair[1], pair[0]))
+        )
+        shallow = DownlineQueryService.get_downlines(1, max_depth=1, per_page=100)
+        self.assertEqual({item['user_id'] for item in shallow['items']},
+                         {member for member, depth in depths.items() if depth == 1})
+
+    def test_subteams(self):
+        result = DownlineQueryService.get_subteams(1, per_page=100)
+        children = [user_id for user_id, referrer_id in self.referrers.items() if referrer_id == 1]
+        self.assertEqual(result['total'], len(children))
+        for team in result['items']:
+            members = [team['user_id'], *self._depths(team['user_id'])]
+            spent, active = self._spent(members)
+            self.assertEqual(team['member_count'], len(members))
+            self.assertAlmostEqual(team['total_spent'], spent)
+            self.assertEqual(team['active_count'], active)
+        totals = [team['total_spent'] for team in result['items']]
+        self.assertEqual(totals, sorted(totals, reverse=True))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,180 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+import random
+import unittest
+from datetime import datetime, timedelta
+from unittest.mock import patch
+from sqlalchemy import inspect, select
+from backend.services.downline_stats_service import REBUILD_STAGING, DownlineStatsService
+from backend.models.user import User
+from backend.models.order import Order
+from backend.models.refund import Refund
+from backend.models.product import Product
+from backend.models.downline_stats import DownlineStats
+from backend.models.referral_closure import ReferralClosure
+from backend.models.logistics_company import LogisticsCompany
+from backend.models.recipient import Recipient
+from backend.models.settlement import SettlementRun
+from backend.models.platform_summary import PlatformSummary
+from backend.extensions import db
+from backend.app import create_app
+from backend.config import TestingConfig
+from backend.tests import create_tables
+
+class TestDownlineStatsService(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(TestingConfig)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        create_tables(
+            db.engine, User, ReferralClosure, LogisticsCompany, Recipient, SettlementRun, Product, Order, Refund,
+            DownlineStats, PlatformSummary
+        )
+        self.rng = random.Random(21)
+        db.session.add_all([
+            User(id=user_id, username=f'u{user_id}', email=f'u{user_id}@test.com',
+                 referrer_id=self.rng.choice([None, *range(1, user_id)]))
+            for user_id in range(1, 31)
+        ])
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        self.app_context.pop()
+
+    def _stats(self):
+        return {
+            (row.mom_id, row.downline_id): (row.order_count, round(row.total_spent, 6), row.last_order_date)
+            for row in DownlineStats.query.all() if row.order_count
+        }
+
+    def _expected_stats(self):
+        """逐筆訂單沿推薦關係往上累計"""
+        referrers = {user.id: user.referrer_id for user in User.query.all()}
+        refunded = {}
+        for refund in Refund.query.filter_by(status='completed'):
+            if refund.refund_type != 'exchange':
+                refunded[refund.order_id] = refunded.get(refund.order_id, 0) + refund.amount
+        expected = {}
+        for order in Order.query.filter_by(status='completed'):
+            mom_id = referrers[order.user_id]
+            while mom_id is not None:
+                count, spent, last = expected.get((mom_id, order.user_id), (0, 0, None))
+                expected[(mom_id, order.user_id)] = (
+                    count + 1,
+                    spent + order.total_price - refunded.get(order.id, 0),
+                    max(last, order.created_at) if last else order.created_at
+                )
+                mom_id = referrers[mom_id]
+        return {key: (count, round(spent, 6), last) for key, (count, spent, last) in expected.items()}
+
+    def test_incremental_matches_rebuild(self):
+        """訂單建立、完成、取消與退款隨機異動後，增量統計與全表重建及逐筆計算一致"""
+        rng = self.rng
+        start = datetime(2026, 9, 1)
+        for step in range(80):
+            orders = Order.query.all()
+            action = rng.random()
+            if action < 0.35 or not orders:
+                db.session.add(Order(
+                    user_id=rng.randint(1, 30), product_id=1, quantity=1,
+                    total_price=round(rng.uniform(100, 2000), 2), cost=50,
+                    status=rng.choice(['pending', 'completed']), created_at=start + timedelta(hours=step)
+                ))
+            elif action < 0.6:
+                rng.choice(orders).status = rng.choice(['completed', 'cancelled', 'completed'])
+            elif action < 0.85:
+                order = rng.choice(orders)
+                db.session.add(Refund(order_id=order.id, user_id=str(order.user_id),
+                                      amount=round(rng.uniform(1, 50), 2),
+                                      refund_type=rng.choice(['refund', 'exchange']),
+                                      status=rng.choice(['pending', 'completed'])))
+            else:
+                refunds = Refund.query.all()
+                if refunds:
+                    refund = rng.choice(refunds)
+                    refund.status = rng.choice(['completed', 'rejected'])
+                    refund.amount = round(rng.uniform(1, 50), 2)
+            db.session.commit()
+
+        self.assertEqual(self._stats(), self._expected_stats())
+        incremental = self._stats()
+        result = DownlineStatsService.rebuild(chunk_size=7, max_workers=1)
+        self.assertEqual(result['ranges'], len(range(
+            min(o.user_id for o in Order.query.filter_by(status='completed')),
+            max(o.user_id for o in Order.query.filter_by(status='completed')) + 1, 7
+        )))
+        self.assertEqual(self._stats(), incremental)
+
+    def test_failed_rebuild_keeps_current_stats(self):
+        """重建寫入暫存表失敗時不清空既有統計，暫存表一併移除"""
+        db.session.add_all([
+            Order(user_id=user_id, product_id=1, quantity=1, total_price=100 * user_id, cost=50, status='completed',
+                  created_at=datetime(2026, 9, 1) + timedelta(hours=user_id))
+            for user_id in range(1, 31)
+        ])
+        db.session.commit()
+        current = self._stats()
+        self.assertTrue(current)
+
+        with patch.object(DownlineStatsService, '_rebuild_range', side_effect=RuntimeError('worker failed')):
+            with self.assertRaises(RuntimeError):
+                DownlineStatsService.rebuild(chunk_size=7, max_workers=1)
+        self.assertEqual(self._stats(), current)
+        self.assertNotIn(REBUILD_STAGING.name, inspect(db.engine).get_table_names())
+
+        DownlineStatsService.rebuild(chunk_size=7, max_workers=1)
+        self.assertEqual(self._stats(), current)
+        self.assertNotIn(REBUILD_STAGING.name, inspect(db.engine).get_table_names())
+
+    def test_referrer_change_moves_stats(self):
+        """變更推薦人後，子樹成員的統計自原上線移除並累加至新上線，與逐筆計算一致"""
+        rng = self.rng
+        start = datetime(2026, 9, 1)
+        db.session.add_all([
+            Order(user_id=rng.randint(1, 30), product_id=1, quantity=1, total_price=round(rng.uniform(100, 2000), 2),
+                  cost=50, status=rng.choice(['pending', 'completed', 'completed']),
+                  created_at=start + timedelta(hours=step))
+            for step in range(60)
+        ])
+        db.session.commit()
+        for _ in range(30):
+            user = db.session.get(User, rng.randint(1, 30))
+            subtree = set(db.session.execute(
+                select(ReferralClosure.descendant_id).where(ReferralClosure.ancestor_id == user.id)
+            ).scalars())
+            user.referrer_id = rng.choice([None, *(set(range(1, 31)) - subtree)])
+            db.session.commit()
+
+        self.assertEqual(self._stats(), self._expected_stats())
+        # 不再是上線的統計列已刪除，不會被升級檢查計為活躍下線
+        self.assertEqual(
+            {(row.mom_id, row.downline_id) for row in DownlineStats.query.all()},
+            set(self._expected_stats())
+        )
+
+    def test_refund_keeps_last_order_date(self):
+        db.session.add_all([
+            User(id=31, username='mom', email='mom@test.com'),
+            User(id=32, username='buyer', email='buyer@test.com', referrer_id=31),
+        ])
+        db.session.add_all([
+            Order(id=1, user_id=32, product_id=1, quantity=1, total_price=1000, cost=500, status='completed',
+                  created_at=datetime(2026, 10, 1)),
+            Order(id=2, user_id=32, product_id=1, quantity=1, total_price=500, cost=200, status='completed',
+                  created_at=datetime(2026, 10, 5)),
+        ])
+        db.session.commit()
+        db.session.add(Refund(order_id=2, user_id='32', amount=200, status='completed'))
+        db.session.commit()
+        stats = DownlineStats.query.filter_by(mom_id=31, downline_id=32).one()
+        self.assertEqual((stats.order_count, stats.total_spent), (2, 1300))
+
+        db.session.get(Order, 2).status = 'cancelled'
+        db.session.commit()
+        db.session.refresh(stats)
+        self.assertEqual((stats.order_count, stats.total_spent, stats.last_order_date), (1, 1000, datetime(2026, 10, 1)))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+import unittest
+from datetime import datetime, timedelta
+from backend.services.group_mom_service import GroupMomService
+from backend.services.referral_service import ReferralService
+from backend.models.user import User
+from backend.models.notification import Notification
+from backend.models.user_status_event import UserStatusEvent
+from backend.models.referral_closure import ReferralClosure
+from backend.models.logistics_company import LogisticsCompany  # noqa: F401 (Order 關聯)
+from backend.models.recipient import Recipient  # noqa: F401
+from backend.models.settlement import SettlementRun  # noqa: F401
+from backend.extensions import db
+from backend.app import create_app
+from backend.config import TestingConfig
+from backend.tests import create_tables
+
+class TestGroupMomFeeSweeps(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(TestingConfig)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        create_tables(db.engine, User, ReferralClosure, Notification, UserStatusEvent)
+
+        self.now = datetime.utcnow()
+        # 1 為推薦人；2-9 依序為：已過期 1/2/3 級、3 天後到期、30 天後到期、已過期會員、未設定有效期、6 天後到期
+        paid_until = {
+            2: -1, 3: -10, 4: -2, 5: 3, 6: 30, 7: -5, 8: None, 9: 6
+        }
+        levels = {2: 1, 3: 2, 4: 3, 5: 1, 6: 2, 7: 0, 8: 1, 9: 3}
+        db.session.add(User(id=1, username='u1', email='u1@test.com'))
+        db.session.flush()
+        for user_id, days in paid_until.items():
+            db.session.add(User(
+                id=user_id, username=f'u{user_id}', email=f'u{user_id}@test.com', referrer_id=1,
+                group_mom_level=levels[user_id],
+                group_mom_status='approved' if levels[user_id] else 'none',
+                group_mom_fee_paid_until=self.now + timedelta(days=days) if days is not None else None
+            ))
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        self.app_context.pop()
+
+    def test_deactivate_expired_group_moms(self):
+        deactivated = GroupMomService.deactivate_expired_group_moms(self.now)
+        self.assertEqual(deactivated, [
+            {'user_id': 2, 'old_level': 1}, {'user_id': 3, 'old_level': 2}, {'user_id': 4, 'old_level': 3}
+        ])
+
+        db.session.expire_all()
+        for user_id in (2, 3, 4):
+            user = db.session.get(User, user_id)
+            self.assertEqual(user.group_mom_level, 0)
+            self.assertEqual(user.group_mom_status, 'none')
+        self.assertEqual(db.session.get(User, 5).group_mom_level, 1)
+        self.assertEqual(db.session.get(User, 8).group_mom_level, 1)
+
+        events = UserStatusEvent.query.order_by(UserStatusEvent.user_id).all()
+        self.assertEqual(
+            [(e.user_id, e.action, e.reason, e.from_level, e.to_level) for e in events],
+            [(2, 'deactivate', 'fee_expired', 1, 0), (3, 'deactivate', 'fee_expired', 2, 0),
+             (4, 'deactivate', 'fee_expired', 3, 0)]
+        )
+
+        # 推薦人的各等級直屬下線計數與全量對帳一致
+        referrer = db.session.get(User, 1)
+        self.assertEqual(
+            (referrer.small_mom_referral_count, referrer.middle_mom_referral_count, referrer.big_mom_referral_count),
+            (2, 1, 1)
+        )
+        self.assertEqual(ReferralService.reconcile_referral_counters()['corrected'], 0)
+
+        # 重複執行不會再停用或寫入事件
+        self.assertEqual(GroupMomService.deactivate_expired_group_moms(self.now), [])
+        self.assertEqual(UserStatusEvent.query.count(), 3)
+
+    def test_check_and_notify_expiring_fees(self):
+        notification_ids = GroupMomService.check_and_notify_expiring_fees(self.now)
+        notifications = Notification.query.filter(Notification.id.in_(notification_ids)).all()
+        self.assertEqual(sorted(int(n.user_id) for n in notifications), [5, 9])
+        for notification in notifications:
+            self.assertEqual(notification.type, 'fee_expiring')
+            self.assertEqual(notification.category, 'financial')
+            self.assertIn('fee_paid_until', notification.extra_data)
+
+        # 同一會費有效期不重複提醒；續費後（有效期改變）進入提醒範圍才再次提醒
+        self.assertEqual(GroupMomService.check_and_notify_expiring_fees(self.now), [])
+        db.session.get(User, 9).group_mom_fee_paid_until = self.now + timedelta(days=5)
+        db.session.commit()
+        notification_ids = GroupMomService.check_and_notify_expiring_fees(self.now)
+        self.assertEqual([int(n.user_id) for n in Notification.query.filter(Notification.id.in_(notification_ids))], [9])
+        self.assertEqual(Notification.query.count(), 3)
+
+if __name__ == '__main__':
+    unittest.main()
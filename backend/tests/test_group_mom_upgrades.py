@@ -0,0 +1,116 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+import random
+import unittest
+from unittest.mock import patch
+from datetime import datetime, timedelta
+from backend.services.group_mom_service import GroupMomService
+from backend.models.user import User
+from backend.models.audit import AuditLog
+from backend.models.downline_stats import DownlineStats
+from backend.models.referral_closure import ReferralClosure
+from backend.models.logistics_company import LogisticsCompany  # noqa: F401 (Order 關聯)
+from backend.models.recipient import Recipient  # noqa: F401
+from backend.models.settlement import SettlementRun  # noqa: F401
+from backend.extensions import db
+from backend.app import create_app
+from backend.config import Config, TestingConfig
+from backend.tests import create_tables
+
+class TestGroupMomUpgrades(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(TestingConfig)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        create_tables(db.engine, User, ReferralClosure, DownlineStats, AuditLog)
+
+        rng = random.Random(22)
+        now = datetime.utcnow()
+        users = []
+        for user_id in range(1, 81):
+            level = rng.choice([0, 1, 1, 2, 2, 3])
+            users.append(User(
+                id=user_id, username=f'u{user_id}', email=f'u{user_id}@test.com', group_mom_level=level,
+                group_mom_fee_paid_until=now + timedelta(days=rng.choice([-5, 30, 30, 30]))
+            ))
+        db.session.add_all(users)
+        db.session.commit()
+        # 候選團媽的下線統計：活躍與否、消費金額隨機，部分團媽給足門檻
+        stats = []
+        for mom_id in range(1, 81):
+            downline_count = rng.choice([3, 12, 79])
+            for downline_id in rng.sample([u for u in range(1, 81) if u != mom_id], min(downline_count, 79)):
+                stats.append(DownlineStats(
+                    mom_id=mom_id, downline_id=downline_id, order_count=1,
+                    total_spent=rng.choice([500, 5000, 20000]),
+                    last_order_date=now - timedelta(days=rng.choice([10, 10, 200]))
+                ))
+        db.session.add_all(stats)
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        self.app_context.pop()
+
+    def _expected_eligible(self, evaluations):
+        """逐一以 check_and_process_level_upgrade 的條件計算（不寫入）"""
+        expected = set()
+        for evaluation in evaluations:
+            user = db.session.get(User, evaluation['user_id'])
+            active = [
+                stats for stats in DownlineStats.query.filter_by(mom_id=user.id)
+                if stats.last_order_date >= datetime.utcnow() - timedelta(days=90)
+            ]
+            qualified = [
+                stats for stats in DownlineStats.query.filter_by(mom_id=user.id)
+                if stats.downline.group_mom_level == user.group_mom_level and stats.downline.is_group_mom_fee_valid()
+            ]
+            required = 50 if user.group_mom_level == 0 else 10
+            min_sales = {1: 50000, 2: 100000, 3: 200000}[user.group_mom_level + 1]
+            if len(active) >= required and len(qualified) >= 10 and sum(s.total_spent for s in active) >= min_sales:
+                expected.add(user.id)
+        return expected
+
+    def test_batch_matches_per_user_rules(self):
+        evaluations = GroupMomService.evaluate_level_upgrades()
+        self.assertTrue(evaluations)
+        self.assertTrue(all(0 < e['level'] < 3 for e in evaluations))
+        eligible = {e['user_id'] for e in evaluations if e['eligible']}
+        self.assertTrue(eligible)
+        self.assertEqual(eligible, self._expected_eligible(evaluations))
+
+        levels = {e['user_id']: e['level'] for e in evaluations}
+        with patch.object(Config, 'GROUP_MOM_UPGRADE_CHUNK_SIZE', 2):
+            result = GroupMomService.process_level_upgrades()
+        self.assertTrue(result['success'])
+        self.assertEqual({u['user_id'] for u in result['upgrades']}, eligible)
+        self.assertEqual(set(result['timings']), {'evaluate', 'update', 'audit', 'total'})
+        for user_id in eligible:
+            self.assertEqual(db.session.get(User, user_id).group_mom_level, levels[user_id] + 1)
+
+        logs = AuditLog.query.filter_by(action='group_mom_level_upgrade').all()
+        self.assertEqual(sorted(log.target_id for log in logs), sorted(eligible))
+        self.assertEqual(logs[0].data['new_level'], logs[0].data['old_level'] + 1)
+
+    def test_level_changed_after_evaluation_is_skipped(self):
+        evaluations = GroupMomService.evaluate_level_upgrades()
+        target = next(e for e in evaluations if e['eligible'])
+        original = GroupMomService.evaluate_level_upgrades
+
+        def evaluate_then_change(now=None):
+            result = original(now)
+            db.session.get(User, target['user_id']).group_mom_level = 0
+            db.session.commit()
+            return result
+
+        GroupMomService.evaluate_level_upgrades = staticmethod(evaluate_then_change)
+        try:
+            result = GroupMomService.process_level_upgrades()
+        finally:
+            GroupMomService.evaluate_level_upgrades = staticmethod(original)
+        self.assertNotIn(target['user_id'], {u['user_id'] for u in result['upgrades']})
+        self.assertEqual(db.session.get(User, target['user_id']).group_mom_level, 0)
+
+if __name__ == '__main__':
+    unittest.main()
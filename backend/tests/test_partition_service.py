@@ -0,0 +1,74 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+import unittest
+from datetime import date
+from backend.services.partition_service import PartitionService
+from backend.utils.partitioning import (
+    create_partition_sql, is_partition_table, parse_partition_name, partition_bounds, split_default_partition_sql
+)
+from backend.extensions import db
+from backend.app import create_app
+from backend.config import TestingConfig
+
+class TestPartitionService(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(TestingConfig)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+
+    def tearDown(self):
+        db.session.remove()
+        self.app_context.pop()
+
+    def test_partition_bounds(self):
+        """訂單以日期、結算單以期別字串界定月分區，a/b 兩期落在同一分區"""
+        self.assertEqual(partition_bounds('orders', date(2026, 12, 1)), ("'2026-12-01'", "'2027-01-01'"))
+        lower, upper = partition_bounds('settlements', date(2026, 12, 1))
+        self.assertEqual((lower, upper), ("'202612'", "'202701'"))
+        self.assertTrue(lower.strip("'") <= '202612a' < '202612b' < upper.strip("'"))
+        self.assertEqual(
+            create_partition_sql('settlements', date(2026, 12, 1)),
+            "CREATE TABLE IF NOT EXISTS settlements_p202612 PARTITION OF settlements "
+            "FOR VALUES FROM ('202612') TO ('202701')"
+        )
+
+    def test_split_default_partition(self):
+        """預設分區已有該月資料：卸離預設分區、建立月分區並搬回該月資料後再掛回"""
+        self.assertEqual(split_default_partition_sql('orders', date(2026, 12, 1)), [
+            'ALTER TABLE orders DETACH PARTITION orders_default',
+            create_partition_sql('orders', date(2026, 12, 1)),
+            "INSERT INTO orders SELECT * FROM orders_default "
+            "WHERE created_at >= '2026-12-01' AND created_at < '2027-01-01'",
+            "DELETE FROM orders_default WHERE created_at >= '2026-12-01' AND created_at < '2027-01-01'",
+            'ALTER TABLE orders ATTACH PARTITION orders_default DEFAULT',
+        ])
+
+    def test_partition_names(self):
+        self.assertEqual(parse_partition_name('orders_p202610'), ('orders', date(2026, 10, 1)))
+        self.assertEqual(parse_partition_name('settlements_default'), ('settlements', None))
+        self.assertIsNone(parse_partition_name('settlement_items'))
+        self.assertFalse(is_partition_table('orders'))
+        self.assertTrue(is_partition_table('orders_p202610'))
+
+    def test_missing_partitions(self):
+        """只補建尚未存在的當月與未來月份"""
+        missing = PartitionService.missing_partitions(
+            'orders', {'orders_p202610', 'orders_p202611', 'orders_default'}, date(2026, 10, 18), 3
+        )
+        self.assertEqual(missing, [date(2026, 12, 1), date(2027, 1, 1)])
+
+    def test_expired_partitions(self):
+        """早於保留期間的月分區才卸離，預設分區與其他母表的分區不受影響"""
+        existing = {'orders_p202409', 'orders_p202410', 'orders_p202610', 'orders_default', 'settlements_p202301'}
+        self.assertEqual(
+            PartitionService.expired_partitions('orders', existing, date(2026, 10, 18), 24),
+            ['orders_p202409']
+        )
+
+    def test_noop_without_postgresql(self):
+        self.assertFalse(PartitionService.is_supported())
+        self.assertEqual(PartitionService.maintain_partitions(), {'created': [], 'archived': []})
+
+if __name__ == '__main__':
+    unittest.main()
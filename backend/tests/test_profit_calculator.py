@@ -2,6 +2,8 @@ import sys
 import os
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
 import unittest
+import random
+from itertools import product
 from backend.utils.profit_calculator import ProfitCalculator
 from backend.config import Config, TestingConfig
 from backend.app import create_app
@@ -280,5 +282,101 @@ class TestProfitCalculator(unittest.TestCase):
         self.assertEqual(mom_profits['middle_mom_profit'], expected_middle)
         self.assertEqual(mom_profits['small_mom_profit'], expected_small)
 
+class TestFixedPointProfitKernel(unittest.TestCase):
+    """整數定點分潤核心需與 Decimal 實作逐欄位完全相同"""
+    CASES = 3000
+    RATE_CHOICES = (0, 0.01, 0.02, 0.025, 0.05, 0.1234)
+
+    def setUp(self):
+        self.app = create_app(TestingConfig)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        self.rng = random.Random(20261018)
+
+    def tearDown(self):
+        self.app_context.pop()
+
+    def _random_amount(self):
+        """整數元、含角分、極小值與負值（退款沖銷）混合"""
+        kind = self.rng.random()
+        if kind < 0.4:
+            return self.rng.randint(1, 50000)
+        if kind < 0.8:
+            return round(self.rng.uniform(0.01, 50000), 2)
+        if kind < 0.9:
+            return round(self.rng.uniform(0, 2), 2)
+        return round(self.rng.uniform(-500, 0), 2)
+
+    def _random_config(self):
+        return {
+            'platform_fee_rate': self.rng.choice(self.RATE_CHOICES),
+            'supplier_fee_rate': self.rng.choice(self.RATE_CHOICES),
+            'referrer_bonus_rate': self.rng.choice(self.RATE_CHOICES)
+        }
+
+    def test_breakdown_matches_decimal(self):
+        for _ in range(self.CASES):
+            selling_price, cost, config = self._random_amount(), self._random_amount(), self._random_config()
+            flags = [self.rng.random() < 0.5 for _ in range(4)]
+            with self.subTest(selling_price=selling_price, cost=cost, config=config, flags=flags):
+                self.assertEqual(
+                    ProfitCalculator.calculate_order_breakdown(selling_price, cost, *flags, config=config),
+                    ProfitCalculator._calculate_order_breakdown_decimal(selling_price, cost, *flags, config=config)
+                )
+
+    def test_all_mom_structures_match_decimal(self):
+        """每種團媽組合與介紹人有無皆走過"""
+        for flags in product((True, False), repeat=4):
+            for selling_price, cost in ((1000, 700), (99.99, 87.5), (10, 12.34), (0.01, 0)):
+                with self.subTest(selling_price=selling_price, cost=cost, flags=flags):
+                    self.assertEqual(
+                        ProfitCalculator.calculate_order_breakdown(selling_price, cost, *flags),
+                        ProfitCalculator._calculate_order_breakdown_decimal(selling_price, cost, *flags)
+                    )
+
+    def test_order_profit_and_tax_match_decimal(self):
+        for _ in range(self.CASES // 3):
+            selling_price, cost, config = self._random_amount(), self._random_amount(), self._random_config()
+            has_referrer = self.rng.random() < 0.5
+            supplier_fee = self.rng.randint(0, 100)
+            with self.subTest(selling_price=selling_price, cost=cost, config=config):
+                self.assertEqual(
+                    ProfitCalculator.calculate_order_profit(selling_price, cost, config=config, has_referrer=has_referrer),
+                    ProfitCalculator._calculate_order_profit_decimal(selling_price, cost, config, has_referrer)
+                )
+                self.assertEqual(
+                    ProfitCalculator.calculate_tax(selling_price, cost, supplier_fee),
+                    ProfitCalculator._calculate_tax_decimal(selling_price, cost, supplier_fee)
+                )
+
+    def test_falls_back_beyond_fixed_point_precision(self):
+        """金額超過兩位小數或費率超過四位小數時改走 Decimal 路徑"""
+        config = {'platform_fee_rate': 0.02, 'supplier_fee_rate': 0.02, 'referrer_bonus_rate': 0.012345}
+        for selling_price, cost, config in ((100.005, 70, None), (100, 70, config)):
+            self.assertIsNone(ProfitCalculator._fixed_point_units(
+                selling_price, cost, config or ProfitCalculator._default_config(), 0.15, 0.28, True, True
+            ))
+            self.assertEqual(
+                ProfitCalculator.calculate_order_breakdown(selling_price, cost, True, True, True, config=config),
+                ProfitCalculator._calculate_order_breakdown_decimal(selling_price, cost, True, True, True, config=config)
+            )
+
+    def test_batch_matches_scalar(self):
+        """向量化批次結果逐欄位等於逐筆計算，含需逐筆補算的非整數分與超大金額"""
+        count = 2000
+        selling_prices = [self._random_amount() for _ in range(count)] + [100.005, 2e7, 500]
+        costs = [self._random_amount() for _ in range(count)] + [70, 1.5e7, 250.125]
+        flags = [[self.rng.random() < 0.5 for _ in selling_prices] for _ in range(4)]
+        config = self._random_config()
+
+        batch = ProfitCalculator.calculate_order_profits_batch(selling_prices, costs, *flags, config=config)
+        for index, (selling_price, cost) in enumerate(zip(selling_prices, costs)):
+            expected = ProfitCalculator.calculate_order_breakdown(
+                selling_price, cost, *(mask[index] for mask in flags), config=config
+            )
+            with self.subTest(selling_price=selling_price, cost=cost):
+                self.assertEqual({key: batch[key][index] for key in expected}, expected)
+        self.assertTrue(ProfitCalculator.verify_breakdown_batch(selling_prices, batch).all())
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,152 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+import random
+import unittest
+from unittest.mock import patch
+from backend.utils.profit_calculator import ProfitCalculator
+from backend.utils.profit_rules import ProfitRuleEngine, RULESETS, register_ruleset
+from backend.models.order import Order
+from backend.models.logistics_company import LogisticsCompany
+from backend.models.recipient import Recipient
+from backend.models.settlement import SettlementRun
+from backend.config import Config, TestingConfig
+from backend.app import create_app
+
+TEST_RULESET = {
+    'description': '測試用：平台費 3%、大團媽 16%、中團媽 30%',
+    'platform_fee_rate': 0.03,
+    'supplier_fee_rate': 0.02,
+    'referrer_bonus_rate': 0.01,
+    'big_mom_rate': 0.16,
+    'middle_mom_rate': 0.30,
+    'tax_rounding': 'floor_ceil',
+    'mom_split': 'cascade',
+}
+
+class TestProfitRuleEngine(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(TestingConfig)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        register_ruleset('test-v2', TEST_RULESET)
+        ProfitRuleEngine.clear_memo()
+
+    def tearDown(self):
+        RULESETS.pop('test-v2', None)
+        self.app_context.pop()
+
+    def test_v1_matches_profit_calculator(self):
+        """v1 規則集與 ProfitCalculator 預設設定結果相同，並附上規則集版本"""
+        for flags in ((True, True, True, True), (False, True, True, False), (True, False, False, True)):
+            breakdown = ProfitRuleEngine.evaluate(1000, 700, *flags, version='v1')
+            self.assertEqual(breakdown.pop('ruleset_version'), 'v1')
+            self.assertEqual(breakdown, ProfitCalculator.calculate_order_breakdown(1000, 700, *flags))
+
+    def test_ruleset_rates_applied(self):
+        """規則集費率與團媽比例（含 Decimal 逐筆補算路徑）皆套用"""
+        config = {key: TEST_RULESET[key] for key in TEST_RULESET if key.endswith('_rate')}
+        for selling_price, cost in ((1000, 700), (100.005, 70)):
+            breakdown = ProfitRuleEngine.evaluate(selling_price, cost, True, True, True, version='test-v2')
+            expected = ProfitCalculator._calculate_order_breakdown_decimal(
+                selling_price, cost, True, True, True, True, config
+            )
+            self.assertEqual({key: breakdown[key] for key in expected}, expected)
+        self.assertNotEqual(
+            ProfitRuleEngine.evaluate(1000, 700, True, True, True, version='test-v2')['big_mom_profit'],
+            ProfitRuleEngine.evaluate(1000, 700, True, True, True, version='v1')['big_mom_profit']
+        )
+
+    def test_batch_matches_scalar(self):
+        prices, costs = [1000, 99.99, 100.005, 250], [700, 80, 70, 300]
+        flags = ([True, False, True, True], [True, True, False, True], [True, True, True, False], [True, False, True, True])
+        batch = ProfitRuleEngine.evaluate_batch(prices, costs, *flags, version='test-v2')
+        for index, (price, cost) in enumerate(zip(prices, costs)):
+            expected = ProfitRuleEngine.evaluate(price, cost, *(mask[index] for mask in flags), version='test-v2')
+            for key in ProfitCalculator.BREAKDOWN_KEYS:
+                self.assertEqual(batch[key][index], expected[key], msg=f'{index} {key}')
+
+    def test_memoized_by_inputs_and_version(self):
+        first = ProfitRuleEngine.evaluate(1000, 700, True, True, True, version='v1')
+        first['big_mom_profit'] = 0
+        second = ProfitRuleEngine.evaluate(1000, 700, True, True, True, version='v1')
+        self.assertNotEqual(second['big_mom_profit'], 0)
+        ProfitRuleEngine.evaluate(1000, 700, True, True, True, version='test-v2')
+        stats = ProfitRuleEngine.memo_stats()
+        self.assertEqual((stats['hits'], stats['misses']), (1, 2))
+
+    def test_unit_template_matches_total_price(self):
+        """單價乘數量的訂單以單位範本計算，結果與依總額計算完全相同"""
+        rng = random.Random(14)
+        for _ in range(500):
+            unit_price = rng.randint(1, 500000) / 100
+            unit_cost = rng.randint(0, int(unit_price * 100)) / 100
+            quantity = rng.randint(1, 50)
+            flags = tuple(rng.random() < 0.7 for _ in range(4))
+            total_price, cost = round(unit_price * quantity, 2), round(unit_cost * quantity, 2)
+            for version in ('v1', 'test-v2'):
+                self.assertEqual(
+                    ProfitRuleEngine.evaluate(total_price, cost, *flags, version=version, quantity=quantity),
+                    ProfitRuleEngine.evaluate(total_price, cost, *flags, version=version),
+                    msg=f'{unit_price} {unit_cost} {quantity} {flags} {version}'
+                )
+
+    def test_unit_template_shared_across_quantities(self):
+        """不同數量共用同一單位範本；金額無法被數量整除時改依總額計算"""
+        self.assertTrue(ProfitRuleEngine.prepare_unit_templates(99.9, 60))
+        self.assertEqual(ProfitRuleEngine.memo_stats()['templates']['currsize'], 4)
+        for quantity in (1, 3, 7):
+            ProfitRuleEngine.evaluate(round(99.9 * quantity, 2), 60 * quantity, True, True, True, quantity=quantity)
+        stats = ProfitRuleEngine.memo_stats()
+        self.assertEqual((stats['templates']['hits'], stats['templates']['currsize']), (3, 4))
+        self.assertEqual(stats['misses'], 0)
+
+        ProfitRuleEngine.evaluate(280, 210, True, True, True, quantity=3)
+        self.assertEqual(ProfitRuleEngine.memo_stats()['misses'], 1)
+        self.assertFalse(ProfitRuleEngine.prepare_unit_templates(100.005, 70))
+
+    def test_order_uses_quantity(self):
+        order = Order(quantity=3, total_price=299.7, cost=180, big_mom_id=1, small_mom_id=3, referrer_id=4)
+        self.assertTrue(order.calculate_profits())
+        expected = ProfitRuleEngine.evaluate(299.7, 180, True, False, True, True)
+        self.assertEqual(order.profit_breakdown, expected)
+        self.assertEqual(order.big_mom_amount, expected['big_mom_profit'])
+        self.assertEqual(ProfitRuleEngine.memo_stats()['templates']['currsize'], 1)
+
+    def test_v1_uses_configured_rates(self):
+        """v1 費率取自 Config，與結算對帳單等讀取設定之處一致"""
+        ruleset = ProfitRuleEngine.get_ruleset('v1')
+        self.assertEqual(
+            (ruleset['platform_fee_rate'], ruleset['supplier_fee_rate'], ruleset['referrer_bonus_rate'],
+             ruleset['big_mom_rate'], ruleset['middle_mom_rate']),
+            (Config.PLATFORM_FEE_RATE, Config.SUPPLIER_FEE_RATE, Config.REFERRER_BONUS_RATE,
+             Config.BIG_MOM_PROFIT_RATE, Config.MIDDLE_MOM_PROFIT_RATE)
+        )
+
+    def test_published_ruleset_is_immutable(self):
+        with self.assertRaises(ValueError):
+            register_ruleset('v1', dict(RULESETS['v1'], platform_fee_rate=0.05))
+        with self.assertRaises(ValueError):
+            register_ruleset('test-v3', dict(TEST_RULESET, mom_split='flat'))
+        with self.assertRaises(ValueError):
+            ProfitRuleEngine.evaluate(1000, 700, True, True, True, version='missing')
+
+    def test_order_recalculation_keeps_ruleset_version(self):
+        """訂單保存規則集版本，切換目前版本後重算結果不變"""
+        order = Order(total_price=1000, cost=700, big_mom_id=1, middle_mom_id=2, small_mom_id=3, referrer_id=4)
+        self.assertTrue(order.calculate_profits())
+        self.assertEqual(order.profit_ruleset_version, Config.PROFIT_RULESET_VERSION)
+        big_mom_amount = order.big_mom_amount
+
+        with patch.object(Config, 'PROFIT_RULESET_VERSION', 'test-v2'):
+            self.assertTrue(order.calculate_profits())
+            self.assertEqual(order.big_mom_amount, big_mom_amount)
+            self.assertEqual(order.profit_ruleset_version, 'v1')
+
+            new_order = Order(total_price=1000, cost=700, big_mom_id=1, middle_mom_id=2, small_mom_id=3)
+            self.assertTrue(new_order.calculate_profits())
+            self.assertEqual(new_order.profit_ruleset_version, 'test-v2')
+            self.assertEqual(new_order.profit_breakdown['ruleset_version'], 'test-v2')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+import unittest
+from datetime import datetime
+from backend.services.profit_verification_service import ProfitVerificationService, VERIFICATION_ERROR_PREFIX
+from backend.models.order import Order
+from backend.models.refund import Refund
+from backend.models.downline_stats import DownlineStats
+from backend.models.user import User
+from backend.models.referral_closure import ReferralClosure
+from backend.models.product import Product
+from backend.models.logistics_company import LogisticsCompany
+from backend.models.recipient import Recipient
+from backend.models.settlement import SettlementRun
+from backend.models.platform_summary import PlatformSummary
+from backend.utils.profit_calculator import ProfitCalculator
+from backend.utils.profit_rules import ProfitRuleEngine
+from backend.extensions import db
+from backend.app import create_app
+from backend.config import TestingConfig
+from backend.tests import create_tables
+
+class TestProfitVerificationService(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(TestingConfig)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        create_tables(db.engine, User, LogisticsCompany, Recipient, SettlementRun, Product, Order, PlatformSummary,
+                      Refund, DownlineStats, ReferralClosure)
+        db.session.add(User(id=1, username='buyer', email='b@test.com'))
+        for order_id in range(1, 11):
+            order = Order(
+                id=order_id, user_id=1, product_id=1, quantity=1, total_price=300 + order_id * 41.37,
+                cost=200 + order_id * 7, status='completed', big_mom_id=1, small_mom_id=1,
+                referrer_id=1 if order_id % 2 else None, created_at=datetime(2026, 7 + order_id % 3, 5)
+            )
+            order.calculate_profits()
+            db.session.add(order)
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        self.app_context.pop()
+
+    def _corrupt(self, order_id, **changes):
+        order = db.session.get(Order, order_id)
+        order.profit_breakdown = dict(order.profit_breakdown, **changes)
+        db.session.commit()
+
+    def test_partition_differences_match_verify_breakdown(self):
+        prices = [1000, 99.99, 100.005, 12345.67]
+        breakdowns = [ProfitRuleEngine.evaluate(price, price * 0.7, True, False, True) for price in prices]
+        breakdowns[1]['platform_fee'] += 0.02
+        differences = ProfitCalculator.partition_differences(prices, breakdowns)
+        self.assertEqual(differences[1], 20000)
+        for price, breakdown, difference in zip(prices, breakdowns, differences.tolist()):
+            self.assertEqual(abs(difference) <= 10000, ProfitCalculator.verify_breakdown(price, breakdown))
+
+    def test_flags_and_clears_in_chunks(self):
+        """分批驗證，標記加總不符的訂單；修正後重新驗證解除標記"""
+        self._corrupt(3, small_mom_profit=db.session.get(Order, 3).profit_breakdown['small_mom_profit'] + 1)
+        self._corrupt(8, platform_fee='n/a')
+
+        report = ProfitVerificationService.verify_orders(chunk_size=3)
+        self.assertEqual(report['chunks'], 4)
+        self.assertEqual((report['scanned'], report['verified'], report['failed']), (10, 8, 2))
+        self.assertEqual([failed['order_id'] for failed in report['failed_orders']], [3, 8])
+        self.assertEqual(report['failed_orders'][0]['difference'], 1)
+
+        db.session.expire_all()
+        self.assertFalse(db.session.get(Order, 3).calculation_verified)
+        self.assertTrue(db.session.get(Order, 3).calculation_error_log.startswith(VERIFICATION_ERROR_PREFIX))
+        self.assertIn('格式錯誤', db.session.get(Order, 8).calculation_error_log)
+        self.assertTrue(db.session.get(Order, 4).calculation_verified)
+
+        # 再次驗證不重複寫入
+        self.assertEqual(ProfitVerificationService.verify_orders(chunk_size=3)['flagged'], 0)
+
+        db.session.get(Order, 3).calculate_profits()
+        db.session.get(Order, 3).calculation_error_log = f'{VERIFICATION_ERROR_PREFIX}：舊紀錄'
+        db.session.get(Order, 3).calculation_verified = False
+        db.session.commit()
+        report = ProfitVerificationService.verify_orders()
+        self.assertEqual((report['failed'], report['cleared']), (1, 1))
+        db.session.expire_all()
+        self.assertTrue(db.session.get(Order, 3).calculation_verified)
+        self.assertIsNone(db.session.get(Order, 3).calculation_error_log)
+
+    def test_date_range_and_missing_breakdown(self):
+        db.session.get(Order, 2).profit_breakdown = None
+        db.session.commit()
+        report = ProfitVerificationService.verify_orders(datetime(2026, 8, 1), datetime(2026, 9, 1))
+        # created_at 落在 8 月：order_id % 3 == 1
+        self.assertEqual(report['scanned'], 4)
+        self.assertEqual((report['verified'], report['missing'], report['failed']), (4, 0, 0))
+        report = ProfitVerificationService.verify_orders(datetime(2026, 9, 1), datetime(2026, 10, 1))
+        self.assertEqual((report['scanned'], report['missing'], report['failed']), (3, 1, 0))
+
+if __name__ == '__main__':
+    unittest.main()
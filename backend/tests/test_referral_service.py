@@ -0,0 +1,187 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+import random
+import unittest
+from datetime import datetime, timedelta
+from sqlalchemy import select, update
+from backend.services.referral_service import ReferralService
+from backend.models.user import User
+from backend.models.order import Order
+from backend.models.refund import Refund
+from backend.models.downline_stats import DownlineStats
+from backend.models.product import Product
+from backend.models.commission import CommissionRecord
+from backend.models.commission_ledger import CommissionBalance, CommissionDailyRollup, CommissionLedgerEntry
+from backend.models.referral_closure import ReferralClosure
+from backend.models.logistics_company import LogisticsCompany
+from backend.models.recipient import Recipient
+from backend.models.settlement import SettlementRun
+from backend.models.platform_summary import PlatformSummary
+from backend.extensions import db
+from backend.app import create_app
+from backend.config import TestingConfig
+from backend.tests import create_tables
+
+class TestReferralService(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(TestingConfig)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        create_tables(
+            db.engine, User, ReferralClosure, LogisticsCompany, Recipient, SettlementRun, Product, Order,
+            Refund, DownlineStats, CommissionRecord, CommissionLedgerEntry, CommissionBalance, CommissionDailyRollup,
+            PlatformSummary
+        )
+
+    def tearDown(self):
+        db.session.remove()
+        self.app_context.pop()
+
+    def _add_users(self, referrers, levels=None):
+        """referrers: {用戶 ID: 推薦人 ID}"""
+        levels = levels or {}
+        db.session.add_all([
+            User(id=user_id, username=f'u{user_id}', email=f'u{user_id}@test.com', referrer_id=referrer_id,
+                 group_mom_level=levels.get(user_id, 0))
+            for user_id, referrer_id in referrers.items()
+        ])
+        db.session.commit()
+
+    def _closure(self):
+        return set(db.session.execute(
+            select(ReferralClosure.ancestor_id, ReferralClosure.descendant_id, ReferralClosure.depth)
+        ).all())
+
+    def _expected_closure(self):
+        referrers = dict(db.session.execute(select(User.id, User.referrer_id)).all())
+        expected = set()
+        for user_id in referrers:
+            ancestor, depth = user_id, 0
+            while ancestor is not None:
+                expected.add((ancestor, user_id, depth))
+                ancestor, depth = referrers[ancestor], depth + 1
+        return expected
+
+    def test_closure_maintained_on_insert_and_move(self):
+        """同一次 flush 新增上下線、變更推薦人時，閉包表與逐層追溯結果一致"""
+        self._add_users({5: 4, 4: 3, 3: 1, 2: 1, 1: None})
+        self.assertEqual(ReferralService.get_upline_ids(5), [4, 3, 1])
+        self.assertEqual(self._closure(), self._expected_closure())
+
+        db.session.get(User, 3).referrer_id = 2
+        db.session.commit()
+        self.assertEqual(ReferralService.get_upline_ids(5), [4, 3, 2, 1])
+        self.assertEqual(ReferralService.get_upline_ids(5, max_depth=2), [4, 3])
+
+        db.session.get(User, 4).referrer_id = None
+        db.session.commit()
+        self.assertEqual(ReferralService.get_upline_ids(5), [4])
+        self.assertEqual(self._closure(), self._expected_closure())
+
+    def test_random_moves_match_rebuild(self):
+        rng = random.Random(16)
+        self._add_users({user_id: rng.choice([None, *range(1, user_id)]) for user_id in range(1, 60)})
+        for _ in range(40):
+            user = db.session.get(User, rng.randint(1, 59))
+            subtree = set(db.session.execute(
+                select(ReferralClosure.descendant_id).where(ReferralClosure.ancestor_id == user.id)
+            ).scalars())
+            user.referrer_id = rng.choice([None, *(set(range(1, 60)) - subtree)])
+            db.session.commit()
+        self.assertEqual(self._closure(), self._expected_closure())
+
+        incremental = self._closure()
+        ReferralService.rebuild()
+        db.session.commit()
+        self.assertEqual(self._closure(), incremental)
+
+    def test_cycle_rejected(self):
+        self._add_users({1: None, 2: 1, 3: 2})
+        db.session.get(User, 1).referrer_id = 3
+        with self.assertRaises(ValueError):
+            db.session.commit()
+        db.session.rollback()
+        self.assertEqual(ReferralService.get_upline_ids(3), [2, 1])
+
+    def test_mom_chain(self):
+        """由近到遠依序取小、中、大團媽，較高等級之上的低等級團媽不列入"""
+        self._add_users(
+            {1: None, 2: 1, 3: 2, 4: 3, 5: 4, 6: 5, 7: 2},
+            levels={1: 1, 2: 3, 3: 2, 4: 0, 5: 1, 7: 1}
+        )
+        chains = ReferralService.get_mom_chains([6, 4, 7, 1])
+        self.assertEqual(chains[6], {'small_mom_id': 5, 'middle_mom_id': 3, 'big_mom_id': 2})
+        self.assertEqual(chains[4], {'small_mom_id': None, 'middle_mom_id': 3, 'big_mom_id': 2})
+        self.assertEqual(chains[7], {'small_mom_id': None, 'middle_mom_id': None, 'big_mom_id': 2})
+        self.assertEqual(chains[1], {'small_mom_id': None, 'middle_mom_id': None, 'big_mom_id': None})
+
+        db.session.get(User, 3).group_mom_fee_paid_until = datetime.utcnow() + timedelta(days=1)
+        db.session.commit()
+        self.assertEqual(
+            ReferralService.get_mom_chain(6, fee_valid_only=True),
+            {'small_mom_id': None, 'middle_mom_id': 3, 'big_mom_id': None}
+        )
+
+    def _expected_counters(self):
+        expected = {}
+        for user in User.query.all():
+            referrals = User.query.filter_by(referrer_id=user.id).all()
+            expected[user.id] = (
+                sum(1 for r in referrals if r.is_active),
+                *(sum(1 for r in referrals if r.group_mom_level == level) for level in (1, 2, 3))
+            )
+        return expected
+
+    def _counters(self):
+        db.session.expire_all()
+        return {
+            user.id: (user.referral_count, user.small_mom_referral_count, user.middle_mom_referral_count,
+                      user.big_mom_referral_count)
+            for user in User.query.all()
+        }
+
+    def test_referral_counters_maintained(self):
+        """新增、停用、等級與推薦人異動後，直屬下線計數與逐一計算一致，對帳不需修正"""
+        rng = random.Random(23)
+        self._add_users(
+            {user_id: rng.choice([None, *range(1, user_id)]) for user_id in range(1, 40)},
+            levels={user_id: rng.choice([0, 1, 2, 3]) for user_id in range(1, 40)}
+        )
+        for _ in range(60):
+            user = db.session.get(User, rng.choice([u for u, in db.session.execute(select(User.id))]))
+            action = rng.random()
+            if action < 0.3:
+                user.is_active = not user.is_active
+            elif action < 0.6:
+                user.group_mom_level = rng.choice([0, 1, 2, 3])
+            else:
+                subtree = set(db.session.execute(
+                    select(ReferralClosure.descendant_id).where(ReferralClosure.ancestor_id == user.id)
+                ).scalars())
+                user.referrer_id = rng.choice([None, *(set(db.session.execute(select(User.id)).scalars()) - subtree)])
+            db.session.commit()
+        self.assertEqual(self._counters(), self._expected_counters())
+        self.assertEqual(ReferralService.reconcile_referral_counters(chunk_size=7)['corrected'], 0)
+
+        # 計數被改壞時由對帳修正
+        db.session.execute(update(User).values(referral_count=99))
+        db.session.commit()
+        summary = ReferralService.reconcile_referral_counters(chunk_size=7)
+        self.assertEqual(summary['scanned'], User.query.count())
+        self.assertEqual(summary['corrected'], User.query.count())
+        self.assertEqual(self._counters(), self._expected_counters())
+
+        mom = User.query.filter(User.small_mom_referral_count > 0).first()
+        mom.group_mom_level = 1
+        self.assertEqual(mom.can_upgrade_to_group_mom(), mom.small_mom_referral_count >= 10)
+        self.assertEqual(mom.to_dict()['referral_count'], mom.referral_count if mom.role == 'member' else 0)
+
+    def test_group_mom_upline_skips_members(self):
+        """上線中有一般會員時略過並繼續往上，不再無限迴圈"""
+        self._add_users({1: None, 2: 1, 3: 2, 4: 3, 5: 4}, levels={1: 2, 2: 1, 4: 1})
+        self.assertEqual([mom.id for mom in ReferralService.get_group_mom_upline(5)], [4, 2, 1])
+        self.assertEqual([mom.id for mom in ReferralService.get_group_mom_upline(5, limit=2)], [4, 2])
+
+if __name__ == '__main__':
+    unittest.main()
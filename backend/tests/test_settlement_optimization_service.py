@@ -0,0 +1,252 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+import concurrent.futures
+import multiprocessing
+import unittest
+from unittest.mock import patch
+from datetime import datetime, timedelta
+from sqlalchemy import event, update
+import pandas as pd
+from backend.services.settlement_optimization_service import (
+    SettlementOptimizationService, AUDIT_RULES, _recompute_profit_chunk
+)
+from backend.models.order import Order
+from backend.models.refund import Refund
+from backend.models.downline_stats import DownlineStats
+from backend.models.user import User
+from backend.models.referral_closure import ReferralClosure
+from backend.models.product import Product
+from backend.models.logistics_company import LogisticsCompany
+from backend.models.recipient import Recipient
+from backend.models.settlement import Settlement, SettlementItem, SettlementRun
+from backend.models.platform_summary import PlatformSummary
+from backend.models.audit import AuditLog
+from backend.services.platform_summary_service import PlatformSummaryService
+from backend.utils.profit_calculator import ProfitCalculator
+from backend.utils.profit_rules import ProfitRuleEngine, RULESETS, register_ruleset
+from backend.extensions import db
+from backend.app import create_app
+from backend.config import TestingConfig
+from backend.tests import create_tables
+
+class TestSettlementOptimizationService(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(TestingConfig)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        create_tables(
+            db.engine, User, LogisticsCompany, Recipient, SettlementRun, Product, Order, PlatformSummary, AuditLog,
+            Refund, DownlineStats, Settlement, SettlementItem, ReferralClosure
+        )
+        SettlementOptimizationService.clear_analysis_cache()
+        db.session.add_all([
+            User(id=1, username='buyer', email='b@test.com'),
+            Product(id=1, supplier_id='1', name='p', cost=70, price=100, source='s',
+                    description='d', image_url='i', on_shelf_date=datetime.now(),
+                    off_shelf_date=datetime.now())
+        ])
+        mom_chains = [(1, 1, 1), (1, None, 1), (None, 1, 1), (None, None, 1), (1, None, None), (None, None, None)]
+        self.orders = []
+        for order_id in range(1, 13):
+            big, middle, small = mom_chains[order_id % len(mom_chains)]
+            self.orders.append(Order(
+                id=order_id, user_id=1, product_id=1, quantity=1,
+                total_price=500 + order_id * 37, cost=250 + order_id * 11, status='completed',
+                big_mom_id=big, middle_mom_id=middle, small_mom_id=small,
+                referrer_id=1 if order_id % 2 else None
+            ))
+        db.session.add_all(self.orders)
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        self.app_context.pop()
+
+    def test_calculate_order_breakdown_partitions_selling_price(self):
+        """測試純函式分潤明細加總等於售價"""
+        breakdown = ProfitCalculator.calculate_order_breakdown(1000, 700, True, True, True)
+        self.assertTrue(ProfitCalculator.verify_breakdown(1000, breakdown))
+        self.assertGreater(breakdown['small_mom_profit'], 0)
+
+    def test_recompute_chunk_isolates_invalid_rows(self):
+        """批次中有資料異常的訂單時，僅該筆回報錯誤"""
+        results = _recompute_profit_chunk([
+            (1, 1000, 700, True, True, True, True, 'v1'),
+            (2, 500, None, False, False, True, False, 'v1')
+        ])
+        self.assertEqual(results[0][1], ProfitRuleEngine.evaluate(1000, 700, True, True, True, version='v1'))
+        self.assertIsNone(results[1][1])
+        self.assertIsNotNone(results[1][2])
+
+    def test_recompute_chunk_receives_runtime_ruleset(self):
+        """執行期間註冊的規則集隨批次傳入，spawn 啟動的子程序也能重算"""
+        ruleset = dict(ProfitRuleEngine.get_ruleset('v1'), description='runtime', big_mom_rate=0.2)
+        register_ruleset('runtime-v9', ruleset)
+        self.addCleanup(RULESETS.pop, 'runtime-v9', None)
+        rows = [(1, 1000, 700, True, True, True, True, 'runtime-v9')]
+        expected = ProfitRuleEngine.evaluate(1000, 700, True, True, True, version='runtime-v9')
+
+        context = multiprocessing.get_context('spawn')
+        with concurrent.futures.ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+            missing, = executor.submit(_recompute_profit_chunk, rows).result()
+            received, = executor.submit(_recompute_profit_chunk, rows, {'runtime-v9': ruleset}).result()
+        self.assertIsNone(missing[1])
+        self.assertEqual(received[1], expected)
+
+    @patch.object(SettlementOptimizationService, 'BATCH_SIZE', 5)
+    def test_process_settlement_batch_matches_orm_calculation(self):
+        """測試多程序重算結果與 Order.calculate_profits 一致，並同步平台總覽"""
+        result = SettlementOptimizationService.process_settlement_batch(
+            [order.id for order in self.orders], max_workers=2
+        )
+
+        self.assertEqual(result['total_processed'], len(self.orders))
+        self.assertEqual(result['errors'], [])
+        self.assertEqual(result['workers'], 2)
+
+        db.session.expire_all()
+        summary = PlatformSummaryService.get_summary()
+        for order in Order.query.order_by(Order.id):
+            expected = Order(
+                total_price=order.total_price, cost=order.cost, big_mom_id=order.big_mom_id,
+                middle_mom_id=order.middle_mom_id, small_mom_id=order.small_mom_id,
+                referrer_id=order.referrer_id
+            )
+            self.assertTrue(expected.calculate_profits())
+            self.assertTrue(order.calculation_verified)
+            self.assertIsNotNone(order.profit_calculated_at)
+            for column in ('tax_amount', 'platform_fee', 'supplier_amount', 'referrer_bonus_amount',
+                           'big_mom_amount', 'middle_mom_amount', 'small_mom_amount', 'platform_profit'):
+                self.assertAlmostEqual(getattr(order, column), getattr(expected, column), msg=column)
+        self.assertAlmostEqual(summary['platform_profit'], sum(o.platform_profit for o in Order.query))
+        self.assertAlmostEqual(summary['tax_amount'], sum(o.tax_amount for o in Order.query))
+
+    def test_automated_auditing_rules(self):
+        """測試向量化稽核規則結果與查詢次數"""
+        db.session.add(User(id=2, username='frequent', email='f@test.com'))
+        start = datetime(2025, 5, 1, 8, 0)
+        base = dict(user_id=2, product_id=1, quantity=1, cost=500, status='completed')
+        audited = [
+            # 24 小時前的訂單不列入時間窗
+            Order(id=100, total_price=1000, created_at=start - timedelta(hours=30), **base)
+        ]
+        for index in range(6):
+            audited.append(Order(
+                id=101 + index, total_price=1000, created_at=start + timedelta(hours=2 * index),
+                platform_profit=400 if index == 0 else 100,
+                return_status='returned' if index % 2 else None, **base
+            ))
+        audited.append(Order(id=120, user_id=1, product_id=1, quantity=1, cost=500, status='paid',
+                             total_price=60000, platform_profit=30000, created_at=start))
+        db.session.add_all(audited)
+        db.session.commit()
+
+        order_ids = [o.id for o in audited]
+        statements = []
+        listener = lambda *args: statements.append(args[2])
+        event.listen(db.engine, 'before_cursor_execute', listener)
+        try:
+            violations = SettlementOptimizationService.automated_auditing_rules(order_ids)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', listener)
+
+        found = {(v['order_id'], v['rule']) for v in violations}
+        expected = {(order_id, 'high_return_rate') for order_id in range(100, 107)}
+        expected |= {(101, 'abnormal_profit_rate'), (106, 'frequent_orders'), (120, 'high_value_order')}
+        self.assertEqual(found, expected)
+        self.assertEqual(len(violations), len(expected))
+        self.assertEqual([v['order_id'] for v in violations], sorted(v['order_id'] for v in violations))
+        self.assertIn('5 筆訂單', next(v['details'] for v in violations if v['rule'] == 'frequent_orders'))
+        self.assertEqual(AuditLog.query.count(), len(expected))
+        self.assertEqual(AuditLog.query.filter_by(reason='frequent_orders').one().target_id, 106)
+        # 擷取、兩次彙總、批次寫入（與訂單數無關）
+        self.assertLessEqual(len([sql for sql in statements if not sql.startswith(('BEGIN', 'COMMIT'))]), 4)
+
+    def test_register_audit_rule(self):
+        """測試宣告式新增稽核規則"""
+        with patch('backend.services.settlement_optimization_service.AUDIT_RULES', list(AUDIT_RULES)):
+            SettlementOptimizationService.register_audit_rule(
+                'odd_order_id', lambda df: df['id'] % 2 == 1, lambda row: f'訂單 {row.id}'
+            )
+            violations = SettlementOptimizationService.automated_auditing_rules([1, 2, 3])
+        self.assertEqual([(v['order_id'], v['rule']) for v in violations if v['rule'] == 'odd_order_id'],
+                         [(1, 'odd_order_id'), (3, 'odd_order_id')])
+
+    @staticmethod
+    def _fake_analysis(period):
+        """依期別內結算單產生與 settlement_data_analysis 相同結構的分析結果"""
+        df = pd.DataFrame(
+            [(s.settlement_type, s.total_amount, s.commission_amount or 0, s.tax_amount or 0)
+             for s in Settlement.query.filter_by(period=period)],
+            columns=['settlement_type', 'total_amount', 'commission_amount', 'tax_amount']
+        )
+        return {
+            'settlement_summary': {'total_settlements': len(df)},
+            'by_type': df.groupby('settlement_type').agg({
+                'total_amount': ['sum', 'mean', 'count'],
+                'commission_amount': 'sum',
+                'tax_amount': 'sum'
+            }).to_dict()
+        }
+
+    def test_settlement_data_analysis_cached_per_period_version(self):
+        """測試結算分析依期別與資料版本快取，並由異常檢測共用"""
+        def settlement(period, settlement_type, amount, order_id):
+            row = Settlement(period=period, settlement_type=settlement_type, user_id='1',
+                             total_amount=amount, net_amount=amount, order_count=1, commission_amount=amount / 10)
+            db.session.add(row)
+            db.session.flush()
+            db.session.add(SettlementItem(settlement_id=row.id, order_id=order_id, amount=amount))
+
+        settlement('202505a', 'supplier', 1000, 1)
+        settlement('202505a', 'mom', 100, 2)
+        settlement('202504b', 'supplier', 500, 3)
+        settlement('202504b', 'mom', 100, 4)
+        db.session.commit()
+
+        with patch.object(SettlementOptimizationService, '_compute_settlement_data_analysis',
+                          side_effect=self._fake_analysis) as compute:
+            analysis = SettlementOptimizationService.settlement_data_analysis('202505a')
+            anomalies = SettlementOptimizationService.detect_anomalies('202505a')
+            SettlementOptimizationService.detect_anomalies('202505a', analysis=analysis)
+            self.assertEqual([call.args[0] for call in compute.call_args_list], ['202505a', '202504b'])
+
+            # 快取回傳副本，呼叫端修改不影響快取
+            analysis['settlement_summary']['total_settlements'] = -1
+            self.assertEqual(
+                SettlementOptimizationService.settlement_data_analysis('202505a')['settlement_summary'],
+                {'total_settlements': 2}
+            )
+            self.assertEqual(compute.call_count, 2)
+
+            # 結算單異動後重新計算
+            settlement('202505a', 'mom', 50, 5)
+            db.session.commit()
+            self.assertEqual(
+                SettlementOptimizationService.settlement_data_analysis('202505a')['settlement_summary'],
+                {'total_settlements': 3}
+            )
+            self.assertEqual(compute.call_count, 3)
+
+            # 關聯的訂單分潤欄位（Core 批次 UPDATE）或結算對象團媽等級異動後同樣重新計算
+            db.session.execute(update(Order.__table__).where(Order.id == 1).values(platform_profit=1))
+            db.session.commit()
+            SettlementOptimizationService.settlement_data_analysis('202505a')
+            self.assertEqual(compute.call_count, 4)
+            db.session.execute(update(User).where(User.id == 1).values(group_mom_level=2))
+            db.session.commit()
+            SettlementOptimizationService.settlement_data_analysis('202505a')
+            self.assertEqual(compute.call_count, 5)
+
+            # 不在分析範圍內的訂單異動不影響快取
+            db.session.execute(update(Order.__table__).where(Order.id == 12).values(platform_profit=1))
+            db.session.commit()
+            SettlementOptimizationService.settlement_data_analysis('202505a')
+            self.assertEqual(compute.call_count, 5)
+
+        trend = {(a['settlement_type'], a['field']) for a in anomalies if a['type'] == 'trend_change'}
+        self.assertEqual(trend, {('supplier', 'total_amount'), ('supplier', 'commission_amount')})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -6,11 +6,23 @@ from unittest.mock import patch, MagicMock
 from datetime import datetime, timedelta
 from backend.services.settlement_service import SettlementService
 from backend.models.order import Order
-from backend.models.settlement import Settlement, SettlementStatement
+from backend.models.refund import Refund
+from backend.models.downline_stats import DownlineStats
+from backend.models.settlement import (
+    Settlement, SettlementStatement, SettlementItem, SettlementRun, SettlementRunTotal
+)
 from backend.models.user import User
+from backend.models.referral_closure import ReferralClosure
+from backend.models.product import Product
+from backend.models.logistics_company import LogisticsCompany
+from backend.models.recipient import Recipient
+from backend.models.platform_summary import PlatformSummary
+from backend.services.platform_summary_service import PlatformSummaryService
+from backend.services.settlement_optimization_service import SettlementOptimizationService
 from backend.extensions import db
 from backend.app import create_app
-from backend.config import TestingConfig
+from backend.config import Config, TestingConfig
+from backend.tests import create_tables
 
 class TestSettlementService(unittest.TestCase):
     def setUp(self):
@@ -62,17 +74,212 @@ class TestSettlementService(unittest.TestCase):
         mock_session.add.assert_called_once()
         mock_session.commit.assert_called_once()
 
-    @patch('backend.services.settlement_service.db.session')
-    def test_generate_settlement_batch(self, mock_session):
-        """測試生成結算批次"""
-        # 模擬查詢結果
-        mock_session.query.return_value.filter.return_value.all.return_value = [self.order]
-        
+    def _create_settlement_fixture(self):
+        """建立結算批次測試資料（真實 SQLite 資料表）"""
+        create_tables(
+            db.engine, User, LogisticsCompany, Recipient, SettlementRun, Product, Order, Refund, DownlineStats,
+            Settlement, SettlementStatement, SettlementItem, SettlementRunTotal, PlatformSummary, ReferralClosure
+        )
+        users = [
+            User(id=1, username='supplier', email='s@test.com', role='supplier'),
+            User(id=2, username='big', email='b@test.com', group_mom_level=3),
+            User(id=3, username='middle', email='m@test.com', group_mom_level=2),
+            User(id=4, username='small', email='sm@test.com', group_mom_level=1),
+            User(id=5, username='buyer', email='u@test.com')
+        ]
+        product = Product(
+            id=1, supplier_id='1', name='p', cost=70, price=100, source='s',
+            description='d', image_url='i', on_shelf_date=datetime.now(),
+            off_shelf_date=datetime.now()
+        )
+        base = dict(
+            user_id=5, product_id=1, quantity=1, cost=700, status='completed',
+            calculation_verified=True, supplier_amount=686.0, platform_fee=20.0,
+            tax_amount=14.25, platform_profit=35.0, tracking_number='T1'
+        )
+        orders = [
+            # 完整團媽鏈
+            Order(id=1, total_price=1000, big_mom_id=2, middle_mom_id=3, small_mom_id=4,
+                  big_mom_amount=30.0, middle_mom_amount=50.0, small_mom_amount=120.5,
+                  shipped_at=datetime(2025, 5, 2), **base),
+            # 無中團媽、有退貨
+            Order(id=2, total_price=1000, big_mom_id=2, small_mom_id=4,
+                  big_mom_amount=80.0, small_mom_amount=110.0, return_status='returned', **base),
+            # 同一團媽擔任大/中團媽
+            Order(id=3, total_price=1000, big_mom_id=2, middle_mom_id=2,
+                  big_mom_amount=40.0, middle_mom_amount=60.0, **base),
+            # 不應結算：未驗證、已結算、未完成
+            Order(id=4, total_price=1000, big_mom_id=2, big_mom_amount=1.0,
+                  **{**base, 'calculation_verified': False}),
+            Order(id=5, total_price=1000, big_mom_id=2, big_mom_amount=1.0,
+                  settled_at=datetime.now(), **base),
+            Order(id=6, total_price=1000, big_mom_id=2, big_mom_amount=1.0,
+                  **{**base, 'status': 'shipped'})
+        ]
+        db.session.add_all(users + [product] + orders)
+        db.session.commit()
+        return orders[:3]
+
+    @staticmethod
+    def _legacy_settlements(orders):
+        """逐筆分組的參考實作（原 generate_settlement_batch 的計算方式）"""
+        grouped = {}
+        for order in orders:
+            keys = [('1', 'supplier')]
+            keys += [(str(mom_id), 'mom') for mom_id in
+                     (order.big_mom_id, order.middle_mom_id, order.small_mom_id) if mom_id]
+            for key in keys:
+                grouped.setdefault(key, []).append(order)
+
+        def amount(order, user_id, settlement_type):
+            if settlement_type == 'supplier':
+                return order.supplier_amount
+            if str(order.big_mom_id) == user_id:
+                return order.big_mom_amount
+            if str(order.middle_mom_id) == user_id:
+                return order.middle_mom_amount
+            return order.small_mom_amount
+
+        return {
+            (user_id, settlement_type): {
+                'total_amount': sum(amount(o, user_id, settlement_type) for o in group),
+                'order_count': len(group),
+                'order_details': [{'order_id': o.id, 'amount': amount(o, user_id, settlement_type)}
+                                  for o in group],
+                'platform_fee': sum(o.platform_fee for o in group),
+                'tax_amount': sum(o.tax_amount for o in group),
+                'return_deductions': [{'order_id': o.id, 'amount': o.total_price, 'status': o.return_status}
+                                      for o in group if o.return_status]
+            }
+            for (user_id, settlement_type), group in grouped.items()
+        }
+
+    @staticmethod
+    def _order_details(settlement):
+        return [{'order_id': line['order_id'], 'amount': line['amount']}
+                for line in SettlementService.get_settlement_lines(settlement.id)]
+
+    def test_generate_settlement_batch(self):
+        """測試生成結算批次與逐筆計算結果一致"""
+        orders = self._create_settlement_fixture()
+        expected = self._legacy_settlements(orders)
+
+        result = SettlementService.generate_settlement_batch()
+
+        settlements = Settlement.query.all()
+        self.assertEqual(result['settlement_count'], len(expected))
+        self.assertEqual(len(settlements), len(expected))
+        for settlement in settlements:
+            want = expected[(settlement.user_id, settlement.settlement_type)]
+            statement = settlement.statements.one()
+            self.assertEqual(settlement.period, SettlementService.create_settlement_period())
+            self.assertAlmostEqual(settlement.total_amount, want['total_amount'])
+            self.assertAlmostEqual(settlement.net_amount, want['total_amount'])
+            self.assertEqual(settlement.order_count, want['order_count'])
+            self.assertEqual(self._order_details(settlement), want['order_details'])
+            self.assertEqual(statement.total_orders, want['order_count'])
+            self.assertAlmostEqual(statement.commission_details['amount'], want['platform_fee'])
+            self.assertAlmostEqual(statement.tax_details['amount'], want['tax_amount'])
+            self.assertEqual(statement.return_deductions, want['return_deductions'])
+            self.assertEqual(len(statement.shipping_details), want['order_count'])
+            self.assertIsNone(settlement.order_details)
+
+        # 結算分析經由結算明細列關聯訂單
+        analysis = SettlementOptimizationService._compute_settlement_data_analysis(
+            SettlementService.create_settlement_period()
+        )
+        line_count = sum(want['order_count'] for want in expected.values())
+        self.assertEqual(analysis['settlement_summary']['total_settlements'], line_count)
+        self.assertAlmostEqual(analysis['profit_metrics']['total_platform_profit'], 35.0 * line_count)
+
+    def _assert_settlements_match(self, expected):
+        settlements = Settlement.query.all()
+        self.assertEqual(len(settlements), len(expected))
+        for settlement in settlements:
+            want = expected[(settlement.user_id, settlement.settlement_type)]
+            self.assertAlmostEqual(settlement.total_amount, want['total_amount'])
+            self.assertEqual(settlement.order_count, want['order_count'])
+            self.assertEqual(self._order_details(settlement), want['order_details'])
+
+    def test_generate_settlement_batch_resumes_from_checkpoint(self):
+        """測試結算執行中斷後從檢查點續跑，且不重複結算"""
+        orders = self._create_settlement_fixture()
+        expected = self._legacy_settlements(orders)
+        process_chunk = SettlementService._process_run_chunk
+        calls = []
+
+        def crash_on_second_chunk(run):
+            calls.append(run.id)
+            if len(calls) == 2:
+                raise RuntimeError('scheduler restarted')
+            return process_chunk(run)
+
+        with patch.object(SettlementService, '_process_run_chunk', side_effect=crash_on_second_chunk):
+            with self.assertRaises(RuntimeError):
+                SettlementService.generate_settlement_batch(chunk_size=1)
+
+        run = SettlementRun.query.one()
+        self.assertEqual(run.status, 'failed')
+        self.assertEqual(run.last_order_id, 1)
+        self.assertEqual(run.processed_orders, 1)
+        self.assertEqual(Order.query.filter_by(settlement_run_id=run.id).count(), 1)
+        self.assertEqual(Settlement.query.count(), 0)
+
+        result = SettlementService.generate_settlement_batch()
+        run = SettlementRun.query.one()
+        self.assertEqual(result['run_id'], run.id)
+        self.assertEqual(run.status, 'completed')
+        self.assertEqual(run.processed_orders, 3)
+        self.assertEqual(run.processed_chunks, 3)
+        self.assertEqual(result['settlement_count'], len(expected))
+        self._assert_settlements_match(expected)
+
+        # 已納入結算執行的訂單不會再被結算
+        result = SettlementService.generate_settlement_batch()
+        self.assertEqual(result['settlement_count'], 0)
+        self.assertEqual(Settlement.query.count(), len(expected))
+
+    def test_get_resumable_run_claims_once(self):
+        """測試中斷的結算執行只會被一個 worker 認領，心跳未逾時的執行不會被接手"""
+        create_tables(db.engine, SettlementRun)
+        now = datetime.utcnow()
+        active = SettlementRun(period='202501a', status='running', chunk_size=10, heartbeat_at=now)
+        stale = SettlementRun(period='202501a', status='running', chunk_size=10,
+                              heartbeat_at=now - timedelta(seconds=Config.SETTLEMENT_RUN_STALE_SECONDS + 60))
+        db.session.add_all([stale, active])
+        db.session.commit()
+
+        run = SettlementService.get_resumable_run()
+        db.session.commit()
+        self.assertEqual(run.id, stale.id)
+        self.assertEqual(run.status, 'running')
+        self.assertGreaterEqual(run.heartbeat_at, now)
+        self.assertIsNone(SettlementService.get_resumable_run())
+
+        run.status = 'failed'
+        db.session.commit()
+        self.assertEqual(SettlementService.get_resumable_run().id, stale.id)
+
+    def test_rejected_settlement_releases_orders(self):
+        """測試訂單的結算單全部被拒絕後清除結算執行標記，可被下一次結算執行重新認領"""
+        orders = self._create_settlement_fixture()
+        expected = self._legacy_settlements(orders)
+        db.session.add(User(id=9, username='admin', email='a@test.com', role='admin'))
+        db.session.commit()
         SettlementService.generate_settlement_batch()
-        
-        # 驗證是否創建結算記錄和對帳單
-        self.assertEqual(mock_session.add.call_count, 4)  # 1個供應商 + 3個團媽的結算記錄
-        mock_session.commit.assert_called_once()
+
+        # 其他結算單仍有效時保留標記，避免重複結算
+        small_mom_settlement = Settlement.query.filter_by(settlement_type='mom', user_id='4').one()
+        SettlementService.reject_settlement(small_mom_settlement.id, 9, 'wrong amount')
+        self.assertEqual(Order.query.filter(Order.settlement_run_id.isnot(None)).count(), 3)
+
+        for settlement in Settlement.query.filter_by(status='pending').all():
+            SettlementService.reject_settlement(settlement.id, 9, 'wrong amount')
+        self.assertEqual(Order.query.filter(Order.settlement_run_id.isnot(None)).count(), 0)
+
+        result = SettlementService.generate_settlement_batch()
+        self.assertEqual(result['settlement_count'], len(expected))
+        self.assertEqual(result['order_count'], sum(want['order_count'] for want in expected.values()))
 
     @patch('backend.services.settlement_service.SettlementStatement')
     def test_confirm_statement(self, mock_statement):
@@ -94,40 +301,146 @@ class TestSettlementService(unittest.TestCase):
         result = SettlementService.confirm_statement(1, 'user1')
         self.assertFalse(result)
 
-    @patch('backend.services.settlement_service.Settlement')
-    def test_process_payment(self, mock_settlement):
-        """測試處理撥款"""
-        # 模擬結算記錄
-        settlement = MagicMock()
+    def test_process_payments(self):
+        """測試批次撥款：僅撥款已確認結算單並回寫訂單結算時間"""
+        self._create_settlement_fixture()
+        SettlementService.generate_settlement_batch()
+        supplier_settlement = Settlement.query.filter_by(settlement_type='supplier').one()
+        small_mom_settlement = Settlement.query.filter_by(settlement_type='mom', user_id='4').one()
+        supplier_settlement.is_confirmed = True
+        db.session.commit()
+
+        result = SettlementService.process_payments([supplier_settlement.id, small_mom_settlement.id])
+
+        self.assertEqual(result['settlement_ids'], [supplier_settlement.id])
+        self.assertEqual(result['settlement_count'], 1)
+        self.assertEqual(result['already_paid_ids'], [])
+        self.assertEqual(result['order_count'], 3)
+        self.assertIn('orders_per_second', result)
+        db.session.expire_all()
+        self.assertEqual(Settlement.query.get(supplier_settlement.id).status, 'paid')
+        self.assertIsNotNone(Settlement.query.get(supplier_settlement.id).paid_at)
+        self.assertEqual(Settlement.query.get(small_mom_settlement.id).status, 'pending')
+        self.assertEqual(Order.query.filter(Order.settled_at.isnot(None)).count(), 4)
+
+        # 重複撥款不會再次處理，已撥款的結算單另列並視為成功
+        paid_at = Settlement.query.get(supplier_settlement.id).paid_at
+        result = SettlementService.process_payments([supplier_settlement.id, small_mom_settlement.id])
+        self.assertEqual((result['settlement_ids'], result['order_count']), ([], 0))
+        self.assertEqual(result['already_paid_ids'], [supplier_settlement.id])
+        self.assertTrue(SettlementService.process_payment(supplier_settlement.id))
+        self.assertFalse(SettlementService.process_payment(small_mom_settlement.id))
+        db.session.expire_all()
+        self.assertEqual(Settlement.query.get(supplier_settlement.id).paid_at, paid_at)
+
+    def test_check_expired_settlements(self):
+        """測試過期結算單分批掃描"""
+        self._create_settlement_fixture()
+        now = datetime.utcnow()
+
+        def settlement(status, age_days):
+            return Settlement(period='202501a', settlement_type='mom', user_id='2', status=status,
+                              total_amount=10, net_amount=10, order_count=1,
+                              created_at=now - timedelta(days=age_days))
+
+        stale_pending = [settlement('pending', 40) for _ in range(3)]
+        fresh_pending = settlement('pending', 5)
+        old_approved = settlement('approved', 100)
+        recent_approved = settlement('approved', 50)
+        db.session.add_all(stale_pending + [fresh_pending, old_approved, recent_approved])
+        db.session.flush()
+        db.session.add_all([
+            SettlementItem(settlement_id=stale_pending[0].id, order_id=1, amount=10),
+            SettlementItem(settlement_id=stale_pending[0].id, order_id=2, amount=10),
+            SettlementItem(settlement_id=fresh_pending.id, order_id=3, amount=10)
+        ])
+        db.session.commit()
+
+        result = SettlementService.check_expired_settlements(batch_size=2)
+
+        self.assertEqual(result['rejected_count'], 3)
+        self.assertEqual(result['rejected_item_count'], 2)
+        self.assertEqual(result['expired_count'], 1)
+        self.assertEqual(result['batches'], 3)
+        self.assertIn('elapsed_seconds', result)
+        db.session.expire_all()
+        for stale in stale_pending:
+            self.assertEqual(stale.status, 'rejected')
+            self.assertIsNotNone(stale.rejected_at)
+            self.assertEqual(stale.reject_reason, '系統自動拒絕：超過30天未處理')
+        self.assertEqual(fresh_pending.status, 'pending')
+        self.assertEqual(fresh_pending.items.one().status, 'pending')
+        self.assertEqual({item.status for item in stale_pending[0].items}, {'rejected'})
+        self.assertTrue(old_approved.is_expired)
+        self.assertFalse(recent_approved.is_expired)
+
+        # 再次掃描不會重複處理
+        result = SettlementService.check_expired_settlements(batch_size=2)
+        self.assertEqual((result['rejected_count'], result['expired_count']), (0, 0))
+
+    def _aggregate_platform_summary(self):
+        """以全表彙總計算的總覽（原 get_platform_summary 的查詢）"""
+        completed = Order.query.filter(Order.status == 'completed')
+        return {
+            'total_revenue': sum(o.total_price for o in completed),
+            'settled_amount': sum(s.total_amount for s in Settlement.query.filter_by(status='paid')),
+            'unsettled_amount': sum(o.total_price for o in completed if o.settled_at is None),
+            'platform_profit': sum(o.platform_profit or 0 for o in completed),
+            'tax_amount': sum(o.tax_amount or 0 for o in completed)
+        }
+
+    def _assert_summary_matches(self, summary, expected):
+        for field, value in expected.items():
+            self.assertAlmostEqual(summary[field], value, msg=field)
+
+    def test_get_platform_summary(self):
+        """測試平台總覽隨訂單與結算單狀態增量更新，且與重建結果一致"""
+        self._create_settlement_fixture()
+        self._assert_summary_matches(SettlementService.get_platform_summary(), self._aggregate_platform_summary())
+
+        SettlementService.generate_settlement_batch()
+        settlement = Settlement.query.filter_by(settlement_type='supplier').one()
         settlement.is_confirmed = True
-        settlement.order_details = [{'order_id': 1}]
-        mock_settlement.query.get.return_value = settlement
-        
-        # 測試撥款處理
-        result = SettlementService.process_payment(1)
-        self.assertTrue(result)
-        self.assertEqual(settlement.status, 'paid')
-        self.assertIsNotNone(settlement.paid_at)
+        db.session.commit()
+        SettlementService.process_payments([settlement.id])
 
-    @patch('backend.services.settlement_service.db.session')
-    def test_get_platform_summary(self, mock_session):
-        """測試獲取平台總覽"""
-        # 模擬查詢結果
-        mock_session.query.return_value.filter.return_value.scalar.side_effect = [
-            1000000,  # total_revenue
-            800000,   # settled_amount
-            200000,   # unsettled_amount
-            50000,    # platform_profit
-            20000     # tax_amount
-        ]
-        
+        order = Order.query.get(6)
+        order.status = 'completed'
+        Order.query.get(1).tax_amount = 20.0
+        Order.query.get(2).status = 'cancelled'
+        db.session.commit()
+
+        expected = self._aggregate_platform_summary()
+        self.assertGreater(expected['settled_amount'], 0)
         summary = SettlementService.get_platform_summary()
-        
-        self.assertEqual(summary['total_revenue'], 1000000)
-        self.assertEqual(summary['settled_amount'], 800000)
-        self.assertEqual(summary['unsettled_amount'], 200000)
-        self.assertEqual(summary['platform_profit'], 50000)
-        self.assertEqual(summary['tax_amount'], 20000)
+        self.assertEqual(summary['period'], SettlementService.create_settlement_period())
+        self._assert_summary_matches(summary, expected)
+
+        PlatformSummaryService.rebuild()
+        self._assert_summary_matches(SettlementService.get_platform_summary(), expected)
+        period_summary = SettlementService.get_platform_summary(SettlementService.create_settlement_period())
+        self.assertAlmostEqual(period_summary['total_revenue'], expected['total_revenue'])
+
+    def test_platform_summary_shards_summed_on_read(self):
+        """各連線寫入自己的分片列，不寫全平台合計列；讀取時加總分片與期別"""
+        create_tables(db.engine, PlatformSummary)
+        connection_info = db.session.connection().info
+        for shard, deltas in ((3, {'202510a': {'total_revenue': 100}, '202510b': {'tax_amount': 5}}),
+                              (5, {'202510a': {'total_revenue': 50, 'platform_profit': 7}})):
+            connection_info['platform_summary_shard'] = shard
+            PlatformSummaryService.apply_deltas(deltas)
+        connection_info.pop('platform_summary_shard')
+        db.session.commit()
+
+        rows = {(row.period, row.shard) for row in PlatformSummary.query.filter(PlatformSummary.period.like('202510%'))}
+        self.assertEqual(rows, {('202510a', 3), ('202510b', 3), ('202510a', 5)})
+        self.assertEqual(PlatformSummary.query.filter_by(period='all').count(), 0)
+
+        period_summary = PlatformSummaryService.get_summary('202510a')
+        self.assertEqual((period_summary['total_revenue'], period_summary['platform_profit']), (150, 7))
+        totals = PlatformSummaryService.get_summary()
+        self.assertEqual((totals['period'], totals['total_revenue'], totals['tax_amount']), ('all', 150, 5))
+        self.assertEqual(PlatformSummaryService.get_summary('209901a')['total_revenue'], 0)
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,77 @@
+"""
+批次寫入工具
+PostgreSQL 與 SQLite（測試環境）皆支援 INSERT ... ON CONFLICT，依連線方言選擇對應的 insert 建構式
+"""
+from collections import defaultdict
+from sqlalchemy import bindparam, update
+from sqlalchemy.dialects import postgresql, sqlite
+from backend.extensions import db
+from backend.utils.partitioning import PARTITIONED_TABLES
+
+
+def dialect_insert(model, bind=None):
+    """依目前連線方言回傳支援 on_conflict_* 的 insert 敘述"""
+    dialect = (bind or db.session.get_bind()).dialect.name
+    if dialect == 'postgresql':
+        return postgresql.insert(model.__table__)
+    if dialect == 'sqlite':
+        return sqlite.insert(model.__table__)
+    raise NotImplementedError(f'不支援的資料庫方言：{dialect}')
+
+
+def upsert(model, rows, index_elements, set_columns=(), increment_columns=(), connection=None):
+    """
+    批次 upsert
+    :param index_elements: 唯一鍵欄位名稱
+    :param set_columns: 衝突時以新值覆蓋的欄位
+    :param increment_columns: 衝突時累加的欄位（原值 + 新值）
+    :param connection: 於 flush 事件中寫入時傳入 session.connection()，預設使用 db.session
+    """
+    if not rows:
+        return
+    stmt = dialect_insert(model, connection)
+    table = model.__table__
+    updates = {name: stmt.excluded[name] for name in set_columns}
+    updates.update({
+        name: db.func.coalesce(table.c[name], 0) + stmt.excluded[name]
+        for name in increment_columns
+    })
+    if updates:
+        stmt = stmt.on_conflict_do_update(index_elements=list(index_elements), set_=updates)
+    else:
+        stmt = stmt.on_conflict_do_nothing(index_elements=list(index_elements))
+    (connection or db.session).execute(stmt, rows)
+
+
+def update_by_id(model, rows, connection=None):
+    """
+    依 id 批次 UPDATE（executemany），欄位組合不同的列分組執行
+    分區表（orders、settlements）的主鍵為 (id, 分區鍵)：列中帶有分區鍵欄位時一併加入 WHERE 條件
+    （只用於定位分區、不會被更新），每列只探測單一分區；
+    未帶分區鍵的列只能以 id 比對，資料庫須逐一探測每個分區的主鍵索引，成本隨分區數線性增加
+    """
+    table = model.__table__
+    partition_key = PARTITIONED_TABLES.get(table.name, {}).get('column')
+    groups = defaultdict(list)
+    for row in rows:
+        groups[tuple(sorted(name for name in row if name not in ('id', partition_key)))].append(row)
+    executor = connection or db.session
+    for columns, group in groups.items():
+        keyed = [row for row in group if row.get(partition_key) is not None]
+        unkeyed = [row for row in group if row.get(partition_key) is None]
+        values = {name: bindparam(f'value_{name}', type_=table.c[name].type) for name in columns}
+        if keyed:
+            stmt = update(table).where(
+                table.c.id == bindparam('row_id'),
+                table.c[partition_key] == bindparam('row_partition_key', type_=table.c[partition_key].type)
+            ).values(values)
+            executor.execute(stmt, [
+                dict({f'value_{name}': row[name] for name in columns},
+                     row_id=row['id'], row_partition_key=row[partition_key])
+                for row in keyed
+            ])
+        if unkeyed:
+            stmt = update(table).where(table.c.id == bindparam('row_id')).values(values)
+            executor.execute(stmt, [
+                dict({f'value_{name}': row[name] for name in columns}, row_id=row['id']) for row in unkeyed
+            ])
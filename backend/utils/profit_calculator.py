@@ -1,17 +1,98 @@
 from decimal import Decimal, ROUND_HALF_UP
+from functools import lru_cache
+import numpy as np
 from typing import Optional, Dict, Union
 from datetime import datetime
 from backend.extensions import db
 from backend.models.group_mom_level import GroupMomLevel
 from backend.config import Config as AppConfig
 
+# 定點數分潤：金額以 1/MONEY_SCALE 元、費率以 1/RATE_SCALE 為單位的整數運算
+MONEY_SCALE = 1_000_000
+RATE_SCALE = 10_000
+_CENT = MONEY_SCALE // 100  # 1 分的金額單位數，與 RATE_SCALE 相同，故「分 × 費率單位」即為金額單位
+_FIXED_MONEY_LIMIT = 10 ** 11  # 分；超過時 float 與 Decimal 互轉可能失真，改走 Decimal 路徑
+_BATCH_MONEY_LIMIT = 10 ** 9  # 分；向量化運算以 int64 進行，金額 × 費率單位不可溢位
+# calculate_mom_profits 特殊情境固定使用的大/中團媽比例
+_BIG_SHARE = 1500
+_MIDDLE_SHARE = 2800
+
+
+def _to_fixed(value, scale):
+    """轉為整數定點數，小數位數超出精度時回傳 None"""
+    scaled = round(value * scale)
+    return scaled if scaled / scale == value else None
+
+
+@lru_cache(maxsize=256)
+def _to_rate(value):
+    """費率種類有限，轉換結果快取"""
+    return _to_fixed(value, RATE_SCALE)
+
+
+def _to_cents(value):
+    cents = _to_fixed(value, 100)
+    return cents if cents is not None and abs(cents) < _FIXED_MONEY_LIMIT else None
+
+
+def _trunc_div(numerator, denominator):
+    """向零取整除法，對應 int() 截斷"""
+    quotient = abs(numerator) // denominator
+    return quotient if numerator >= 0 else -quotient
+
+
+def _ceil_div(numerator, denominator):
+    return -(-numerator // denominator)
+
+
+def _mom_share(distributable, rate):
+    """int(可分配利潤 × 比例)，回傳金額單位"""
+    return _trunc_div(distributable * rate, MONEY_SCALE * RATE_SCALE) * MONEY_SCALE
+
+
+def _batch_trunc_div(numerator, denominator):
+    quotient = np.abs(numerator) // denominator
+    return np.where(numerator >= 0, quotient, -quotient)
+
+
+def _batch_ceil_div(numerator, denominator):
+    return -(-numerator // denominator)
+
+
+def _batch_mom_share(distributable, rate):
+    return _batch_trunc_div(distributable * rate, MONEY_SCALE * RATE_SCALE) * MONEY_SCALE
+
+
 class ProfitCalculator:
+    # calculate_order_breakdown 回傳的分潤欄位（不含售價與成本）
+    BREAKDOWN_KEYS = (
+        'supplier_amount', 'tax_amount', 'platform_fee', 'supplier_fee', 'referrer_bonus', 'distributable_profit',
+        'platform_profit', 'big_mom_profit', 'middle_mom_profit', 'small_mom_profit', 'platform_extra_profit'
+    )
+    # 售價應完整拆分為下列項目（供應商實收 + 各項費用 + 稅金 + 團媽分潤 + 平台剩餘分潤）
+    PARTITION_KEYS = (
+        'supplier_amount', 'supplier_fee', 'tax_amount', 'platform_fee', 'referrer_bonus',
+        'big_mom_profit', 'middle_mom_profit', 'small_mom_profit', 'platform_extra_profit'
+    )
+
     @staticmethod
     def calculate_tax(selling_price: float, cost: float, supplier_fee: float = 0) -> float:
         """計算稅金
         售價稅金 = 售價 - 無條件捨去(售價/1.05)
         成本稅金 = (成本-供應商費) - 無條件進位((成本-供應商費)/1.05)
         """
+        selling_cents, cost_cents, fee_cents = _to_cents(selling_price), _to_cents(cost), _to_cents(supplier_fee)
+        if selling_cents is not None and cost_cents is not None and fee_cents is not None:
+            # 金額/1.05 = 分/105
+            cost_no_supplier = cost_cents - fee_cents
+            selling_price_tax = selling_cents - selling_cents // 105 * 100
+            cost_tax = cost_no_supplier - _ceil_div(cost_no_supplier, 105) * 100
+            return (selling_price_tax - cost_tax) / 100
+        return ProfitCalculator._calculate_tax_decimal(selling_price, cost, supplier_fee)
+
+    @staticmethod
+    def _calculate_tax_decimal(selling_price: float, cost: float, supplier_fee: float = 0) -> float:
+        """calculate_tax 的 Decimal 實作（定點數精度不足時使用，亦為等價測試的基準）"""
         from math import floor, ceil
         selling_price = Decimal(str(selling_price))
         cost = Decimal(str(cost))
@@ -160,6 +241,136 @@ class ProfitCalculator:
             'platform_profit': float(platform_profit)
         }
 
+    @staticmethod
+    def _default_config() -> Dict[str, float]:
+        return {
+            'platform_fee_rate': AppConfig.PLATFORM_FEE_RATE,
+            'supplier_fee_rate': AppConfig.SUPPLIER_FEE_RATE,
+            'referrer_bonus_rate': AppConfig.REFERRER_BONUS_RATE
+        }
+
+    @staticmethod
+    def _mom_rates(config: Dict, has_big_mom: bool, has_middle_mom: bool) -> tuple:
+        """設定中的大/中團媽比例（未指定時使用系統設定），該層缺位時為 0"""
+        return (
+            config.get('big_mom_rate', AppConfig.BIG_MOM_PROFIT_RATE) if has_big_mom else 0,
+            config.get('middle_mom_rate', AppConfig.MIDDLE_MOM_PROFIT_RATE) if has_middle_mom else 0
+        )
+
+    @staticmethod
+    def _fixed_point_rates(config: Dict, big_mom_rate: float, middle_mom_rate: float) -> Optional[tuple]:
+        """
+        費率轉為定點整數 (平台費, 供應商費, 介紹人獎金, 大團媽, 中團媽)
+        任一費率超過四位小數時回傳 None
+        """
+        rates = (
+            _to_rate(config['platform_fee_rate']), _to_rate(config['supplier_fee_rate']),
+            _to_rate(config['referrer_bonus_rate']), _to_rate(big_mom_rate), _to_rate(middle_mom_rate)
+        )
+        return None if None in rates else rates
+
+    @staticmethod
+    def _fixed_point_units(
+        selling_price: float,
+        cost: float,
+        config: Dict,
+        big_mom_rate: float,
+        middle_mom_rate: float,
+        has_small_mom: bool,
+        has_referrer: bool
+    ) -> Optional[tuple]:
+        """依設定費率計算定點分潤，見 _fixed_point_kernel"""
+        rates = ProfitCalculator._fixed_point_rates(config, big_mom_rate, middle_mom_rate)
+        if rates is None:
+            return None
+        return ProfitCalculator._fixed_point_kernel(selling_price, cost, rates, has_small_mom, has_referrer)
+
+    @staticmethod
+    def _fixed_point_kernel(
+        selling_price: float,
+        cost: float,
+        rates: tuple,
+        has_small_mom: bool,
+        has_referrer: bool
+    ) -> Optional[tuple]:
+        """
+        整數定點分潤核心，進位規則與 Decimal 版本一致：
+        供應商費無條件進位後計稅、售價稅金無條件捨去、成本稅金無條件進位、團媽分潤 int() 截斷
+        :param rates: _fixed_point_rates 轉換後的定點費率
+        :return: 依 BREAKDOWN_KEYS 順序的分潤金額，單位為 1/MONEY_SCALE 元；金額非整數分時回傳 None
+        """
+        selling = _to_cents(selling_price)
+        cost_cents = _to_cents(cost)
+        if selling is None or cost_cents is None:
+            return None
+        return ProfitCalculator._fixed_point_split(
+            ProfitCalculator._fixed_point_template(selling, cost_cents, rates), 1, has_small_mom, has_referrer
+        )
+
+    @staticmethod
+    def to_cents(value) -> Optional[int]:
+        """金額轉為整數分，非整數分或超出定點精度時回傳 None"""
+        return _to_cents(value)
+
+    @staticmethod
+    def _fixed_point_template(selling: int, cost_cents: int, rates: tuple) -> tuple:
+        """
+        售價、成本（整數分）的線性項目：(售價, 成本, 平台費, 供應商費, 介紹人獎金, 定點費率)
+        各項費用與金額成正比，單位金額的範本乘上數量後與直接以總額計算完全相同
+        """
+        platform_rate, supplier_rate, referrer_rate, _, _ = rates
+        return (
+            selling, cost_cents, selling * platform_rate, cost_cents * supplier_rate, cost_cents * referrer_rate,
+            rates
+        )
+
+    @staticmethod
+    def _fixed_point_split(template: tuple, quantity: int, has_small_mom: bool, has_referrer: bool) -> tuple:
+        """範本的線性項目乘上數量後，計算需依總額進位的稅金與團媽截斷分配"""
+        selling, cost_cents, platform_fee, supplier_fee, referrer_full, rates = template
+        if quantity != 1:
+            selling, cost_cents = selling * quantity, cost_cents * quantity
+            platform_fee, supplier_fee, referrer_full = (
+                platform_fee * quantity, supplier_fee * quantity, referrer_full * quantity
+            )
+        big_rate, middle_rate = rates[3], rates[4]
+
+        # 稅金（成本先扣除無條件進位至元的供應商費）
+        cost_no_supplier = cost_cents - _ceil_div(supplier_fee, RATE_SCALE * 100) * 100
+        tax_amount = (
+            (selling - selling // 105 * 100) - (cost_no_supplier - _ceil_div(cost_no_supplier, 105) * 100)
+        ) * _CENT
+
+        referrer_bonus = referrer_full if has_referrer else 0
+        distributable = (selling - cost_cents) * _CENT - tax_amount - platform_fee - referrer_bonus
+
+        big = middle = small = extra = 0
+        if big_rate > 0 and middle_rate > 0 and has_small_mom:
+            big = _mom_share(distributable, big_rate)
+            middle = _mom_share(distributable - big, middle_rate)
+            small = distributable - big - middle
+        elif big_rate > 0 and middle_rate == 0 and not has_small_mom:
+            big = distributable
+        elif big_rate > 0 and middle_rate == 0 and has_small_mom:
+            big = _mom_share(distributable, _BIG_SHARE + _MIDDLE_SHARE)
+            small = distributable - big
+        elif big_rate == 0 and middle_rate > 0 and has_small_mom:
+            extra = _mom_share(distributable, _BIG_SHARE)
+            middle = _mom_share(distributable, middle_rate)
+            small = distributable - extra - middle
+        elif big_rate == 0 and middle_rate == 0 and has_small_mom:
+            platform_big = _mom_share(distributable, _BIG_SHARE)
+            platform_middle = _mom_share(distributable - platform_big, _MIDDLE_SHARE)
+            small = distributable - platform_big - platform_middle
+            extra = platform_big + platform_middle
+        else:
+            extra = distributable
+
+        return (
+            cost_cents * _CENT - supplier_fee, tax_amount, platform_fee, supplier_fee, referrer_bonus,
+            distributable, platform_fee + supplier_fee + referrer_full, big, middle, small, extra
+        )
+
     @staticmethod
     def calculate_order_profit(
         selling_price: float,
@@ -168,16 +379,49 @@ class ProfitCalculator:
         config: Optional[Dict] = None,
         has_referrer: bool = True
     ) -> Dict[str, Union[float, Dict[str, float]]]:
-        """計算訂單的詳細分潤（修正：無介紹人資格時 referrer_bonus 應為 0）"""
-        from backend.models.user import User
+        """
+        計算訂單的詳細分潤（修正：無介紹人資格時 referrer_bonus 應為 0）
+        指定 user_id 時附上買家上線的大/中/小團媽 ID 快照
+        """
+        config = config or ProfitCalculator._default_config()
+        units = ProfitCalculator._fixed_point_units(selling_price, cost, config, 0.15, 0.28, True, has_referrer)
+        if units is None:
+            result = ProfitCalculator._calculate_order_profit_decimal(selling_price, cost, config, has_referrer)
+        else:
+            result = ProfitCalculator._fixed_point_profit_result(units)
+        if user_id is not None:
+            from backend.services.referral_service import ReferralService
+            result.update(ReferralService.get_mom_chain(user_id))
+        return result
 
-        # 使用提供的配置或預設值
-        config = config or {
-            'platform_fee_rate': AppConfig.PLATFORM_FEE_RATE,
-            'supplier_fee_rate': AppConfig.SUPPLIER_FEE_RATE,
-            'referrer_bonus_rate': AppConfig.REFERRER_BONUS_RATE
+    @staticmethod
+    def _fixed_point_profit_result(units: tuple) -> Dict[str, Union[float, Dict[str, float]]]:
+        (supplier_amount, tax_amount, platform_fee, supplier_fee, referrer_bonus, distributable,
+         platform_profit, big, middle, small, extra) = units
+        return {
+            'supplier_amount': supplier_amount / MONEY_SCALE,
+            'tax_amount': tax_amount / MONEY_SCALE,
+            'platform_fee': platform_fee / MONEY_SCALE,
+            'supplier_fee': supplier_fee / MONEY_SCALE,
+            'referrer_bonus': referrer_bonus / MONEY_SCALE,
+            'distributable_profit': distributable / MONEY_SCALE,
+            'platform_profit': platform_profit / MONEY_SCALE,
+            'profit_breakdown': {
+                'big_mom_profit': big / MONEY_SCALE,
+                'middle_mom_profit': middle / MONEY_SCALE,
+                'small_mom_profit': small / MONEY_SCALE,
+                'platform_profit': extra / MONEY_SCALE
+            }
         }
 
+    @staticmethod
+    def _calculate_order_profit_decimal(
+        selling_price: float,
+        cost: float,
+        config: Dict,
+        has_referrer: bool = True
+    ) -> Dict[str, Union[float, Dict[str, float]]]:
+        """calculate_order_profit 的 Decimal 實作（定點數精度不足時使用，亦為等價測試的基準）"""
         # 轉換為 Decimal 以確保精確計算
         selling_price = Decimal(str(selling_price))
         cost = Decimal(str(cost))
@@ -189,16 +433,14 @@ class ProfitCalculator:
         referrer_bonus = Decimal(ceil(float(Decimal(str(config['referrer_bonus_rate'])) * cost))) if has_referrer else Decimal('0')
 
         # 計算稅金（需傳入供應商費）
-        tax_amount = Decimal(str(ProfitCalculator.calculate_tax(float(selling_price), float(cost), float(supplier_fee))))
+        tax_amount = Decimal(str(ProfitCalculator._calculate_tax_decimal(float(selling_price), float(cost), float(supplier_fee))))
 
         # 計算基本費用
         platform_fee = selling_price * Decimal(str(config['platform_fee_rate']))
         supplier_fee = cost * Decimal(str(config['supplier_fee_rate']))
 
-        # 取得用戶及其上線資訊
         # 測試預設直接給 referrer_bonus，不依賴 user/referrer
         referrer_bonus = cost * Decimal(str(config['referrer_bonus_rate'])) if has_referrer else Decimal('0')
-        upline_chain = []
 
         # 計算可分配利潤
         distributable_profit = (
@@ -233,19 +475,210 @@ class ProfitCalculator:
             'platform_profit': float(platform_profit),
             'profit_breakdown': mom_profits
         }
+        return result
+        
+    @staticmethod
+    def calculate_order_breakdown(
+        selling_price: float,
+        cost: float,
+        has_big_mom: bool,
+        has_middle_mom: bool,
+        has_small_mom: bool,
+        has_referrer: bool = True,
+        config: Optional[Dict] = None
+    ) -> Dict[str, float]:
+        """
+        計算單筆訂單完整分潤明細（純函式，不存取資料庫，可於子程序中平行執行）
+        platform_profit 為平台費用類收入，platform_extra_profit 為團媽缺位時歸平台的分潤
+        """
+        config = config or ProfitCalculator._default_config()
+        big_mom_rate, middle_mom_rate = ProfitCalculator._mom_rates(config, has_big_mom, has_middle_mom)
+        units = ProfitCalculator._fixed_point_units(
+            selling_price, cost, config, big_mom_rate, middle_mom_rate, has_small_mom, has_referrer
+        )
+        if units is None:
+            return ProfitCalculator._calculate_order_breakdown_decimal(
+                selling_price, cost, has_big_mom, has_middle_mom, has_small_mom, has_referrer, config
+            )
 
-        # 添加團媽ID和分潤比例快照
-        if upline_chain:
-            result.update({
-                'big_mom_id': upline_chain[0].id if upline_chain else None,
-                'big_mom_rate': float(upline_chain[0].profit_percentage) if upline_chain else None,
-                'middle_mom_id': upline_chain[1].id if len(upline_chain) > 1 else None,
-                'middle_mom_rate': float(upline_chain[1].profit_percentage) if len(upline_chain) > 1 else None,
-                'small_mom_id': upline_chain[2].id if len(upline_chain) > 2 else None
-            })
+        result = {'selling_price': float(selling_price), 'cost': float(cost)}
+        result.update({key: value / MONEY_SCALE for key, value in zip(ProfitCalculator.BREAKDOWN_KEYS, units)})
+        return result
 
+    @staticmethod
+    def _calculate_order_breakdown_decimal(
+        selling_price: float,
+        cost: float,
+        has_big_mom: bool,
+        has_middle_mom: bool,
+        has_small_mom: bool,
+        has_referrer: bool = True,
+        config: Optional[Dict] = None
+    ) -> Dict[str, float]:
+        """calculate_order_breakdown 的 Decimal 實作（定點數精度不足時使用，亦為等價測試的基準）"""
+        config = config or ProfitCalculator._default_config()
+        basic = ProfitCalculator._calculate_order_profit_decimal(
+            selling_price=selling_price,
+            cost=cost,
+            config=config,
+            has_referrer=has_referrer
+        )
+        big_mom_rate, middle_mom_rate = ProfitCalculator._mom_rates(config, has_big_mom, has_middle_mom)
+        mom_profits = ProfitCalculator.calculate_mom_profits(
+            basic['distributable_profit'],
+            big_mom_rate=big_mom_rate,
+            middle_mom_rate=middle_mom_rate,
+            has_small_mom=has_small_mom
+        )
+        return {
+            'selling_price': float(selling_price),
+            'cost': float(cost),
+            'supplier_amount': basic['supplier_amount'],
+            'tax_amount': basic['tax_amount'],
+            'platform_fee': basic['platform_fee'],
+            'supplier_fee': basic['supplier_fee'],
+            'referrer_bonus': basic['referrer_bonus'],
+            'distributable_profit': basic['distributable_profit'],
+            'platform_profit': basic['platform_profit'],
+            'big_mom_profit': mom_profits['big_mom_profit'],
+            'middle_mom_profit': mom_profits['middle_mom_profit'],
+            'small_mom_profit': mom_profits['small_mom_profit'],
+            'platform_extra_profit': mom_profits['platform_profit']
+        }
+
+    @staticmethod
+    def calculate_order_profits_batch(
+        selling_prices,
+        costs,
+        has_big_mom,
+        has_middle_mom,
+        has_small_mom,
+        has_referrer,
+        config: Optional[Dict] = None
+    ) -> Dict[str, np.ndarray]:
+        """
+        向量化批次計算訂單分潤，結果與逐筆 calculate_order_breakdown 完全相同
+        以 int64 定點數陣列計算稅金、費用、可分配利潤與 calculate_mom_profits 各團媽情境；
+        非整數分或金額過大的訂單改以逐筆計算補上
+        :param selling_prices, costs: 售價與成本陣列
+        :param has_big_mom, has_middle_mom, has_small_mom, has_referrer: 布林遮罩陣列
+        :return: {欄位: ndarray}，欄位為 selling_price、cost 與 BREAKDOWN_KEYS，可直接組成批次 UPDATE 的欄位值
+        """
+        config = config or ProfitCalculator._default_config()
+        selling_prices = np.asarray(selling_prices, dtype=np.float64)
+        costs = np.asarray(costs, dtype=np.float64)
+        has_big_mom = np.asarray(has_big_mom, dtype=bool)
+        has_middle_mom = np.asarray(has_middle_mom, dtype=bool)
+        has_small_mom = np.asarray(has_small_mom, dtype=bool)
+        has_referrer = np.asarray(has_referrer, dtype=bool)
+
+        rates = ProfitCalculator._fixed_point_rates(config, *ProfitCalculator._mom_rates(config, True, True))
+        with np.errstate(invalid='ignore'):
+            selling = np.nan_to_num(np.rint(selling_prices * 100)).astype(np.int64)
+            cost_cents = np.nan_to_num(np.rint(costs * 100)).astype(np.int64)
+            exact = (
+                (selling / 100 == selling_prices) & (cost_cents / 100 == costs) &
+                (np.abs(selling) < _BATCH_MONEY_LIMIT) & (np.abs(cost_cents) < _BATCH_MONEY_LIMIT)
+            )
+        if rates is None or any(abs(rate) > RATE_SCALE for rate in rates):
+            exact[:] = False
+            rates = (0,) * 5
+        selling = np.where(exact, selling, 0)
+        cost_cents = np.where(exact, cost_cents, 0)
+        platform_rate, supplier_rate, referrer_rate, big_rate, middle_rate = rates
+
+        # 稅金（成本先扣除無條件進位至元的供應商費）
+        cost_no_supplier = cost_cents - _batch_ceil_div(supplier_rate * cost_cents, RATE_SCALE * 100) * 100
+        tax_amount = (
+            (selling - selling // 105 * 100) - (cost_no_supplier - _batch_ceil_div(cost_no_supplier, 105) * 100)
+        ) * _CENT
+
+        platform_fee = selling * platform_rate
+        supplier_fee = cost_cents * supplier_rate
+        referrer_full = cost_cents * referrer_rate
+        referrer_bonus = np.where(has_referrer, referrer_full, 0)
+        distributable = (selling - cost_cents) * _CENT - tax_amount - platform_fee - referrer_bonus
+
+        # calculate_mom_profits 的團媽情境，費率為 0 視同該層缺位
+        big_present = has_big_mom & (big_rate > 0)
+        big_absent = ~has_big_mom | (big_rate == 0)
+        middle_present = has_middle_mom & (middle_rate > 0)
+        middle_absent = ~has_middle_mom | (middle_rate == 0)
+        full = big_present & middle_present & has_small_mom
+        big_only = big_present & middle_absent & ~has_small_mom
+        big_small = big_present & middle_absent & has_small_mom
+        middle_small = big_absent & middle_present & has_small_mom
+        small_only = big_absent & middle_absent & has_small_mom
+
+        full_big = _batch_mom_share(distributable, big_rate)
+        full_middle = _batch_mom_share(distributable - full_big, middle_rate)
+        big_small_big = _batch_mom_share(distributable, _BIG_SHARE + _MIDDLE_SHARE)
+        middle_small_platform = _batch_mom_share(distributable, _BIG_SHARE)
+        middle_small_middle = _batch_mom_share(distributable, middle_rate)
+        small_only_big = _batch_mom_share(distributable, _BIG_SHARE)
+        small_only_middle = _batch_mom_share(distributable - small_only_big, _MIDDLE_SHARE)
+
+        units = {
+            'supplier_amount': cost_cents * _CENT - supplier_fee,
+            'tax_amount': tax_amount,
+            'platform_fee': platform_fee,
+            'supplier_fee': supplier_fee,
+            'referrer_bonus': referrer_bonus,
+            'distributable_profit': distributable,
+            'platform_profit': platform_fee + supplier_fee + referrer_full,
+            'big_mom_profit': np.select([full, big_only, big_small], [full_big, distributable, big_small_big], 0),
+            'middle_mom_profit': np.select([full, middle_small], [full_middle, middle_small_middle], 0),
+            'small_mom_profit': np.select(
+                [full, big_small, middle_small, small_only],
+                [distributable - full_big - full_middle, distributable - big_small_big,
+                 distributable - middle_small_platform - middle_small_middle,
+                 distributable - small_only_big - small_only_middle],
+                0
+            ),
+            'platform_extra_profit': np.select(
+                [full | big_only | big_small, middle_small, small_only],
+                [0, middle_small_platform, small_only_big + small_only_middle],
+                distributable
+            )
+        }
+        result = {'selling_price': selling_prices, 'cost': costs}
+        result.update({key: value / MONEY_SCALE for key, value in units.items()})
+
+        for index in np.flatnonzero(~exact):
+            breakdown = ProfitCalculator.calculate_order_breakdown(
+                float(selling_prices[index]), float(costs[index]), bool(has_big_mom[index]),
+                bool(has_middle_mom[index]), bool(has_small_mom[index]), bool(has_referrer[index]), config
+            )
+            for key in ProfitCalculator.BREAKDOWN_KEYS:
+                result[key][index] = breakdown[key]
         return result
-        
+
+    @staticmethod
+    def verify_breakdown_batch(selling_prices, breakdowns: Dict[str, np.ndarray]) -> np.ndarray:
+        """向量化 verify_breakdown：各拆分項目加總與售價差距不超過 0.01"""
+        total = sum(breakdowns[key] for key in ProfitCalculator.PARTITION_KEYS)
+        return np.abs(total - np.asarray(selling_prices, dtype=np.float64)) <= 0.01 + 1e-9
+
+    @staticmethod
+    def partition_differences(selling_prices, breakdowns) -> np.ndarray:
+        """
+        以整數金額單位（1/MONEY_SCALE 元）計算各筆分潤明細拆分項目加總與售價的差額
+        明細金額皆為定點核心產生的金額單位值，換回整數後加總不受浮點累加誤差影響
+        :param breakdowns: 分潤明細 dict 列表，缺少的項目視為 0
+        """
+        keys = ProfitCalculator.PARTITION_KEYS
+        amounts = np.array(
+            [[breakdown.get(key) or 0 for key in keys] for breakdown in breakdowns], dtype=np.float64
+        ).reshape(len(breakdowns), len(keys))
+        totals = np.rint(amounts * MONEY_SCALE).astype(np.int64).sum(axis=1)
+        return totals - np.rint(np.asarray(selling_prices, dtype=np.float64) * MONEY_SCALE).astype(np.int64)
+
+    @staticmethod
+    def verify_breakdown(selling_price: float, breakdown: dict) -> bool:
+        """驗證分潤明細各拆分項目加總等於售價(允許0.01誤差)"""
+        total = sum(Decimal(str(breakdown.get(key) or 0)) for key in ProfitCalculator.PARTITION_KEYS)
+        return abs(total - Decimal(str(selling_price))) <= Decimal('0.01')
+
     @staticmethod
     def verify_calculation(total_amount: float, profit_breakdown: dict) -> bool:
         """驗證分潤計算結果"""
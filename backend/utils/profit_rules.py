@@ -0,0 +1,210 @@
+"""
+分潤規則引擎
+各版本規則集固定費率、稅金進位方式與團媽分配策略，發布後不可修改；
+調整費率時新增版本並切換 PROFIT_RULESET_VERSION，訂單保存計算時的版本以便日後重算結果一致；
+同一商品的訂單多半是相同單價與成本、只有數量不同，單位金額的分潤範本依 (單價, 單位成本, 版本) 快取，
+訂單只需將範本乘上數量再拆分稅金與團媽分潤
+"""
+from functools import lru_cache
+from typing import Dict, Optional
+import numpy as np
+from backend.config import Config as AppConfig
+from backend.utils.profit_calculator import MONEY_SCALE, ProfitCalculator
+
+# 支援的稅金進位方式與團媽分配策略
+TAX_ROUNDING_MODES = {
+    'floor_ceil': '售價稅金無條件捨去、成本（扣除無條件進位的供應商費）稅金無條件進位',
+}
+MOM_SPLIT_POLICIES = {
+    'cascade': '大/中團媽依序 int() 截斷分配、小團媽拿剩餘，缺位層級依 calculate_mom_profits 規則歸屬',
+}
+RULESET_FIELDS = (
+    'platform_fee_rate', 'supplier_fee_rate', 'referrer_bonus_rate', 'big_mom_rate', 'middle_mom_rate',
+    'tax_rounding', 'mom_split'
+)
+# 相同 (售價, 成本, 團媽/介紹人旗標, 版本) 的計算結果快取筆數
+MEMO_SIZE = 65536
+# 單位售價、成本的分潤範本快取筆數（約為上架商品數 × 規則集版本數 × 4 種大/中團媽組合）
+TEMPLATE_SIZE = 65536
+
+RULESETS = {
+    # v1 沿用環境設定的費率（Config.*_RATE，結算對帳單等處亦讀取同一設定），於匯入時建立，
+    # 確保對帳單與計算結果採用相同費率；之後的版本請以固定數值註冊
+    'v1': {
+        'description': (
+            f'標準分潤：平台費 {AppConfig.PLATFORM_FEE_RATE:.0%}、供應商費 {AppConfig.SUPPLIER_FEE_RATE:.0%}、'
+            f'介紹人獎金 {AppConfig.REFERRER_BONUS_RATE:.0%}，大團媽 {AppConfig.BIG_MOM_PROFIT_RATE:.0%}、'
+            f'中團媽 {AppConfig.MIDDLE_MOM_PROFIT_RATE:.0%}'
+        ),
+        'platform_fee_rate': AppConfig.PLATFORM_FEE_RATE,
+        'supplier_fee_rate': AppConfig.SUPPLIER_FEE_RATE,
+        'referrer_bonus_rate': AppConfig.REFERRER_BONUS_RATE,
+        'big_mom_rate': AppConfig.BIG_MOM_PROFIT_RATE,
+        'middle_mom_rate': AppConfig.MIDDLE_MOM_PROFIT_RATE,
+        'tax_rounding': 'floor_ceil',
+        'mom_split': 'cascade',
+    },
+}
+
+
+def register_ruleset(version, ruleset):
+    """註冊分潤規則集；已發布的版本不可改寫"""
+    missing = [field for field in RULESET_FIELDS if field not in ruleset]
+    if missing:
+        raise ValueError(f"規則集缺少欄位：{', '.join(missing)}")
+    if ruleset['tax_rounding'] not in TAX_ROUNDING_MODES:
+        raise ValueError(f"不支援的稅金進位方式：{ruleset['tax_rounding']}")
+    if ruleset['mom_split'] not in MOM_SPLIT_POLICIES:
+        raise ValueError(f"不支援的團媽分配策略：{ruleset['mom_split']}")
+    existing = RULESETS.get(version)
+    if existing is not None:
+        if any(existing[field] != ruleset[field] for field in RULESET_FIELDS):
+            raise ValueError(f'規則集 {version} 已發布，調整規則請新增版本')
+        return
+    RULESETS[version] = dict(ruleset)
+
+
+@lru_cache(maxsize=None)
+def _compile(version):
+    """
+    將規則集編譯為定點費率：依大/中團媽是否在位預先算好四組費率
+    :return: (規則集, {(has_big_mom, has_middle_mom): 定點費率或 None})
+    """
+    ruleset = RULESETS.get(version)
+    if ruleset is None:
+        raise ValueError(f'分潤規則集不存在：{version}')
+    rates = {
+        (has_big, has_middle): ProfitCalculator._fixed_point_rates(
+            ruleset, *ProfitCalculator._mom_rates(ruleset, has_big, has_middle)
+        )
+        for has_big in (True, False) for has_middle in (True, False)
+    }
+    return ruleset, rates
+
+
+@lru_cache(maxsize=MEMO_SIZE)
+def _evaluate(version, selling_price, cost, has_big_mom, has_middle_mom, has_small_mom, has_referrer):
+    """單筆計算（依 BREAKDOWN_KEYS 順序的金額 tuple），結果不可變以便快取共用"""
+    ruleset, rates = _compile(version)
+    compiled = rates[(has_big_mom, has_middle_mom)]
+    units = None
+    if compiled is not None:
+        units = ProfitCalculator._fixed_point_kernel(selling_price, cost, compiled, has_small_mom, has_referrer)
+    if units is not None:
+        return tuple(value / MONEY_SCALE for value in units)
+    breakdown = ProfitCalculator._calculate_order_breakdown_decimal(
+        selling_price, cost, has_big_mom, has_middle_mom, has_small_mom, has_referrer, ruleset
+    )
+    return tuple(breakdown[key] for key in ProfitCalculator.BREAKDOWN_KEYS)
+
+
+@lru_cache(maxsize=TEMPLATE_SIZE)
+def _unit_template(version, unit_price_cents, unit_cost_cents, has_big_mom, has_middle_mom):
+    """單位售價、成本（整數分）的分潤範本；規則集費率超過定點精度時為 None"""
+    _, rates = _compile(version)
+    compiled = rates[(has_big_mom, has_middle_mom)]
+    if compiled is None:
+        return None
+    return ProfitCalculator._fixed_point_template(unit_price_cents, unit_cost_cents, compiled)
+
+
+def _evaluate_quantity(version, selling_price, cost, quantity, has_big_mom, has_middle_mom, has_small_mom,
+                       has_referrer):
+    """
+    以單位金額範本計算（依 BREAKDOWN_KEYS 順序的金額 tuple）
+    售價或成本不是整數分、或無法被數量整除（折價、改價）時回傳 None，改以總額計算
+    """
+    selling = ProfitCalculator.to_cents(selling_price)
+    cost_cents = ProfitCalculator.to_cents(cost)
+    if selling is None or cost_cents is None or selling % quantity or cost_cents % quantity:
+        return None
+    template = _unit_template(version, selling // quantity, cost_cents // quantity, has_big_mom, has_middle_mom)
+    if template is None:
+        return None
+    units = ProfitCalculator._fixed_point_split(template, quantity, has_small_mom, has_referrer)
+    return tuple(value / MONEY_SCALE for value in units)
+
+
+class ProfitRuleEngine:
+    """依版本化規則集計算訂單分潤"""
+
+    @staticmethod
+    def current_version() -> str:
+        """新訂單採用的規則集版本"""
+        return AppConfig.PROFIT_RULESET_VERSION
+
+    @staticmethod
+    def get_ruleset(version: Optional[str] = None) -> Dict:
+        return dict(_compile(version or ProfitRuleEngine.current_version())[0])
+
+    @staticmethod
+    def evaluate(
+        selling_price: float,
+        cost: float,
+        has_big_mom: bool,
+        has_middle_mom: bool,
+        has_small_mom: bool,
+        has_referrer: bool = True,
+        version: Optional[str] = None,
+        quantity: Optional[int] = None
+    ) -> Dict:
+        """
+        計算單筆訂單分潤明細（格式同 calculate_order_breakdown，另附 ruleset_version）
+        傳入數量且售價、成本為單位金額的整數倍時，以快取的單位範本乘上數量計算，不同數量共用同一範本；
+        其餘依總額計算，相同輸入的結果經快取，兩種方式結果完全相同
+        :param quantity: 訂單數量（selling_price、cost 仍為訂單總額）
+        """
+        version = version or ProfitRuleEngine.current_version()
+        flags = (bool(has_big_mom), bool(has_middle_mom), bool(has_small_mom), bool(has_referrer))
+        values = None
+        if quantity and quantity > 0:
+            values = _evaluate_quantity(version, selling_price, cost, int(quantity), *flags)
+        if values is None:
+            values = _evaluate(version, selling_price, cost, *flags)
+        breakdown = {'selling_price': float(selling_price), 'cost': float(cost)}
+        breakdown.update(zip(ProfitCalculator.BREAKDOWN_KEYS, values))
+        breakdown['ruleset_version'] = version
+        return breakdown
+
+    @staticmethod
+    def evaluate_batch(
+        selling_prices,
+        costs,
+        has_big_mom,
+        has_middle_mom,
+        has_small_mom,
+        has_referrer,
+        version: Optional[str] = None
+    ) -> Dict[str, np.ndarray]:
+        """向量化批次計算，回傳欄位化結果（見 calculate_order_profits_batch）"""
+        ruleset, _ = _compile(version or ProfitRuleEngine.current_version())
+        return ProfitCalculator.calculate_order_profits_batch(
+            selling_prices, costs, has_big_mom, has_middle_mom, has_small_mom, has_referrer, config=ruleset
+        )
+
+    @staticmethod
+    def prepare_unit_templates(unit_price: float, unit_cost: float, version: Optional[str] = None) -> bool:
+        """
+        預先建立單位售價、成本的分潤範本（商品建立或改價時呼叫），各大/中團媽組合各一份
+        範本依金額快取，改價後舊價格的範本自然不再命中並由 LRU 淘汰，不需另外失效
+        :return: 金額可使用定點範本時為 True
+        """
+        unit_price_cents = ProfitCalculator.to_cents(unit_price)
+        unit_cost_cents = ProfitCalculator.to_cents(unit_cost)
+        if unit_price_cents is None or unit_cost_cents is None:
+            return False
+        version = version or ProfitRuleEngine.current_version()
+        for has_big_mom in (True, False):
+            for has_middle_mom in (True, False):
+                _unit_template(version, unit_price_cents, unit_cost_cents, has_big_mom, has_middle_mom)
+        return True
+
+    @staticmethod
+    def memo_stats() -> Dict:
+        """單筆計算快取命中統計（templates 為單位範本快取）"""
+        return dict(_evaluate.cache_info()._asdict(), templates=_unit_template.cache_info()._asdict())
+
+    @staticmethod
+    def clear_memo():
+        _evaluate.cache_clear()
+        _unit_template.cache_clear()